@@ -9,6 +9,8 @@ from one import
 """
 from .tmpl_support import *
 from .tmpl_storage import *
+from .tmpl_results import *
 from .tmpl_core import *
+from .tmpl_parallel import *
 # from .example_test_setup import *
 from .examples import *
@@ -63,10 +63,15 @@ Run measurement without specifiying conditions
 # Standard library
 import os, time
 import datetime
+import json
 import abc
 import traceback
 import itertools
 import copy
+import threading
+import contextlib
+import concurrent.futures
+import asyncio
 import inspect
 
 #from collections import OrderedDict
@@ -77,8 +82,10 @@ import pandas as pd
 import xarray as xr
 
 
-from .tmpl_support import ObjDict,debugPrintout
-from .tmpl_storage import json_to_dataset
+from .tmpl_support import ObjDict,RunningOrderStep,ConditionsTable,debugPrintout
+from .tmpl_storage import file_to_dataset,split_by_class_type,ResultsSink
+from .tmpl_results import (ColumnarResults,match_data_shape,sorted_unique_values,
+                           combine_partial_datasets,TAG_CLASSNAME)
  
 #================================================================
 #%% Constants
@@ -86,9 +93,38 @@ from .tmpl_storage import json_to_dataset
 # Operation type labels for the running order
 OP_MEAS = 'MEASUREMENT'
 OP_COND = 'CONDITION'
+ 
+#================================================================
+#%% Functions
+#================================================================
+def run_coroutine(coro):
+    """
+    Run a coroutine to completion from normal (synchronous) code
+
+    If there is already an event loop running in this thread, e.g. in a
+    Jupyter notebook, the coroutine is run in its own event loop in a 
+    separate thread. In that case it is better to await the coroutine
+    directly.
+
+    Parameters
+    ----------
+    coro : coroutine
+        Coroutine to run
+
+    Returns
+    -------
+    any
+        Result of coroutine
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop running
+        return asyncio.run(coro)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run,coro).result()
 
-# Tags
-TAG_CLASSNAME = 'CLASS_TYPE'
  
 #================================================================
 #%% Decorator Functions
@@ -102,15 +138,15 @@ def test_time(func):
     def myfunction(self)
 
     It will time how long the function takes and display it.
+    Also works on async methods.
     """                                                                                                   
-                                                                                                                          
-    def wrapper(self,*arg,**kwargs):                                                                                                      
-        t = time.time()            
+
+    def start(self):
         self.log('<'*40)
         self.log(f'Running {self.name}')
+        return time.time()
 
-        res = func(self,*arg,**kwargs)  
-
+    def stop(self,t):
         self.test_time_s = time.time()-t                                                                                            
         if self.test_time_s < 60:
             self.log(f"{self.name}\tTime taken: %.3f s " % (self.test_time_s))  
@@ -118,7 +154,19 @@ def test_time(func):
             self.log(f"{self.name}\tTime taken: %.3f min " % (self.test_time_s/60))  
         self.log('>'*40)          
         print('') # spacer                                        
-        return res    
+
+    if inspect.iscoroutinefunction(func):
+        async def wrapper(self,*arg,**kwargs):
+            t = start(self)
+            res = await func(self,*arg,**kwargs)  
+            stop(self,t)
+            return res
+    else:
+        def wrapper(self,*arg,**kwargs):                                                                                                      
+            t = start(self)
+            res = func(self,*arg,**kwargs)  
+            stop(self,t)
+            return res    
 
     # Documentation
     wrapper.__name__ = func.__name__
@@ -179,11 +227,19 @@ def with_results(coords=[],data_vars=[]):
             if not hasattr(self,'ds_results'):
                 raise ValueError('This object has no "ds_results" property')      
 
-            if self.ds_results is None:
+            # Columnar results can be checked without building the Dataset
+            store = getattr(self,'_results_store',None)
+            if store is not None:
+                coord_names = store.coord_names
+                data_var_names = store.data_vars
+            elif self.ds_results is None:
                 raise ValueError('No results to process')
+            else:
+                coord_names = self.ds_results.coords
+                data_var_names = self.ds_results
 
-            missing_coords = [c for c in coords if c not in self.ds_results.coords]
-            missing_data_vars = [d for d in data_vars if d not in self.ds_results]
+            missing_coords = [c for c in coords if c not in coord_names]
+            missing_data_vars = [d for d in data_vars if d not in data_var_names]
 
             if missing_data_vars!=[] or missing_coords!=[]:
                 raise ValueError(f'Results data is missing coordinates {missing_coords} and data variables {missing_data_vars}')
@@ -310,6 +366,56 @@ def with_services(services=[]):
     return decorator
 
 
+def hold_results_lock(func):
+    """
+    Decorator function
+    Holds the object's results lock while the method runs, so results
+    can be stored from a background processing thread at the same time as
+    the measurement sequence runs, see AbstractTestManager 
+    pipeline_processing.
+
+    @hold_results_lock
+    def myfunction(self):
+        ...
+    """
+    def wrapper(self,*arg,**kwargs):
+        with self._results_lock:
+            return func(self,*arg,**kwargs)
+
+    # Documentation
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def read_only_dataset(ds):
+    """
+    Read-only view of a Dataset, the data can't be changed in place. Used
+    for Datasets built from columnar results, where the changes would not
+    be kept.
+
+    Parameters
+    ----------
+    ds : xarray Dataset
+        Dataset
+
+    Returns
+    -------
+    xarray Dataset
+        Shallow copy whose data variables and non-index coordinates are
+        read-only numpy views of the original data
+    """
+    ds = ds.copy(deep=False)
+    for var in ds.variables.values():
+        if isinstance(var,xr.IndexVariable) or not isinstance(var.data,np.ndarray):
+            continue
+        data = var.data.view()
+        data.flags.writeable = False
+        var.data = data
+
+    return ds
+
+
 #================================================================
 #%% Common utility class
 #================================================================
@@ -334,6 +440,42 @@ class CommonUtility():
     # Offline mode
     offline_mode = False
     """Flag that sets if the object is to be used offline, i.e. no hardware """
+
+    # Asyncio
+    is_async = False
+    """Flag that is set by classes that need to be run in an asyncio
+    event loop, see AbstractAsyncMeasurement """
+
+    # Columnar results
+    columnar_results = False
+    """Flag that sets if results are recorded in a ColumnarResults store
+    and only converted to a Dataset when ds_results is read """
+
+    # Internal results storage, accessed through ds_results property
+    _ds_results = None
+    _results_store = None
+
+    # Dataset built from the columnar results store, the Dataset it was
+    # copied from, the results version it was built at and its variables,
+    # see check_results_view()
+    _results_view = None
+    _results_view_source = None
+    _results_view_version = None
+    _results_view_variables = None
+
+    # Results version counters
+    # - version is incremented every time results are stored
+    # - generation is incremented every time ds_results is replaced
+    _results_version = 0
+    _results_generation = 0
+
+    # Cache of coordinate value->position maps, see coord_position()
+    _coord_position_maps = None
+
+    # Lock held while storing results, see hold_results_lock()
+    # - classes that store results from more than one thread replace this
+    #   with a threading.RLock
+    _results_lock = contextlib.nullcontext()
     
 
 
@@ -413,12 +555,249 @@ class CommonUtility():
     # data into ds_results without having to get too involved with the
     # xarray data set manipulation.
 
+    @property
+    def ds_results(self):
+        """
+        Results Dataset
+
+        If columnar_results is set then the Dataset is built from the
+        results store when this property is read after results have been
+        stored. Changing it, e.g. ds_results['x'] = ... or writing values
+        in place, switches the object back to Dataset results, see
+        check_results_view().
+
+        Returns
+        -------
+        xarray Dataset or None
+            Results, None if there are no results
+        """
+        self.check_results_view()
+
+        if self._results_store is not None:
+            if self._results_view is None or self._results_view_version!=self._results_version:
+                source = self._results_store.to_dataset()
+                if source is None:
+                    return None
+                ds = source.copy(deep=True)
+                self._results_view = ds
+                self._results_view_source = source
+                self._results_view_version = self._results_version
+                self._results_view_variables = dict(ds.variables)
+            return self._results_view
+
+        return self._ds_results
+
+    @ds_results.setter
+    def ds_results(self,ds):
+        # Assigning a Dataset replaces any columnar results
+        self._results_store = None
+        self._results_view = None
+        self._results_view_source = None
+        self._ds_results = ds
+        self._coord_position_maps = None
+        self._results_generation += 1
+        self._results_version += 1
+
+
+    def update_results(self,ds=None):
+        """
+        Replace ds_results with an updated copy of itself e.g. after
+        merging in new coordinates, or tell the test manager that values
+        of ds_results have been written in place.
+
+        Unlike assigning to ds_results this only increments the results
+        version, so a test manager can merge in the update incrementally.
+
+        Parameters
+        ----------
+        ds : xarray Dataset, optional
+            Updated results, by default None which keeps the current
+            ds_results
+        """
+        if ds is not None:
+            self._ds_results = ds
+        self._results_version += 1
+
+
+    @property
+    def results_version(self):
+        """
+        Version of results, changes whenever results are stored
+
+        Changes made directly to the ds_results Dataset, e.g. 
+        ds_results['x'] = ..., don't increment the version, so the 
+        identity of the Dataset and each of its variables is included.
+        Values written in place, e.g. ds_results['x'].values[0] = ..., 
+        don't change either, call update_results() after writing them.
+
+        Returns
+        -------
+        tuple
+            (generation, version, variables) generation changes whenever 
+            ds_results is replaced, version changes whenever anything is 
+            stored and variables changes when variables of the Dataset are
+            added, replaced or removed.
+        """
+        self.check_results_view()
+
+        variables = None
+        if self._results_store is None and self._ds_results is not None:
+            variables = (id(self._ds_results),tuple([(name,id(var)) for name,var in self._ds_results.variables.items()]))
+
+        return (self._results_generation,self._results_version,variables)
+
+
+    def check_results_view(self,storing=False):
+        """
+        Switch from columnar results to Dataset results if the Dataset 
+        returned by ds_results has been changed, e.g. by 
+        self.ds_results['x'] = ... or 
+        self.ds_results['x'].values[0] = ... in a subclass. 
+        
+        The changed Dataset becomes ds_results, so nothing is lost and 
+        later results are stored in the Dataset as if columnar_results was
+        not set.
+
+        Checking for values written in place compares the Dataset with the
+        results store, so it takes as long as building the Dataset.
+
+        Parameters
+        ----------
+        storing : bool, optional
+            Results are about to be stored, by default False. The Dataset
+            is out of date after that, so it is checked one last time and
+            then dropped. Changes made to it later are not kept.
+        """
+        ds = self._results_view
+        if ds is None or self._results_store is None:
+            return
+
+        if self.results_view_changed():
+            self.ds_results = ds
+            return
+
+        if storing:
+            self._results_view = None
+            self._results_view_source = None
+
+
+    def results_view_changed(self):
+        """
+        Check if the Dataset built from the columnar results store has been
+        changed since ds_results returned it.
+
+        Returns
+        -------
+        bool
+            True if variables have been added, replaced or removed, or 
+            values have been written in place
+        """
+        ds = self._results_view
+        variables = self._results_view_variables
+        if set(ds.variables)!=set(variables):
+            return True
+        if any([var is not variables[name] for name,var in ds.variables.items()]):
+            return True
+
+        source = self._results_view_source
+        return not all([var.equals(source.variables[name]) for name,var in ds.variables.items()])
+
+
+    def get_results_dataset(self):
+        """
+        Results Dataset that can be changed in place. For columnar results
+        this is a new Dataset built from the store, unlike ds_results 
+        which is read-only.
+
+        Returns
+        -------
+        xarray Dataset or None
+        """
+        self.check_results_view()
+
+        if self._results_store is not None:
+            return self._results_store.to_dataset()
+
+        return self._ds_results
+
+
+    def get_results_store(self):
+        """
+        Return the columnar results store, creating it if necessary
+
+        Returns
+        -------
+        ColumnarResults or None
+            Results store if columnar_results is set and results are not
+            already held in a Dataset, otherwise None
+        """
+        self.check_results_view(storing=True)
+
+        if self._results_store is None and self.columnar_results and self._ds_results is None:
+            self._results_store = ColumnarResults(self.__class__.__name__)
+
+        return self._results_store
+
+
+    def coord_position(self,name,value):
+        """
+        Return the position of a value in a coordinate of ds_results
+        Used to write data straight into the underlying numpy arrays
+        instead of doing a label lookup with .loc[] on every store.
+
+        The value->position map for each coordinate is built once and kept
+        until the coordinate changes.
+
+        Parameters
+        ----------
+        name : str
+            Name of coordinate
+        value : any
+            Coordinate value to look up
+
+        Returns
+        -------
+        int or None
+            Position of value in the coordinate. None if the value is not
+            found, or the coordinate has no index or repeated values. In
+            that case fall back to a label lookup.
+        """
+        ds = self._ds_results
+        if ds is None or name not in ds.variables:
+            return None
+
+        if self._coord_position_maps is None:
+            self._coord_position_maps = {}
+
+        # Rebuild map if the coordinate has been replaced
+        # - coordinate variables are replaced, not changed in place, when
+        # ds_results is merged or a coordinate is overwritten
+        coord_var = ds.variables[name]
+        coord_var_cached,positions = self._coord_position_maps.get(name,(None,None))
+        if coord_var_cached is not coord_var:
+            positions = None
+            index = ds.indexes[name] if name in ds.indexes else None
+            if index is not None and index.is_unique:
+                positions = {v:i for i,v in enumerate(index)}
+            self._coord_position_maps[name] = (coord_var,positions)
+
+        if positions is None:
+            return None
+
+        try:
+            return positions.get(value,None)
+        except TypeError:
+            # unhashable value
+            return None
+
+
     def clear_results(self):
         """
         Reset all ds_results properties
         """
         self.ds_results = None
 
+    @hold_results_lock
     def set_conditions(self,conditions):
         """
         Add conditions into ds_results Dataset
@@ -450,6 +829,22 @@ class CommonUtility():
         if not_single_value!=[]:
             raise ValueError(f'Conditions must be single values. These conditions have multiple values [{not_single_value}]')
 
+        # Columnar results
+        store = self.get_results_store()
+        if store is not None:
+            store.set_conditions(conditions)
+            self._results_version += 1
+            return
+
+        # Check for existing conditions
+        # ==============================
+        # If every condition value is already a coordinate value, e.g. the
+        # grid was allocated by allocate_conditions(), then there is
+        # nothing to merge
+        if self.ds_results is not None:
+            if all([self.coord_position(name,value) is not None for name,value in conditions.items()]):
+                return
+
         # Add conditions to Dataset
         # ==============================
         # Initialise dataset for these conditions
@@ -461,14 +856,60 @@ class CommonUtility():
 
         # If no data make this ds_results
         if self.ds_results is None:
-            self.ds_results = ds_new
+            self.update_results(ds_new)
             return
 
         # If existing data, merge new dataset into existing
         # - this will increase the size of data variable dimensions
         # and pad with NaNs
-        self.ds_results = xr.merge([self.ds_results,ds_new])
-        
+        self.update_results(xr.merge([self.ds_results,ds_new]))
+
+
+    @hold_results_lock
+    def allocate_conditions(self,conditions):
+        """
+        Allocate the coordinates for a full grid of conditions in ds_results
+        This is used before a test sequence is run so that set_conditions()
+        does not have to merge each new condition into ds_results. Data
+        variables created by store_data_var() are then allocated across the
+        whole grid and written in place.
+
+        Parameters
+        ----------
+        conditions : dict like
+            Dictionary of condition values. The key is the name of the
+            condition and the value is a list of all the values that the
+            condition will take. Repeated values are allowed.
+            e.g. conditions = {'temperature_degC':[25,25,35],'humidity_pc':[50,60,50]}
+        """
+
+        # Columnar results
+        # - register values in the order they will be set
+        store = self.get_results_store()
+        if store is not None:
+            for name,values in conditions.items():
+                for value in values:
+                    store.set_conditions({name:value})
+            self._results_version += 1
+            return
+
+        # Initialise dataset with all conditions
+        # ========================================
+        ds_new = xr.Dataset()
+
+        for name,values in conditions.items():
+            # Unique values, sorted if possible to match the order that
+            # xr.merge() would have given them
+            ds_new.coords[name] = sorted_unique_values(values)
+
+        # If no data make this ds_results
+        if self.ds_results is None:
+            self.update_results(ds_new)
+            return
+
+        # Merge with any existing data
+        self.update_results(xr.merge([self.ds_results,ds_new]))
+
 
 
     def store_data_var(self,name,data_values,coords=[]):
@@ -505,10 +946,50 @@ class CommonUtility():
         
         """
 
+        self.store_data_vars({name:data_values},coords=coords)
+
+
+    @hold_results_lock
+    def store_data_vars(self,data,coords=[]):
+        """
+        Store several data variables that share the same coordinates into
+        self.ds_results in one go.
+        Creates new data variables or overwrites existing data. All the 
+        current conditions are added to the coordinates.
+
+        The coordinates are resolved and checked once for the whole batch,
+        which is quicker than calling store_data_var() for each variable.
+        All the data is checked before any of it is stored.
+
+        Example
+        -------
+
+        >>> self.store_data_vars({'current_A':current,'voltage_diff_V':voltage},
+                                 coords=['swp_voltage'])
+
+        Parameters
+        ----------
+        data : dict
+            Dictionary of data to be stored
+            key: Name of data variable. No spaces, ascii only
+            value: list or array of data. The dimensions of the array need
+            to be consistent with the coordinates being requested.
+
+        coords : list or dict, optional
+            Coordinates for all the data variables, see store_data_var()
+            by default []
+
+        Raises
+        ------
+        ValueError
+            If there are no coordinates, unknown coordinates or data with
+            the wrong shape
+        """
+
         # Input validation
         # ==============================
-        # Convert data to array
-        data_values = np.atleast_1d(data_values)
+        # Convert data to arrays
+        data = {name:np.atleast_1d(values) for name,values in data.items()}
 
         # Convert coords to dict
         if coords==[]:
@@ -518,67 +999,83 @@ class CommonUtility():
             coords = {k:None for k in coords}
 
         # Combine coordinates
-        coordinates = copy.deepcopy(self.current_conditions)
+        # - conditions are single values so a shallow copy will do
+        coordinates = dict(self.current_conditions)
         coordinates.update(coords)
 
         if len(coordinates)==0:
-            raise ValueError(f'Data variable being added [{name}] has no coordinates. There are no setup conditions active.')
-
-        # Check all coordinates exist
-        missing = [c for c in coordinates if c not in self.ds_results.coords]
-        if missing!=[]:
-            raise ValueError(f'Trying to add to [{name}] data variable with unknown coordinates {missing}')
+            raise ValueError(f'Data variable being added [{", ".join(data)}] has no coordinates. There are no setup conditions active.')
 
-        # Processing
-        # ==============================
-        if name not in self.ds_results:
-            # Create new data variable
-            # Fill it with NaNs to start
-            filler = np.empty(tuple([self.ds_results.coords[c].size for c in coordinates]))*np.nan
-            self.ds_results[name] = (list(coordinates.keys()),np.atleast_1d(filler))
-            # Tag with the name of the class
-            self.ds_results[name].attrs[TAG_CLASSNAME] = self.__class__.__name__
-            
-        # Check input data has the correct shape
-        filtered_coords = {k:v for k,v in coordinates.items() if v is not None}
-        req_shape = self.ds_results[name].sel(filtered_coords).shape
-
-        # Special case where there is only one element
-        # for some reason the dataset data variable returns a shape of ()
-        # when there is only one value. This will fail the general case
-        # below because the data_values array has a shape of (1,)
-        if req_shape==():
-            if data_values.size!=1:
-                raise ValueError(f'The data array being entered for [{name}] should only have 1 element to satisfy coordinates {coordinates} not [{data_values.shape}]')
-            
-            self.ds_results[name].loc[filtered_coords] = data_values[0]
+        # Columnar results
+        store = self.get_results_store()
+        if store is not None:
+            store.store_data_vars(data,coordinates)
+            self._results_version += 1
             return
 
-        # Special case of 1D vectors
-        # The req_shape will be (N,) whereas the data_values shape will be (N,1) 
-        # or (1,N). In this case we need to squeeze out the extra dimension
-        same_num_elements = np.product(data_values.shape)==np.product(req_shape)
-        different_shapes = data_values.shape!=req_shape
+        ds = self.ds_results
 
-        if same_num_elements and different_shapes:
-            data_values = data_values.squeeze()
+        # Check all coordinates exist
+        missing = [c for c in coordinates if c not in ds.coords]
+        if missing!=[]:
+            raise ValueError(f'Trying to add to [{", ".join(data)}] data variable with unknown coordinates {missing}')
 
-        # Special case of input array dimensions being transposed compared to
-        # the equivalent Dataset dimensions
-        same_shape_when_transposed = data_values.T.shape == req_shape
+        # Find positions of selected coordinate values
+        # ==============================================
+        # If all the values are found then data can be written straight 
+        # into the numpy arrays, otherwise fall back to .loc[]
+        filtered_coords = {k:v for k,v in coordinates.items() if v is not None}
+        positions = {c:self.coord_position(c,v) for c,v in filtered_coords.items()}
+        if None in positions.values():
+            positions = None
 
-        if same_shape_when_transposed:
-            data_values = data_values.T
+        # Check input data has the correct shape
+        # ========================================
+        # The shape only needs to be found once for each set of dimensions
+        # - new data variables will have all the coordinates as dimensions
+        new_dims = tuple(coordinates.keys())
+        req_shapes = {}
+        indexers = {}
+        for name in data:
+            dims = ds.variables[name].dims if name in ds.variables else new_dims
+            if dims not in req_shapes:
+                if positions is not None and all([c in dims for c in positions]):
+                    indexers[dims] = tuple([positions.get(d,slice(None)) for d in dims])
+                    req_shapes[dims] = tuple([ds.sizes[d] for d in dims if d not in positions])
+                elif dims==new_dims:
+                    req_shapes[dims] = tuple([ds.coords[c].size for c,v in coordinates.items() if v is None])
+                else:
+                    req_shapes[dims] = ds[name].sel(filtered_coords).shape
+
+            data[name] = match_data_shape(name,data[name],req_shapes[dims],coordinates)
 
-        # General case
-        # - array has more than one value
-        if data_values.shape!=req_shape:
-            raise ValueError(f'The data array being entered for [{name}/{data_values.shape}] must have a shape [{req_shape}] to satisfy coordinates {coordinates}')
+        # Processing
+        # ==============================
+        # Create any new data variables
+        # - Fill with NaNs to start
+        new_names = [name for name in data if name not in ds]
+        if new_names!=[]:
+            shape = tuple([ds.coords[c].size for c in coordinates])
+            new_vars = {}
+            for name in new_names:
+                new_vars[name] = xr.Variable(list(new_dims),np.full(shape,np.nan),
+                                            attrs={TAG_CLASSNAME:self.__class__.__name__})
+            ds.update(new_vars)
+            self._results_version += 1
 
         # Insert data at selected coordinates
-        self.ds_results[name].loc[filtered_coords] = data_values
+        for name,data_values in data.items():
+            var = ds.variables[name]
+            indexer = indexers.get(var.dims,None)
+            if indexer is not None and isinstance(var.data,np.ndarray) and var.data.flags.writeable:
+                var.data[indexer] = data_values
+            else:
+                ds[name].loc[filtered_coords] = data_values
 
+        self._results_version += 1
 
+
+    @hold_results_lock
     def store_coords(self,name,values):
         """
         Add a new coordinate to self.ds_results or overwrite and existing one
@@ -597,11 +1094,19 @@ class CommonUtility():
         # Convert to array
         values = np.asarray(values)
 
+        # Columnar results
+        store = self.get_results_store()
+        if store is not None:
+            store.store_coords(name,values)
+            self._results_version += 1
+            return
+
         if self.ds_results is None:
-            self.ds_results = xr.Dataset()
+            self.update_results(xr.Dataset())
 
         if name not in self.ds_results:
             self.ds_results.coords[name] = values
+            self._results_version += 1
             return
 
         # TODO : Want to make this more flexible and be able to take extra values
@@ -618,7 +1123,7 @@ class CommonUtility():
     #----------------------------------------------------------------
     #%% Dataset saving/loading
     #----------------------------------------------------------------
-    def save(self,filename,format='json'):
+    def save(self,filename,format='json',compact=False,compression=None):
         """
         Save ds_results dataset
 
@@ -631,22 +1136,46 @@ class CommonUtility():
             Options are:
                 * 'json'
                 * 'excel'   
+                * 'netcdf' : binary netCDF4/HDF5, much smaller and faster
+                  than 'json'. Use a '.nc' or '.h5' extension so load()
+                  can read it.
+                * 'npy' : directory of numpy files, filename is the 
+                  directory. load() can memory map it.
+                * 'parquet' : export to a directory of long format 
+                  Parquet files, one per measurement. Can't be loaded.
+        compact : bool, optional
+            For 'json' format store numeric arrays as base64 encoded 
+            binary instead of text, by default False
+        compression : str, optional
+            Compress the file, by default None. load() finds the codec 
+            from the file.
+                * 'json' : 'gzip', 'lzma' or 'zstd' (needs zstandard)
+                * 'netcdf' : 'gzip'
 
         Raises
         ------
         ValueError
-            If file format is not supported
+            If file format is not supported, or can't be compressed
         """
 
+        if compression is not None and format.lower() not in ['json','netcdf']:
+            raise ValueError(f'Cannot compress files in format [{format}]')
+
         if format.lower()=='json':
-            self.ds_results.save.to_json(filename)
+            self.ds_results.save.to_json(filename,compact=compact,compression=compression)
         elif format.lower()=='excel':
             self.ds_results.save.to_excel(filename)
+        elif format.lower()=='netcdf':
+            self.ds_results.save.to_netcdf(filename,compression=compression)
+        elif format.lower()=='npy':
+            self.ds_results.save.to_npy_dir(filename)
+        elif format.lower()=='parquet':
+            self.ds_results.save.to_parquet(filename)
         else:
             raise ValueError(f'Cannot save in format [{format}]')
 
 
-    def load(self,filename):
+    def load(self,filename,mmap=False):
         """
         Load data into self.ds_results
         If the self object is a measurement or conditions class then it will
@@ -662,14 +1191,19 @@ class CommonUtility():
         Parameters
         ----------
         filename : str
-            full path/filename to data file
+            full path/filename to data file, or directory saved in 'npy'
+            format. Compressed files are uncompressed automatically.
+        mmap : bool, optional
+            For 'npy' format memory map the data variables instead of 
+            reading them into memory, by default False. Only the parts of
+            the data that are used are read from disk.
 
         Raises
         ------
         FileNotFoundError
             Data file could not be found
         ValueError
-            Data file is not a .json file
+            Data file is not a .json, netCDF or numpy directory file
         ValueError
             No data for this object could be found in the file
         """
@@ -677,14 +1211,9 @@ class CommonUtility():
         if not os.path.exists(filename):
             raise FileNotFoundError(f'Cannot find file at [{filename}]')
 
-        if not os.path.splitext(filename)[1].lower()=='.json':
-            raise ValueError('Can only load .json files')
-
-        ds = json_to_dataset(filename)
-
-        # Extract subset of data if this object is not a test manager
+        # Only load data made by this object if it is not a test manager
         if not self.is_test_manager:
-            ds_subset = ds.filter_by_attrs(**{TAG_CLASSNAME:self.__class__.__name__})
+            ds_subset = file_to_dataset(filename,class_type=self.__class__.__name__,mmap=mmap)
             if len(ds_subset.data_vars)==0:
                 raise ValueError(f'File [{filename}] does not contain any data for {self.__class__.__name__} class')
             self.ds_results = ds_subset
@@ -693,6 +1222,7 @@ class CommonUtility():
         # Object is Test manager
         # - put all data into self.ds_result, but also distribute to individual
         # measurement/conditions object any data that they usually generate.
+        ds = file_to_dataset(filename,mmap=mmap)
         self.ds_results = ds
         self.distribute_loaded_data(ds)
 
@@ -715,17 +1245,13 @@ class CommonUtility():
         if not self.is_test_manager:
             return
 
-        # Extract any data for measurement classes
-        for meas_obj in self.meas.values():
-            ds_subset = ds.filter_by_attrs(**{TAG_CLASSNAME:meas_obj.__class__.__name__})
-            if len(ds_subset.data_vars)>0:
-                meas_obj.ds_results = ds_subset
+        # Split data by class in one pass over the data variables
+        ds_by_class = split_by_class_type(ds)
 
-        # Extract any data for conditions classes
-        for cond_obj in self.conditions.values():
-            ds_subset = ds.filter_by_attrs(**{TAG_CLASSNAME:cond_obj.__class__.__name__})
-            if len(ds_subset.data_vars)>0:
-                cond_obj.ds_results = ds_subset
+        # Give any data to measurement and conditions classes
+        for obj in list(self.meas.values())+list(self.conditions.values()):
+            if obj.__class__.__name__ in ds_by_class:
+                obj.ds_results = ds_by_class[obj.__class__.__name__]
 
     #----------------------------------------------------------------
     #%% Config management
@@ -812,8 +1338,9 @@ class CommonUtility():
             True : object is a test manager
         """
         # Use python black magic to get the names of the classes
-        # that this object is derived from
-        base_names = [b.__name__ for b in list(self.__class__.__bases__)]
+        # that this object is derived from, including indirectly e.g. 
+        # through the async templates
+        base_names = [b.__name__ for b in self.__class__.__mro__[1:]]
 
         # Look for the test manager template
         return 'AbstractTestManager' in base_names
@@ -827,31 +1354,33 @@ class CommonUtility():
         Returns
         -------
         bool
-            True : object is a test manager
+            True : object is a measurement
         """
         # Use python black magic to get the names of the classes
-        # that this object is derived from
-        base_names = [b.__name__ for b in list(self.__class__.__bases__)]
+        # that this object is derived from, including indirectly e.g. 
+        # through the async templates
+        base_names = [b.__name__ for b in self.__class__.__mro__[1:]]
 
-        # Look for the test manager template
+        # Look for the measurement template
         return 'AbstractMeasurement' in base_names
 
 
     @property
     def is_setup_conditions_class(self):
         """
-        Return True if this object is a Measurement class
+        Return True if this object is a Setup Conditions class
 
         Returns
         -------
         bool
-            True : object is a test manager
+            True : object is a setup condition
         """
         # Use python black magic to get the names of the classes
-        # that this object is derived from
-        base_names = [b.__name__ for b in list(self.__class__.__bases__)]
+        # that this object is derived from, including indirectly e.g. 
+        # through the async templates
+        base_names = [b.__name__ for b in self.__class__.__mro__[1:]]
 
-        # Look for the test manager template
+        # Look for the setup conditions template
         return 'AbstractSetupConditions' in base_names
 
 
@@ -889,9 +1418,88 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             the measurements, by default {}
 
         config : dict, optional
-            Configuration settings dictionary. Can be used to store 
+            Configuration settings dictionary. Can be used to store
             settings and options for measurements. These should be 'standard'
             python variable types, like strings, numbers, lists and dicts
+
+        preallocate_results : bool, optional
+            If True then the ds_results Dataset of every measurement is
+            allocated for the full grid of conditions before the run starts,
+            by default False. This avoids merging every new condition into
+            ds_results, which gets slow for large numbers of conditions.
+
+        columnar_results : bool, optional
+            If True then all measurements record their results in a
+            ColumnarResults store, by default False. The Datasets are only
+            built when ds_results is read. If a measurement changes its 
+            ds_results Dataset, e.g. adds a variable or writes values in 
+            place, it switches back to storing results in that Dataset, 
+            so the change is kept. current_results is read-only.
+
+        stream_running_order : bool, optional
+            If True then run() generates the running order step by step as
+            it goes instead of planning the whole sequence first, by 
+            default False. The run starts sooner and the full running order
+            is never held in memory. Ignored if preallocate_results is set
+            because that needs the full running order.
+
+        condition_ordering : str, optional
+            Order that the rows of the conditions table are run in
+            * 'nested' : (default) the first condition varies the slowest
+              and the last condition the fastest, each in the order of 
+              its values.
+            * 'serpentine' : as 'nested' but inner conditions sweep back
+              and forth so they do not jump back to their first value.
+            * 'optimise' : nesting order and nested/serpentine are chosen
+              to minimise the total cost of changing setpoints, using
+              the transition cost model of each setup condition.
+
+        concurrent_measurements : bool, optional
+            If True then measurements that run one after another at the same
+            conditions are run at the same time on a thread pool, as long as
+            they do not share any resources, by default False. Measurements
+            declare the resources they use in their uses_resources property.
+
+        overlap_settling : bool, optional
+            If True then setup conditions are set in two phases, by default
+            False. The setpoint change is started with start_setpoint() and,
+            while the condition settles, the test manager runs the process()
+            methods of the measurements from the previous conditions and
+            any measurements at the end of the previous conditions that
+            have runs_while_settling set. It then waits for the condition
+            to settle with wait_settled(). Only used by run(), run_async()
+            raises a ValueError because async setup conditions already 
+            settle while other coroutines run.
+
+        pipeline_processing : bool, optional
+            If True then each measurement's process() method is run on a
+            background thread while the test manager moves on to the next
+            measurement or conditions, by default False. process() calls are
+            run one at a time in running order and see the conditions their 
+            measurement sequence was run at in current_conditions and 
+            current_results. Measurements should not rely on the processed
+            results of other measurements until post_process(). Only used 
+            by run(), run_async() raises a ValueError because process() 
+            coroutines can already run alongside other async work.
+
+        results_sink : ResultsSink or str, optional
+            Write results to disk in chunks while running, by default None.
+            A str is the directory for a ResultsSink with default settings.
+            After each chunk of rows of the conditions table is finished
+            the results are written to the sink and cleared from the
+            measurements, so measurements only have the results of the
+            current chunk, as does ds_results_global. Measurements that 
+            need every result so far can call load_results_global(), 
+            which reads the sink back from disk. At the end of the run ds_results is loaded back
+            from the sink unless its load_results is False. 
+            preallocate_results is ignored.
+
+        checkpoint_path : str, optional
+            Directory for checkpoint files, by default None. Every time 
+            the results sink writes a chunk the progress and last 
+            setpoints are saved. The results sink is in this directory 
+            unless results_sink is set. resume() carries on from the last
+            checkpoint. Used by run() and run_async().
         """
 
         # Main components
@@ -941,6 +1549,60 @@ class AbstractTestManager(abc.ABC,CommonUtility):
         # Running order
         # Internal list of all the steps in complete test sequence
         self._running_order = []
+        self._running_order_buffer = []
+
+        # Snapshot of conditions/measurements the running order was made with
+        # and its DataFrame version, see make_running_order()
+        self._running_order_signature = None
+        self._df_running_order = None
+
+        # Cache of merged measurement results
+        # - used by get_results() to only merge measurements that have changed
+        self._results_cache = None
+
+        # Results preallocation
+        self.preallocate_results = kwargs.get('preallocate_results',False)
+
+        # Columnar results for all measurements
+        self.columnar_results = kwargs.get('columnar_results',False)
+
+        # Generate running order while running
+        self.stream_running_order = kwargs.get('stream_running_order',False)
+
+        # Order of conditions table
+        self.condition_ordering = kwargs.get('condition_ordering','nested')
+
+        # Concurrent measurements
+        # - one lock per resource label
+        self.concurrent_measurements = kwargs.get('concurrent_measurements',False)
+        self._resource_locks = {}
+
+        # Overlap setpoint settling with processing
+        # - measurements waiting for process() to be run
+        self.overlap_settling = kwargs.get('overlap_settling',False)
+        self._pending_process = []
+        self._pending_process_lock = threading.Lock()
+
+        # Pipelined processing
+        # - single worker thread so process() calls run in order
+        self.pipeline_processing = kwargs.get('pipeline_processing',False)
+        self._process_executor = None
+        self._process_futures = []
+
+        # Results sink
+        # - row of the conditions table at the start of the current chunk
+        results_sink = kwargs.get('results_sink',None)
+        if isinstance(results_sink,str):
+            results_sink = ResultsSink(results_sink)
+        self.results_sink = results_sink
+        self._sink_row = None
+
+        # Checkpoints
+        # - results are kept in a sink so they are on disk at each checkpoint
+        self.checkpoint_path = kwargs.get('checkpoint_path',None)
+        if self.checkpoint_path is not None and self.results_sink is None:
+            self.results_sink = ResultsSink(os.path.join(self.checkpoint_path,'results'))
+        self._resume_state = None
 
         # Add in any custom config parameters
         self.set_custom_config(custom_config=kwargs.get('config',{}))
@@ -972,7 +1634,7 @@ class AbstractTestManager(abc.ABC,CommonUtility):
     #%% Run methods
     #----------------------------------------------------------------
     @test_time
-    def run(self,conditions=None):
+    def run(self,conditions=None,rows=None):
         """
         Run full test over all or specified conditions [Mandatory function]
 
@@ -989,6 +1651,12 @@ class AbstractTestManager(abc.ABC,CommonUtility):
                     {'temperature_degC':25,'humidity':50},
                     {'temperature_degC':40,'wavelength_nm':1560},
                     ]
+        rows : tuple of int, optional
+            (start, stop) range of rows of the conditions table to run,
+            by default None which runs every row. Startup measurements are
+            only run if start is 0 and teardown measurements only if stop
+            is the end of the table. Used to split a run into shards, see
+            tmpl_parallel.ShardedRunner
 
 
         Raises
@@ -997,18 +1665,23 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             If supplied conditions are the wrong format
         """
 
+        # Async setup conditions/measurements need an event loop
+        if self.uses_async:
+            return run_coroutine(self.run_async(conditions,rows=rows))
+
         # Setup
         # ==============================
-        self.clear_all_results()
-
-        self.make_running_order(conditions)
-
-        if len(self._running_order)==0:
-            self.log('Nothing in the running order - aborting')
+        running_order = self.start_run(conditions,rows=rows)
+        resume_state,self._resume_state = self._resume_state,None
+        if running_order is None:
             return
 
+        # Background thread for pipelined processing
+        if self.pipeline_processing:
+            self._process_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
         # Storage for keeping a log of the current conditions
-        current_cond = {label:None for label in self.conditions_table[0]}
+        current_cond = {cond.name:None for cond in self.conditions.values()}
 
         # Main sequence
         # ==============================
@@ -1020,98 +1693,1068 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             # ==============================
             self.pre_process()
 
+            # Resume from checkpoint
+            # ==============================
+            step = 0
+            if resume_state is not None:
+                running_order,step,startup_steps = self.skip_to_checkpoint(running_order,resume_state)
+
+                # Set up instruments again
+                if resume_state.get('rerun_startup',True):
+                    self.run_meas_steps(startup_steps)
+                    self.discard_results(startup_steps)
+
+                # Restore setpoints
+                for label,value in resume_state['setpoints'].items():
+                    print(self.log_condition_separator)
+                    self.set_condition(label,value)
+                    current_cond[label] = value
+            else:
+                # Nothing has finished yet
+                self.write_checkpoint(step,None,current_cond,conditions,rows)
+
             # Main test
             # ==============================
-            for line in self._running_order:
+            # Measurements are collected up until the next condition is 
+            # set so they can be run concurrently
+            meas_steps = []
+            for line in running_order:
+                step += 1
+
                 # Set conditions
                 if line.operation==OP_COND:
+                    meas_steps,settling_steps = self.split_settling_steps(meas_steps)
+                    self.run_meas_steps(meas_steps)
+                    meas_steps = []
+                    self.check_pipeline()
+
                     print(self.log_condition_separator)
-                    self.conditions[line.label].setpoint = line.arguments
+                    self.set_condition(line.label,line.arguments,settling_steps)
 
                     # Update current conditions log
                     current_cond[line.label] = line.arguments
+
+                    # Write finished rows to disk and save progress
+                    if self.write_results_sink(line.row):
+                        self.write_checkpoint(step,line,current_cond,conditions,rows)
                 
                 # Run measurements
                 if line.operation==OP_MEAS:
-                    ok = self.meas[line.label].run(conditions=line.arguments)
-                    assert ok, f'Measurement [{line.label}] failed at conditions {line.arguments}'
+                    meas_steps.append(line)
+                    if not self.concurrent_measurements and not self.overlap_settling:
+                        self.run_meas_steps(meas_steps)
+                        meas_steps = []
+
+            self.run_meas_steps(meas_steps)
+            self.run_pending_process()
+            self.check_pipeline(wait=True)
 
 
             # Post processing
             # ==============================
             self.post_process()
+            self.write_checkpoint(step,None,current_cond,conditions,rows,finished=True)
             
             
         except Exception as err:
-            success = False
-            self.last_error = traceback.format_exc()
-            print(f'TestManager[{self.name}] has thrown an error')
-            print('*'*40)
-            traceback.print_exc()
-            print('*'*40)
-            print('Running error measurements:')
-            self.run_meas_on_error(conditions=current_cond)
+            self.report_error(current_cond)
 
         finally:
             # Grab all results regardless of any errors
-            self.get_results()
+            self.stop_pipeline()
+            self.finish_results()
 
-        self.log(self.log_section_separator)
-        if self.last_error!='':
-            self.log('Test finished with errors - check last_error property')
+        self.finish_run()
 
-    
-    def make_running_order(self,conditions=None):
+
+    async def run_async(self,conditions=None,rows=None):
         """
-        Construct the test sequence running order.
-        This creates an internal list (self._running_order) with every step
-        in the sequence. The run() method takes this list and executes it 
-        line by line.
+        Run full test over all or specified conditions from an asyncio 
+        event loop.
 
-        This method does the hard work of sorting out the running order leaving
-        the run() method with a simpler task.
+        Setup conditions based on AbstractAsyncSetupConditions are set by
+        awaiting their set_setpoint() method. Measurements are run with their
+        run_async() method, so their meas_sequence() and process() methods
+        can be coroutines. Normal setup conditions and measurements are run
+        the same way as in run(). If concurrent_measurements is set then
+        measurements that do not share resources are run together with
+        asyncio.gather() instead of on a thread pool.
 
-        To view a tabular version of the running order use the property
-        self.df_running_order. This is a pandas DataFrame representation of
-        the running order that is easier to read.
+        run() calls this automatically if there are any async setup 
+        conditions or measurements. Use this directly when there is already
+        an event loop running, e.g. in Jupyter:
+
+        >>> await test.run_async()
 
         Parameters
         ----------
         conditions : list of dict, optional
-            list of dict of conditions, by default None
-            Conditions are specified as key value pairs
-            e.g.
-                conditions = [dict(temperature_degC=34,humidity=50)]
-                conditions = [{'temperature_degC':34,'humidity':50}]
-                conditions = [{'temperature_degC':40,'humidity':50}]
-                conditions = [
-                    {'temperature_degC':25,'humidity':50},
-                    {'temperature_degC':40,'wavelength_nm':1560},
-                    ]
-
+            list of dict of conditions, by default None, see run()
+        rows : tuple of int, optional
+            (start, stop) range of rows of the conditions table to run,
+            by default None, see run()
 
         Raises
         ------
         ValueError
-            If supplied conditions are the wrong format
+            If overlap_settling or pipeline_processing is set
         """
+        if self.overlap_settling:
+            raise ValueError('overlap_settling is not supported by run_async(), turn it off for tests with async setup conditions or measurements')
+        if self.pipeline_processing:
+            raise ValueError('pipeline_processing is not supported by run_async(), turn it off for tests with async setup conditions or measurements')
+
         # Setup
         # ==============================
+        running_order = self.start_run(conditions,rows=rows)
+        resume_state,self._resume_state = self._resume_state,None
+        if running_order is None:
+            return
 
-        # Get conditions
-        if not conditions:
-            conditions_table = self.conditions_table
-        else:
-            conditions_table = conditions
-            # TODO check over conditions input
-        
-        if not isinstance(conditions_table,list):
-            raise ValueError('Supplied conditions should be a list of dicts with format {cond_name:cond_value}')
-    
-        self.df_conditions = pd.DataFrame(conditions_table)
+        # Storage for keeping a log of the current conditions
+        current_cond = {cond.name:None for cond in self.conditions.values()}
 
-        # Clear running order
-        self._running_order = []
+        # Main sequence
+        # ==============================
+        self.last_error = ''
+        try:
+
+            # Startup stage
+            # ==============================
+            result = self.pre_process()
+            if inspect.isawaitable(result):
+                await result
+
+            # Resume from checkpoint
+            # ==============================
+            step = 0
+            if resume_state is not None:
+                running_order,step,startup_steps = self.skip_to_checkpoint(running_order,resume_state)
+
+                # Set up instruments again
+                if resume_state.get('rerun_startup',True):
+                    await self.run_meas_steps_async(startup_steps)
+                    self.discard_results(startup_steps)
+
+                # Restore setpoints
+                for label,value in resume_state['setpoints'].items():
+                    print(self.log_condition_separator)
+                    await self.set_condition_async(label,value)
+                    current_cond[label] = value
+            else:
+                # Nothing has finished yet
+                self.write_checkpoint(step,None,current_cond,conditions,rows)
+
+            # Main test
+            # ==============================
+            meas_steps = []
+            for line in running_order:
+                step += 1
+
+                # Set conditions
+                if line.operation==OP_COND:
+                    await self.run_meas_steps_async(meas_steps)
+                    meas_steps = []
+
+                    print(self.log_condition_separator)
+                    await self.set_condition_async(line.label,line.arguments)
+
+                    # Update current conditions log
+                    current_cond[line.label] = line.arguments
+
+                    # Write finished rows to disk and save progress
+                    if self.write_results_sink(line.row):
+                        self.write_checkpoint(step,line,current_cond,conditions,rows)
+                
+                # Run measurements
+                if line.operation==OP_MEAS:
+                    meas_steps.append(line)
+                    if not self.concurrent_measurements:
+                        await self.run_meas_steps_async(meas_steps)
+                        meas_steps = []
+
+            await self.run_meas_steps_async(meas_steps)
+
+            # Post processing
+            # ==============================
+            result = self.post_process()
+            if inspect.isawaitable(result):
+                await result
+            self.write_checkpoint(step,None,current_cond,conditions,rows,finished=True)
+            
+        except Exception as err:
+            self.report_error(current_cond)
+
+        finally:
+            # Grab all results regardless of any errors
+            self.finish_results()
+
+        self.finish_run()
+
+
+    @property
+    def uses_async(self):
+        """
+        True if any setup conditions or measurements are async
+
+        Returns
+        -------
+        bool
+        """
+        return any([obj.is_async for obj in list(self.conditions.values())+list(self.meas.values())])
+
+
+    def start_run(self,conditions=None,rows=None):
+        """
+        Clear results and get the running order at the start of a run
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            list of dict of conditions, by default None, see run()
+        rows : tuple of int, optional
+            (start, stop) range of rows of the conditions table to run,
+            by default None, see run()
+
+        Returns
+        -------
+        iterator or None
+            Steps of the running order, None if there is nothing to run
+        """
+        self.clear_all_results()
+        self._pending_process = []
+        self._process_futures = []
+
+        if self.results_sink is not None:
+            if self._resume_state is None:
+                self.results_sink.clear()
+            else:
+                # Remove any results written after the checkpoint
+                self.results_sink.truncate(self._resume_state['chunks'])
+            self._sink_row = None
+
+        if self.stream_running_order and not self.preallocate_results:
+            self._running_order = []
+            running_order = self.iter_running_order(conditions,rows=rows)
+        else:
+            self.make_running_order(conditions,rows=rows)
+            running_order = iter(self._running_order)
+
+        # Check there is something to run
+        first_step = next(running_order,None)
+        if first_step is None:
+            self.log('Nothing in the running order - aborting')
+            return None
+
+        running_order = itertools.chain([first_step],running_order)
+
+        if self.preallocate_results and self.results_sink is None:
+            self.allocate_all_results()
+
+        return running_order
+
+
+    def report_error(self,current_cond):
+        """
+        Report an error from inside an except block, record it in
+        self.last_error and run the error measurements.
+
+        Parameters
+        ----------
+        current_cond : dict
+            Conditions when the error occurred
+        """
+        self.last_error = traceback.format_exc()
+        print(f'TestManager[{self.name}] has thrown an error')
+        print('*'*40)
+        traceback.print_exc()
+        print('*'*40)
+        print('Running error measurements:')
+        self.run_meas_on_error(conditions=current_cond)
+
+
+    def finish_run(self):
+        """
+        Log the end of a run
+        """
+        self.log(self.log_section_separator)
+        if self.last_error!='':
+            self.log('Test finished with errors - check last_error property')
+
+    
+    def run_meas_steps(self,steps):
+        """
+        Run measurement steps from the running order
+
+        If concurrent_measurements is set then the steps are split into
+        groups of measurements that do not share resources. The steps in
+        each group are run at the same time on a thread pool and the groups
+        are run one after another. A step that shares a resource with an
+        earlier step, or has uses_resources=None, always starts a new group
+        so it runs after the steps before it.
+
+        Parameters
+        ----------
+        steps : list of RunningOrderStep
+            Consecutive measurement steps
+
+        Raises
+        ------
+        AssertionError
+            If a measurement fails. With concurrent measurements the first
+            failure in running order is raised once its group has finished.
+        """
+
+        if not self.concurrent_measurements or len(steps)<2:
+            for line in steps:
+                ok = self._run_meas(line)
+                assert ok, f'Measurement [{line.label}] failed at conditions {line.arguments}'
+            return
+
+        # Run groups
+        # ==============================
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for group in self.group_meas_steps(steps):
+                if len(group)==1:
+                    results = [self._run_meas_step(group[0])]
+                else:
+                    futures = [executor.submit(self._run_meas_step,line) for line in group]
+                    results = [future.result() for future in futures]
+
+                # Report failures in running order
+                for line,ok in zip(group,results):
+                    assert ok, f'Measurement [{line.label}] failed at conditions {line.arguments}'
+
+
+    async def run_meas_steps_async(self,steps):
+        """
+        Run measurement steps from the running order in an asyncio event loop
+        Same as run_meas_steps() but measurements are run with their 
+        run_async() method and concurrent measurements are run together
+        with asyncio.gather().
+
+        Parameters
+        ----------
+        steps : list of RunningOrderStep
+            Consecutive measurement steps
+
+        Raises
+        ------
+        AssertionError
+            If a measurement fails
+        """
+        if not self.concurrent_measurements:
+            groups = [[line] for line in steps]
+        else:
+            groups = self.group_meas_steps(steps)
+
+        for group in groups:
+            results = await asyncio.gather(*[self.meas[line.label].run_async(conditions=line.arguments) 
+                                             for line in group])
+
+            # Report failures in running order
+            for line,ok in zip(group,results):
+                assert ok, f'Measurement [{line.label}] failed at conditions {line.arguments}'
+
+
+    def group_meas_steps(self,steps):
+        """
+        Split consecutive measurement steps into groups that can be run 
+        concurrently. Measurements in a group do not share any resources.
+        The groups are in running order, a step that shares a resource with
+        an earlier step, or has uses_resources=None, always starts a new group.
+
+        Parameters
+        ----------
+        steps : list of RunningOrderStep
+            Consecutive measurement steps
+
+        Returns
+        -------
+        list of list of RunningOrderStep
+            Groups of steps
+        """
+        groups = []
+        group_resources = None
+        for line in steps:
+            uses_resources = self.meas[line.label].uses_resources
+            if uses_resources is None:
+                # Could use anything, run on its own
+                groups.append([line])
+                group_resources = None
+                continue
+
+            # A measurement conflicts with itself as well as its resources
+            resources = set(uses_resources) | {('meas',line.label)}
+            if group_resources is None or resources & group_resources:
+                groups.append([])
+                group_resources = set()
+
+            groups[-1].append(line)
+            group_resources |= resources
+
+        return groups
+
+
+    def _run_meas_step(self,line):
+        """
+        Run one measurement step holding the locks for its resources
+
+        Parameters
+        ----------
+        line : RunningOrderStep
+            Measurement step
+
+        Returns
+        -------
+        bool
+            True if measurement ran successfully
+        """
+        meas = self.meas[line.label]
+
+        # Always take locks in the same order to avoid deadlocks
+        labels = sorted([str(r) for r in (meas.uses_resources or [])])
+        locks = [self._resource_locks.setdefault(label,threading.Lock()) for label in labels]
+
+        with contextlib.ExitStack() as stack:
+            for lock in locks:
+                stack.enter_context(lock)
+            return self._run_meas(line)
+
+
+    def _run_meas(self,line):
+        """
+        Run one measurement step. With overlap_settling the measurement's
+        process() is left to be run by run_pending_process().
+
+        Parameters
+        ----------
+        line : RunningOrderStep
+            Measurement step
+
+        Returns
+        -------
+        bool
+            True if measurement ran successfully
+        """
+        meas = self.meas[line.label]
+        if not self.overlap_settling and self._process_executor is None:
+            return meas.run(conditions=line.arguments)
+
+        if not meas.enable:
+            return True
+
+        # Pipelined processing
+        if self._process_executor is not None:
+            ok = meas.run_sequence(conditions=line.arguments)
+            if ok and type(meas).process is not AbstractMeasurement.process:
+                future = self._process_executor.submit(self._run_meas_process,line.label,meas.current_conditions)
+                with self._pending_process_lock:
+                    self._process_futures.append(future)
+            return ok
+
+        # Measurement must be processed before it runs again
+        self.run_pending_process(line.label)
+
+        ok = meas.run_sequence(conditions=line.arguments)
+        if ok:
+            with self._pending_process_lock:
+                self._pending_process.append((line.label,meas.current_conditions))
+        return ok
+
+
+    def _run_meas_process(self,meas_label,conditions):
+        """
+        Run a measurement's process() method on the pipeline thread
+
+        Returns
+        -------
+        tuple
+            (meas_label, conditions, ok, last_error)
+        """
+        # The error is passed back because the measurement's last_error is
+        # reset when its sequence runs again on the main thread
+        last_error = self.meas[meas_label].try_process(conditions)
+        return meas_label,conditions,last_error=='',last_error
+
+
+    def check_pipeline(self,wait=False):
+        """
+        Check the process() calls that have finished on the pipeline
+        thread, see pipeline_processing.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Wait for all process() calls to finish, by default False
+
+        Raises
+        ------
+        AssertionError
+            If processing failed. The measurement's last_error has the
+            processing error.
+        """
+        with self._pending_process_lock:
+            futures = self._process_futures
+
+        if wait:
+            concurrent.futures.wait(futures)
+
+        # Only check the finished calls at the start of the queue so 
+        # failures are reported in running order
+        nDone = 0
+        while nDone<len(futures) and futures[nDone].done():
+            nDone += 1
+
+        with self._pending_process_lock:
+            self._process_futures = self._process_futures[nDone:]
+
+        for future in futures[:nDone]:
+            meas_label,conditions,ok,last_error = future.result()
+            if not ok:
+                self.meas[meas_label].last_error = last_error
+            assert ok, f'Measurement [{meas_label}] processing failed at conditions {conditions}'
+
+
+    def resume(self,rerun_startup=True):
+        """
+        Carry on a run from the last checkpoint in checkpoint_path, e.g. 
+        after the program crashed.
+
+        The running order is made again with the same conditions and the 
+        steps that had finished are skipped. The setup conditions are set
+        to their last setpoints and the run carries on from there. Results
+        from before the checkpoint are loaded from the results sink at the
+        end of the run.
+
+        Parameters
+        ----------
+        rerun_startup : bool, optional
+            Run the startup measurements again before the setpoints are 
+            restored, by default True. A resumed run is usually in a new
+            process, so instruments need to be turned on and configured
+            again. Their results are discarded, the results from the first
+            run are in the results sink.
+
+        Raises
+        ------
+        ValueError
+            If checkpoint_path is not set
+        FileNotFoundError
+            If there is no checkpoint
+        """
+        state = self.read_checkpoint()
+        if state['finished']:
+            self.log('Run has already finished - nothing to resume')
+            return
+
+        self.log(f'Resuming run from step {state["step"]}')
+        self._resume_state = dict(state,rerun_startup=rerun_startup)
+        rows = None if state['rows'] is None else tuple(state['rows'])
+        self.run(state['conditions'],rows=rows)
+
+
+    def checkpoint_filename(self):
+        """
+        Full path of the checkpoint file
+
+        Returns
+        -------
+        str
+
+        Raises
+        ------
+        ValueError
+            If checkpoint_path is not set
+        """
+        if self.checkpoint_path is None:
+            raise ValueError(f'TestManager[{self.name}] has no checkpoint_path')
+        return os.path.join(self.checkpoint_path,'checkpoint.json')
+
+
+    def read_checkpoint(self):
+        """
+        Read the last checkpoint
+
+        Returns
+        -------
+        dict
+            Checkpoint state, see write_checkpoint()
+
+        Raises
+        ------
+        FileNotFoundError
+            If there is no checkpoint
+        """
+        filename = self.checkpoint_filename()
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f'Cannot find checkpoint file at [{filename}]')
+
+        with open(filename,'r') as read_file:
+            return json.load(read_file)
+
+
+    def write_checkpoint(self,step,line,current_cond,conditions=None,rows=None,finished=False):
+        """
+        Save the progress of a run if checkpoint_path is set.
+
+        This is done just after the results sink has written a chunk, so
+        every result from the steps that have finished is on disk. A small
+        checkpoint file records the number of steps finished, the last 
+        step, the setpoints of the setup conditions and the number of
+        results chunks. The checkpoint is skipped if any processing is
+        still to be done, because those results are not complete.
+
+        When the run has finished the last results are written to the 
+        sink first.
+
+        Parameters
+        ----------
+        step : int
+            Number of steps of the running order that have finished
+        line : RunningOrderStep or None
+            Last step that finished
+        current_cond : dict
+            Setpoints of setup conditions, key is the condition label
+        conditions : list of dict, optional
+            Conditions supplied to run(), by default None
+        rows : tuple of int, optional
+            Rows supplied to run(), by default None
+        finished : bool, optional
+            True if the run has finished, by default False
+        """
+        if self.checkpoint_path is None:
+            return
+
+        # Results waiting for processing can't be saved yet
+        if self._process_futures:
+            self.check_pipeline()
+        if self._pending_process or self._process_futures:
+            return
+
+        if finished:
+            self.write_results_sink(final=True)
+
+        state = dict(
+            step=step,
+            last_step=None if line is None else [line.operation,line.label,line.row],
+            setpoints={label:value for label,value in current_cond.items() 
+                       if label in self.conditions and value is not None},
+            conditions=conditions,
+            rows=None if rows is None else list(rows),
+            chunks=self.results_sink.n_chunks,
+            finished=finished,
+            )
+
+        # Write to a temporary file first so the checkpoint is never partial
+        os.makedirs(self.checkpoint_path,exist_ok=True)
+        filename = self.checkpoint_filename()
+        with open(filename+'.tmp','w') as write_file:
+            json.dump(state,write_file,default=lambda value: value.item() if hasattr(value,'item') else str(value))
+        os.replace(filename+'.tmp',filename)
+
+
+    def skip_to_checkpoint(self,running_order,state):
+        """
+        Skip the steps of the running order that finished before a 
+        checkpoint.
+
+        Parameters
+        ----------
+        running_order : iterator
+            Running order steps
+        state : dict
+            Checkpoint state, see write_checkpoint()
+
+        Returns
+        -------
+        tuple
+            (running order iterator, number of steps skipped, startup 
+            measurement steps that were skipped)
+
+        Raises
+        ------
+        ValueError
+            If the running order does not match the checkpoint
+        """
+        last_line = None
+        startup_steps = []
+        started = False
+        for step in range(state['step']):
+            last_line = next(running_order,None)
+            if last_line is None:
+                raise ValueError(f'Running order is shorter than checkpoint at step {state["step"]}')
+
+            # Startup measurements are before any conditions are set
+            started = started or last_line.operation==OP_COND
+            if not started:
+                startup_steps.append(last_line)
+
+        if last_line is not None and [last_line.operation,last_line.label,last_line.row]!=state['last_step']:
+            raise ValueError(f'Running order does not match checkpoint at step {state["step"]}, expected {state["last_step"]}')
+
+        return running_order,state['step'],startup_steps
+
+
+    def discard_results(self,steps):
+        """
+        Clear the results of measurement steps that have been run again,
+        e.g. startup measurements when a run is resumed. Any processing
+        is finished first.
+
+        Parameters
+        ----------
+        steps : list of RunningOrderStep
+            Measurement steps
+        """
+        self.run_pending_process()
+        self.check_pipeline(wait=True)
+
+        for label in {line.label for line in steps}:
+            self.meas[label].clear_results()
+        self._results_cache = None
+
+
+    def write_results_sink(self,row=None,final=False):
+        """
+        Write the results to the results sink and clear them from the
+        measurements, if a chunk of rows has been finished.
+
+        Any processing of the results is finished first.
+
+        Parameters
+        ----------
+        row : int, optional
+            Row of the conditions table that has just been started, by 
+            default None
+        final : bool, optional
+            Write whatever results there are, by default False. Processing
+            is not waited for, see finish_results().
+
+        Returns
+        -------
+        bool
+            True if the results were written and cleared
+        """
+        sink = self.results_sink
+        if sink is None:
+            return False
+
+        if not final:
+            if row is None:
+                return False
+            if self._sink_row is None:
+                self._sink_row = row
+            if row-self._sink_row<sink.rows_per_chunk:
+                return False
+
+            # Results must be processed before they are cleared
+            self.run_pending_process()
+            self.check_pipeline(wait=True)
+
+        # Skip chunk if nothing has been stored
+        if any([meas._ds_results is not None or meas._results_store is not None 
+                for meas in self.meas.values() if meas.enable]):
+            self.get_results()
+            sink.write(self.ds_results)
+
+        for meas in self.meas.values():
+            meas.clear_results()
+        self._results_cache = None
+        self._sink_row = row
+        return True
+
+
+    def finish_results(self):
+        """
+        Get all the results at the end of a run with get_results(). 
+        
+        If there is a results sink then the last results are written to it
+        and ds_results is loaded back from it, see ResultsSink.load_results.
+        """
+        if self.results_sink is None:
+            self.get_results()
+            return
+
+        self.write_results_sink(final=True)
+
+        ds = self.results_sink.load() if self.results_sink.load_results else None
+        if ds is None:
+            self.get_results()
+            return
+
+        self.ds_results = ds
+        self.distribute_loaded_data(ds)
+
+
+    def stop_pipeline(self):
+        """
+        Wait for the pipeline thread to finish any process() calls and shut
+        it down. Failures are not raised here, see check_pipeline().
+        """
+        if self._process_executor is None:
+            return
+
+        self._process_executor.shutdown(wait=True)
+        self._process_executor = None
+
+
+    def run_pending_process(self,meas_label=None):
+        """
+        Run the process() methods of measurements that were left by 
+        overlap_settling, in the order the measurements were run.
+
+        Parameters
+        ----------
+        meas_label : str, optional
+            Only process this measurement, by default None which processes
+            all of them
+
+        Raises
+        ------
+        AssertionError
+            If processing fails
+        """
+        with self._pending_process_lock:
+            pending = [item for item in self._pending_process if meas_label is None or item[0]==meas_label]
+            self._pending_process = [item for item in self._pending_process if item not in pending]
+
+        for label,conditions in pending:
+            ok = self.meas[label].run_process(conditions)
+            assert ok, f'Measurement [{label}] processing failed at conditions {conditions}'
+
+
+    def split_settling_steps(self,steps):
+        """
+        Split off the measurement steps at the end of a list that can be 
+        run while the next setpoint is settling, see overlap_settling.
+
+        Parameters
+        ----------
+        steps : list of RunningOrderStep
+            Consecutive measurement steps before a setpoint change
+
+        Returns
+        -------
+        tuple of list
+            (steps to run before the setpoint change, steps to run while
+            settling)
+        """
+        if not self.overlap_settling:
+            return steps,[]
+
+        split = len(steps)
+        while split>0 and self.meas[steps[split-1].label].runs_while_settling:
+            split -= 1
+
+        return steps[:split],steps[split:]
+
+
+    def set_condition(self,cond_label,value,settling_steps=[]):
+        """
+        Set a setup condition. With overlap_settling the setpoint change is
+        started, pending processing and settling_steps are run while it 
+        settles and then it waits for the condition to settle.
+
+        Parameters
+        ----------
+        cond_label : str
+            Label of setup condition
+        value : any
+            New setpoint
+        settling_steps : list of RunningOrderStep, optional
+            Measurement steps to run while settling, by default []
+        """
+        cond = self.conditions[cond_label]
+        if not self.overlap_settling:
+            cond.setpoint = value
+            return
+
+        cond.start_setpoint(value)
+
+        # Work that doesn't depend on the new setpoint
+        self.run_meas_steps(settling_steps)
+        self.run_pending_process()
+
+        cond.wait_settled(value)
+
+
+    async def set_condition_async(self,cond_label,value):
+        """
+        Set a setup condition from an asyncio event loop. Async setup
+        conditions are set by awaiting their set_setpoint() method.
+
+        Parameters
+        ----------
+        cond_label : str
+            Label of setup condition
+        value : any
+            New setpoint
+        """
+        cond = self.conditions[cond_label]
+        if cond.is_async:
+            await cond.set_setpoint(value)
+        else:
+            cond.setpoint = value
+
+
+    def make_running_order(self,conditions=None,rows=None):
+        """
+        Construct the test sequence running order.
+        This creates an internal list (self._running_order) with every step
+        in the sequence. The run() method takes this list and executes it 
+        line by line.
+
+        This method does the hard work of sorting out the running order leaving
+        the run() method with a simpler task.
+
+        To view a tabular version of the running order use the property
+        self.df_running_order. This is a pandas DataFrame representation of
+        the running order that is easier to read.
+
+        The running order is only regenerated if the conditions or 
+        measurements have changed since the last time it was made, see
+        running_order_signature().
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            list of dict of conditions, by default None
+            Conditions are specified as key value pairs
+            e.g.
+                conditions = [dict(temperature_degC=34,humidity=50)]
+                conditions = [{'temperature_degC':34,'humidity':50}]
+                conditions = [{'temperature_degC':40,'humidity':50}]
+                conditions = [
+                    {'temperature_degC':25,'humidity':50},
+                    {'temperature_degC':40,'wavelength_nm':1560},
+                    ]
+        rows : tuple of int, optional
+            (start, stop) range of rows of the conditions table to include,
+            by default None, see run()
+
+
+        Raises
+        ------
+        ValueError
+            If supplied conditions are the wrong format
+        """
+
+        # Check if anything has changed since the last running order
+        signature = self.running_order_signature(conditions,rows=rows)
+        try:
+            unchanged = signature==self._running_order_signature
+        except Exception:
+            # Values that cannot be compared, e.g. arrays
+            unchanged = False
+
+        if unchanged:
+            return
+
+        running_order = list(self.iter_running_order(conditions,rows=rows))
+        self._running_order = running_order
+        self._running_order_signature = signature
+        self._df_running_order = None
+
+
+    def running_order_signature(self,conditions=None,rows=None):
+        """
+        Snapshot of everything that the running order depends on.
+        Used by make_running_order() to decide whether the running order 
+        needs to be made again.
+
+        This covers the condition ordering, the order, names, values, 
+        enable flags and transition costs of the setup conditions and the
+        order, enable flags and run_conditions of the measurements.
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            Conditions supplied to make_running_order(), by default None
+        rows : tuple of int, optional
+            Range of rows supplied to make_running_order(), by default None
+
+        Returns
+        -------
+        tuple
+            Signature, compare with == to see if anything has changed
+        """
+        return (
+            copy.deepcopy(conditions),
+            rows,
+            self.condition_ordering,
+            [(label,cond.name,cond.enable,list(cond.values),
+              cond.transition_cost_step,cond.transition_cost_per_unit,cond.transition_cost_per_unit_down) 
+              for label,cond in self.conditions.items()],
+            [(label,meas.enable,copy.deepcopy(meas.run_conditions)) for label,meas in self.meas.items()],
+            )
+            
+
+    def iter_running_order(self,conditions=None,rows=None):
+        """
+        Generate the test sequence running order one step at a time.
+        This is used by make_running_order() to build the full running order,
+        or by run() to execute steps as they are generated when
+        stream_running_order is set.
+
+        Steps are generated one row of the conditions table at a time, so
+        the full running order is never held in memory.
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            list of dict of conditions, by default None
+            see make_running_order()
+        rows : tuple of int, optional
+            (start, stop) range of rows of the conditions table to include,
+            by default None which includes every row. FIRST and LAST 
+            run_conditions still refer to the whole table, so a measurement
+            that runs on the first/last value of a condition only runs in 
+            the shard that holds that row.
+
+        Yields
+        ------
+        RunningOrderStep
+            Next step in the running order
+
+        Raises
+        ------
+        ValueError
+            If supplied conditions are the wrong format
+        """
+        # Setup
+        # ==============================
+
+        # Get conditions
+        # - the conditions table is only made once for each running order
+        if not conditions:
+            conditions_table = self.conditions_table
+        else:
+            conditions_table = conditions
+            # TODO check over conditions input
+        
+        if not isinstance(conditions_table,(list,ConditionsTable)):
+            raise ValueError('Supplied conditions should be a list of dicts with format {cond_name:cond_value}')
+    
+        if isinstance(conditions_table,ConditionsTable):
+            self.df_conditions = conditions_table.to_dataframe()
+        else:
+            self.df_conditions = pd.DataFrame(conditions_table)
+
+        # Range of rows to run
+        nCond = len(conditions_table)
+        if rows is None:
+            start,stop = 0,nCond
+        else:
+            start,stop,_ = slice(*rows).indices(nCond)
+
+        # Clear running order buffer
+        # - add_to_running_order() puts steps in here until they are yielded
+        # - any saved running order no longer matches df_conditions
+        self._running_order_signature = None
+        self._running_order_buffer = []
+        self._running_order_row = None
+        self._running_order_arguments = {}
 
         self.log('Generating the sequence running order')
 
@@ -1119,20 +2762,28 @@ class AbstractTestManager(abc.ABC,CommonUtility):
         # Startup stage
         # ==============================
         # run startup stage measurements
-        self.run_meas_on_startup()
+        # - only in the first shard of the table
+        if start==0:
+            self.run_meas_on_startup()
+            yield from self._pop_running_order()
 
 
         # Main measurement loop
         # ==============================
-        nCond = len(conditions_table)
-        self.cond_index = 0
+        self.cond_index = start
 
         # Initialise last conditions log
-        # - use first column of conditions table to make a template
-        last_cond = {label:None for label in self.conditions_table[0]}
+        # - every condition is set at the start of a shard
+        last_cond = {cond.name:None for cond in self.conditions.values()}
+
+        if rows is None:
+            rows_iter = enumerate(conditions_table)
+        else:
+            rows_iter = ((index,conditions_table[index]) for index in range(start,stop))
 
         # Loop through conditions
-        for self.cond_index,current_cond in enumerate(self.conditions_table):
+        for self.cond_index,current_cond in rows_iter:
+            self._running_order_row = self.cond_index
 
             # Setup conditions stage
             # ------------------------------
@@ -1145,6 +2796,10 @@ class AbstractTestManager(abc.ABC,CommonUtility):
                 # - but only if the condition is different
                 name = self.conditions[cond_label].name
 
+                # Supplied conditions may not include every condition
+                if name not in current_cond:
+                    continue
+
                 # Accumulate conditions for measurements
                 accum_cond[name] = current_cond[name]
 
@@ -1172,13 +2827,35 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             # Store last conditions
             last_cond = current_cond
 
+            yield from self._pop_running_order()
+
+            # Arguments only need to be shared within a row
+            self._running_order_arguments = {}
+
 
         # Teardown after all measurements are done
         # ======================================
-        self.run_meas_on_teardown()
+        # - only in the last shard of the table
+        self._running_order_row = None
+        if stop==nCond:
+            self.run_meas_on_teardown()
+            yield from self._pop_running_order()
         
         self.log('\tRunning order done')
-            
+
+
+    def _pop_running_order(self):
+        """
+        Return the steps added to the running order since the last call
+        and clear them out.
+
+        Returns
+        -------
+        list of RunningOrderStep
+        """
+        steps = self._running_order_buffer
+        self._running_order_buffer = []
+        return steps
 
 
     def add_to_running_order(self,operation,label,arguments):
@@ -1208,11 +2885,49 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             assert hasattr(arguments,'keys'), f'Running list: measurement arguments is not dict-like [{arguments}]'
 
 
-        self._running_order.append(ObjDict(operation=operation,
-                                            label=label,
-                                            arguments=copy.deepcopy(arguments)))
-        # Note: the deepcopy is needed to stop it storing references that can
-        # be updated later in the code
+        # Take a copy of the arguments
+        # - this is needed to stop it storing references that can
+        #   be updated later in the code, e.g. accumulated conditions
+        if operation==OP_MEAS:
+            arguments = self._intern_arguments(arguments)
+
+        self._running_order_buffer.append(RunningOrderStep(operation,label,arguments,
+                                            row=getattr(self,'_running_order_row',None)))
+
+
+    def _intern_arguments(self,arguments):
+        """
+        Return a copy of a measurement's conditions dict for the running order
+        Identical dicts in the same row of the conditions table share one
+        copy, so measurements run at the same conditions do not each store
+        their own.
+
+        Parameters
+        ----------
+        arguments : dict
+            Conditions for measurement
+
+        Returns
+        -------
+        dict
+            Copy of arguments
+        """
+        if not hasattr(self,'_running_order_arguments'):
+            self._running_order_arguments = {}
+
+        try:
+            # Include the type so that 1 and 1.0 are not treated as the same
+            key = tuple([(k,v.__class__,v) for k,v in arguments.items()])
+            interned = self._running_order_arguments.get(key,None)
+        except TypeError:
+            # Unhashable condition values
+            return copy.deepcopy(arguments)
+
+        if interned is None:
+            interned = dict(arguments)
+            self._running_order_arguments[key] = interned
+
+        return interned
 
     @property
     def df_running_order(self):
@@ -1223,6 +2938,8 @@ class AbstractTestManager(abc.ABC,CommonUtility):
         If a measurement or condition has been disabled it will not
         appear on the running order table.
 
+        The table is kept and only rebuilt when the running order changes.
+
         Returns
         -------
         DataFrame
@@ -1237,29 +2954,55 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             # raise ValueError('Running order has not been generated yet. Try make_running_order() method.')
         self.make_running_order()
 
-        rows = []
+        if self._df_running_order is None:
+            self._df_running_order = self.make_df_running_order()
+
+        return self._df_running_order.copy()
+
+
+    def make_df_running_order(self):
+        """
+        Build the DataFrame for the df_running_order property from the
+        current running order.
 
+        Returns
+        -------
+        DataFrame
+            Table of running order, see df_running_order
+        """
 
+        # Remove anything that is disabled
+        steps = []
         for line in self._running_order:
-            standard_cols = {'Operation':line.operation,'Label':line.label}
-            cond_cols = {k:None for k in self.conditions}
+            if line.operation==OP_COND and not self.conditions[line.label].enable:
+                continue
+
+            if line.operation==OP_MEAS and not self.meas[line.label].enable:
+                continue
 
+            steps.append(line)
+
+        if len(steps)==0:
+            return pd.DataFrame()
+
+        # Build table one column at a time
+        columns = {
+            'Operation':[line.operation for line in steps],
+            'Label':[line.label for line in steps],
+            }
+        cond_cols = {k:[None]*len(steps) for k in self.conditions}
+
+        for index,line in enumerate(steps):
             if line.operation==OP_COND:
-                if not self.conditions[line.label].enable:
-                    continue
                 if line.label in cond_cols:
-                    cond_cols[line.label] = line.arguments
+                    cond_cols[line.label][index] = line.arguments
 
             if line.operation==OP_MEAS:
-                if not self.meas[line.label].enable:
-                    continue
                 for k,v in line.arguments.items():
                     if k in cond_cols:
-                        cond_cols[k] = v
-
-            rows.append(standard_cols | cond_cols)
+                        cond_cols[k][index] = v
 
-        return pd.DataFrame(rows)
+        return pd.DataFrame(columns | cond_cols)
             
 
 
@@ -1511,17 +3254,60 @@ class AbstractTestManager(abc.ABC,CommonUtility):
 
         # Check special values
         if meas.run_conditions[stage][condition_label]==meas.COND_FIRST_TIME:
-            if self.cond_index in self.condition_first_indexes(condition_label):
+            if self.cond_index in self.condition_index_sets(condition_label).first:
                 # index is one of first ones
                 return True
                 
 
         if meas.run_conditions[stage][condition_label]==meas.COND_LAST_TIME:
-            if self.cond_index in  self.condition_last_indexes(condition_label):
+            if self.cond_index in self.condition_index_sets(condition_label).last:
                 # index is the last ones
                 return True
 
         return False
+
+
+    def condition_index_sets(self,cond_label):
+        """
+        Get the sets of row indexes of the conditions table where each value
+        of a condition is set for the first and last time.
+
+        The sets for every condition are calculated in one pass the first
+        time this is called after df_conditions changes, so checking 
+        FIRST_TIME/LAST_TIME run conditions for every row is quick.
+
+        Parameters
+        ----------
+        cond_label : str
+            Label of condition
+
+        Returns
+        -------
+        ObjDict
+            with keys
+            * first : set of int, indexes of the first setting of each value
+            * last : set of int, indexes of the last setting of each value
+        """
+
+        assert hasattr(self,'df_conditions'),'No attribute "df_conditions"'
+        assert cond_label in self.df_conditions.columns, f'df_conditions has no colum [{cond_label}]'
+
+        # Recalculate if the conditions table has changed
+        df_cached,index_sets = getattr(self,'_condition_index_sets',(None,None))
+        if df_cached is not self.df_conditions:
+            index_sets = {}
+            for label,values in self.df_conditions.items():
+                # Missing values are ignored, same as groupby()
+                not_nan = values.notna()
+                first = ~values.duplicated(keep='first') & not_nan
+                last = ~values.duplicated(keep='last') & not_nan
+                index_sets[label] = ObjDict(
+                    first=set(self.df_conditions.index[first.values].tolist()),
+                    last=set(self.df_conditions.index[last.values].tolist()))
+
+            self._condition_index_sets = (self.df_conditions,index_sets)
+
+        return index_sets[cond_label]
                 
 
 
@@ -1541,14 +3327,11 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             list of int, indexes of the last setting of the specified condition
         """
 
-        assert hasattr(self,'df_conditions'),'No attribute "df_conditions"'
-        assert cond_label in self.df_conditions.columns, f'df_conditions has no colum [{cond_label}]'
-
-        ind = []
-        for label,group in self.df_conditions.groupby(cond_label):
-            ind.append(group.index[-1])
+        last = self.condition_index_sets(cond_label).last
 
-        return ind
+        # Order by condition value, same as groupby()
+        values = self.df_conditions[cond_label]
+        return values[values.index.isin(last)].sort_values(kind='stable').index.tolist()
 
 
     def condition_first_indexes(self,cond_label):
@@ -1567,14 +3350,11 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             list of int, indexes of the first setting of the specified condition
         """
 
-        assert hasattr(self,'df_conditions'),'No attribute "df_conditions"'
-        assert cond_label in self.df_conditions.columns, f'df_conditions has no colum [{cond_label}]'
-
-        ind = []
-        for label,group in self.df_conditions.groupby(cond_label):
-            ind.append(group.index[0])
+        first = self.condition_index_sets(cond_label).first
 
-        return ind
+        # Order by condition value, same as groupby()
+        values = self.df_conditions[cond_label]
+        return values[values.index.isin(first)].sort_values(kind='stable').index.tolist()
 
 
     #----------------------------------------------------------------
@@ -1588,13 +3368,20 @@ class AbstractTestManager(abc.ABC,CommonUtility):
 
         The order of the conditions in self.conditions dictates how each condition
         varies. The first condition varies the slowest and the last condition the
-        fastest.
+        fastest. This can be changed with the condition_ordering property, see
+        __init__().
+
+        The table is a ConditionsTable object which works out rows as they
+        are needed rather than storing every combination. It can be used like
+        a list of dicts; len(), indexing and iteration all work. Use the
+        column() method to get all the values of one condition as an array
+        or to_dataframe() to get the whole table.
 
         Returns
         -------
-        list of dicts
-            List of all combinations of the setup conditions held in self.conditions
-            Each item is a dict where the key is the name of the condition
+        ConditionsTable
+            All combinations of the setup conditions held in self.conditions
+            Each row is a dict where the key is the name of the condition
             and the value is the setpoint of that condition.
             e.g.
             conditions_table = [
@@ -1610,12 +3397,128 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             ]
         """
 
-        # Get all conditions into a list of dicts
-        cond_labels = [c.name for c in self.conditions.values()]
-        cond_values = itertools.product(*[c.values for c in self.conditions.values()])
-        cond_table = [{k:v for k,v in zip(cond_labels,m)} for m in cond_values]
+        conditions = {c.name:c.values for c in self.conditions.values()}
+
+        if self.condition_ordering=='nested':
+            return ConditionsTable(conditions)
+
+        if self.condition_ordering=='serpentine':
+            return ConditionsTable(conditions,serpentine=True)
+
+        if self.condition_ordering=='optimise':
+            nesting,serpentine = self.optimise_condition_order()
+            return ConditionsTable(conditions,nesting=nesting,serpentine=serpentine)
+
+        raise ValueError(f'Unknown condition_ordering [{self.condition_ordering}]. Should be [nested,serpentine,optimise]')
+
+
+    def optimise_condition_order(self):
+        """
+        Find the nesting order of the setup conditions, and whether to use
+        serpentine order, that minimises the total cost of changing 
+        setpoints over the whole conditions table.
+
+        Each condition's transition_cost() is used to work out the cost of
+        sweeping through its values forwards, backwards and jumping back
+        to the first value. The total cost of every nesting order is then
+        calculated from how many times each condition is swept. With more
+        than 8 conditions only the existing order is considered.
+
+        FIRST_TIME/LAST_TIME run conditions refer to the order the table is
+        actually run in.
+
+        Returns
+        -------
+        tuple
+            (nesting, serpentine)
+            nesting : list of condition names, slowest varying first
+            serpentine : bool
+        """
+
+        # Cost of sweeping each condition
+        # ==============================
+        sweep_costs = {}
+        sizes = {}
+        for cond in self.conditions.values():
+            values = list(cond.values)
+            sizes[cond.name] = len(values)
+            if len(values)==0:
+                sweep_costs[cond.name] = (0,0,0)
+                continue
+
+            forward = sum([cond.transition_cost(a,b) for a,b in zip(values[:-1],values[1:])])
+            backward = sum([cond.transition_cost(b,a) for a,b in zip(values[:-1],values[1:])])
+            reset = cond.transition_cost(values[-1],values[0])
+            sweep_costs[cond.name] = (forward,backward,reset)
+
+        # Try every nesting order
+        # ==============================
+        names = [cond.name for cond in self.conditions.values()]
+        if len(names)<=8:
+            nestings = itertools.permutations(names)
+        else:
+            nestings = [names]
+
+        best = None
+        for nesting in nestings:
+            for serpentine in [False,True]:
+                cost = 0
+                nSweeps = 1
+                for name in nesting:
+                    forward,backward,reset = sweep_costs[name]
+                    if serpentine:
+                        cost += ((nSweeps+1)//2)*forward + (nSweeps//2)*backward
+                    else:
+                        cost += nSweeps*forward + (nSweeps-1)*reset
+                    nSweeps *= sizes[name]
+
+                # Keep the first (least reordered) of equal costs
+                if best is None or cost<best[0]:
+                    best = (cost,list(nesting),serpentine)
+
+        return best[1],best[2]
+
+
+    def conditions_transition_cost(self,conditions_table=None):
+        """
+        Total cost of changing setpoints when running through a conditions 
+        table, using the transition cost model of each setup condition.
+        Useful for comparing different condition_ordering settings.
+
+        Parameters
+        ----------
+        conditions_table : ConditionsTable or list of dict, optional
+            Table of conditions, by default None, which uses 
+            self.conditions_table
+
+        Returns
+        -------
+        float
+            Total cost
+        """
+        if conditions_table is None:
+            conditions_table = self.conditions_table
+
+        if isinstance(conditions_table,ConditionsTable):
+            df = conditions_table.to_dataframe()
+        else:
+            df = pd.DataFrame(conditions_table)
+
+        cost = 0
+        for cond in self.conditions.values():
+            if cond.name not in df:
+                continue
+
+            # Only rows where the setpoint changes
+            values = df[cond.name]
+            changed = values.ne(values.shift())
+            from_values = values.shift()[changed].tolist()
+            from_values[0:1] = [None]*len(from_values[0:1])
+            to_values = values[changed].tolist()
 
-        return cond_table
+            cost += sum([cond.transition_cost(a,b) for a,b in zip(from_values,to_values)])
+
+        return cost
 
     def add_setup_condition(self,cond_class,cond_name=''):
         """
@@ -1684,8 +3587,12 @@ class AbstractTestManager(abc.ABC,CommonUtility):
 
         self.meas[meas_name] = meas_class(self.resources,config=self.config)
 
+        if self.columnar_results:
+            self.meas[meas_name].columnar_results = True
+
         # Add link to TestManager ds_results
         self.meas[meas_name]._ds_results_global = self.link_to_ds_results
+        self.meas[meas_name]._load_results_global = self.load_results_global
 
 
     #----------------------------------------------------------------
@@ -1767,6 +3674,7 @@ class AbstractTestManager(abc.ABC,CommonUtility):
         """
         Reset all results in all measurements and conditions
         """
+        self._results_cache = None
 
         # Clear measurement methods
         # ==============================
@@ -1785,16 +3693,61 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             self.conditions[c].clear_results()
 
 
+    def allocate_all_results(self):
+        """
+        Allocate the full grid of conditions in every measurement's ds_results
+        before running.
+
+        The running order is scanned to find every set of conditions that
+        each measurement will be run at. These are then allocated as
+        coordinates in the measurement's ds_results so that new conditions
+        are written in place rather than merged in one at a time.
+
+        The running order must have been generated with make_running_order()
+        """
+
+        # Collect conditions for each measurement
+        # ========================================
+        meas_conditions = {}
+        for line in self._running_order:
+            if line.operation!=OP_MEAS:
+                continue
+
+            if not self.meas[line.label].enable:
+                continue
+
+            # Measurements run without conditions get the 'default' condition
+            conditions = line.arguments
+            if len(conditions)==0:
+                conditions = {'default':0}
+
+            cond_values = meas_conditions.setdefault(line.label,{})
+            for name,value in conditions.items():
+                cond_values.setdefault(name,[]).append(value)
+
+        # Allocate
+        # ==============================
+        for meas_label,cond_values in meas_conditions.items():
+            self.meas[meas_label].allocate_conditions(cond_values)
+
+
 
     def get_results(self):
         """
         Get all the individual datasets out of the measurement objects
         and merge them into final results dataset in self.ds_results
+
+        The merged results are cached along with the results version of
+        each measurement. On the next call only measurements whose results
+        have changed since are merged in again. The merged results are a
+        copy, so values written in place in a measurement's ds_results
+        are only merged after update_results() is called, see 
+        results_version.
         """
 
         # Gather all individual datasets
         # =================================
-        ds_list = []
+        versions = {}
         for m in self.meas:
             # Deal with no results cases
             if not hasattr(self.meas[m],'ds_results'):
@@ -1806,11 +3759,14 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             if not self.meas[m].enable:
                 continue
 
-            # Get results
-            ds_list.append(self.meas[m].ds_results)
+            versions[m] = self.meas[m].results_version
 
         # Merge Datasets together
-        self.ds_results = xr.merge(ds_list)
+        # =================================
+        ds_merged = self.merge_results(versions)
+
+        # Copy so that the cached results are not changed below
+        self.ds_results = ds_merged.copy(deep=False)
         
 
         # Add information as coordinates or attributes
@@ -1828,6 +3784,78 @@ class AbstractTestManager(abc.ABC,CommonUtility):
             self.ds_results = self.ds_results.drop_dims('default')
 
 
+    def merge_results(self,versions):
+        """
+        Merge measurement results, using the cached results from the last
+        merge where possible.
+
+        Parameters
+        ----------
+        versions : dict
+            Results version of each measurement to be merged, as returned
+            by the results_version property.
+            e.g. {'VoltageSweep':(1,12,None),'Timestamp':(1,3,None)}
+
+        Returns
+        -------
+        xarray Dataset
+            Merged results of all measurements
+        """
+        cache = self._results_cache
+
+        # Decide what needs merging
+        # ==============================
+        # Everything has to be merged if measurements have been added or
+        # removed or any results have been replaced
+        full_merge = (cache is None 
+            or set(cache['versions'])!=set(versions)
+            or any([cache['versions'][m][0]!=v[0] for m,v in versions.items()]))
+
+        changed = [m for m,v in versions.items() if full_merge or cache['versions'][m]!=v]
+
+        if not full_merge:
+            # Data variables that are shared between changed and unchanged
+            # measurements cannot be separated
+            changed_vars = set().union(*[cache['data_vars'][m] for m in changed])
+            unchanged_vars = set().union(*[cache['data_vars'][m] for m in versions if m not in changed])
+            full_merge = len(changed_vars & unchanged_vars)>0
+
+        if full_merge:
+            changed = list(versions.keys())
+
+        # Merge
+        # ==============================
+        if not full_merge and len(changed)==0:
+            return cache['ds']
+
+        ds_changed = [self.meas[m].get_results_dataset() for m in changed]
+
+        # Copy so the merged results never share data with the measurements,
+        # whether xr.merge() has to align them or not
+        ds_copies = [ds.copy(deep=True) for ds in ds_changed]
+
+        if full_merge:
+            ds_merged = xr.merge(ds_copies)
+        else:
+            ds_unchanged = cache['ds'].drop_vars(list(changed_vars))
+            ds_merged = xr.merge([ds_unchanged] + ds_copies)
+
+        # Update cache
+        # ==============================
+        # The variables are kept so that the ids in the versions can't be
+        # reused by new variables
+        data_vars = {} if full_merge else dict(cache['data_vars'])
+        variables = {} if full_merge else dict(cache['variables'])
+        for m,ds in zip(changed,ds_changed):
+            data_vars[m] = set(ds.data_vars)
+            variables[m] = dict(ds.variables)
+
+        self._results_cache = dict(ds=ds_merged,versions=dict(versions),data_vars=data_vars,
+                                   variables=variables)
+
+        return ds_merged
+
+
     def link_to_ds_results(self):
         """
         Convenience method for accessing all results from a Measurement object
@@ -1835,6 +3863,9 @@ class AbstractTestManager(abc.ABC,CommonUtility):
         This method is given to every Measurement object when they are created
         using add_measurement.
 
+        Repeated calls only merge in results from measurements that have
+        stored new data since the last call.
+
         Returns
         -------
         xarray Dataset
@@ -1843,7 +3874,31 @@ class AbstractTestManager(abc.ABC,CommonUtility):
         # Update results from all measurements
         self.get_results()
 
-        return self.ds_results
+        return self.ds_results
+
+
+    def load_results_global(self):
+        """
+        All results of the run so far, including any that have been 
+        written to the results sink and cleared from the measurements.
+
+        Unlike link_to_ds_results() the chunks in the sink are read back
+        from disk on every call and nothing is kept in memory, so only use
+        this when every result is needed, e.g. in post processing.
+
+        This method is given to every Measurement object when they are 
+        created using add_measurement.
+
+        Returns
+        -------
+        xarray Dataset
+            Results from the sink combined with ds_results
+        """
+        ds = self.link_to_ds_results()
+        if self.results_sink is None or self.results_sink.n_chunks==0:
+            return ds
+
+        return combine_partial_datasets([self.results_sink.load(),ds])
 
     #----------------------------------------------------------------
     #%% Config methods
@@ -2025,6 +4080,17 @@ class AbstractMeasurement(abc.ABC,CommonUtility):
     COND_FIRST_TIME = 'FIRST_TIME'
     COND_LAST_TIME = 'LAST_TIME'
 
+    # Resources used
+    uses_resources = None
+    """List of labels of the resources this measurement uses. Used by the
+    test manager to run measurements concurrently. None means it could use 
+    any resource, so it is never run at the same time as another measurement."""
+
+    runs_while_settling = False
+    """True if the measurement does not depend on the setup conditions, e.g.
+    saving or logging in the After stage. Used by the test manager with 
+    overlap_settling to run it while the next setpoint is settling."""
+
 
     def __init__(self,resources={},**kwargs):
         """
@@ -2069,10 +4135,17 @@ class AbstractMeasurement(abc.ABC,CommonUtility):
         # Link to TestManager data
         # - TestManager must populate this with a link to a function
         self._ds_results_global = None
+        self._load_results_global = None
 
         # Storage for current conditions
+        # - process() run on a background thread sees the conditions its
+        #   measurement sequence was run at, see current_conditions
+        self._thread_conditions = threading.local()
         self.current_conditions = {}
 
+        # Results can be stored by a background processing thread
+        self._results_lock = threading.RLock()
+
         # Store the resources
         self.resources = resources
         self.make_resources_into_properties(resources)
@@ -2160,47 +4233,204 @@ class AbstractMeasurement(abc.ABC,CommonUtility):
         if not self.enable:
             return True
 
+        if not self.run_sequence(conditions,**kwargs):
+            return False
+
+        return self.run_process()
+
 
+    def run_sequence(self,conditions={'default':0},**kwargs):
+        """
+        Run only the measurement sequence part of run(), without 
+        processing. Used by the test manager to run process() later, 
+        see run_process().
+
+        Parameters
+        ----------
+        conditions : dict, optional
+            Dict of current setup conditions, see run()
+
+        Returns
+        -------
+        bool
+            True if sequence executed successfully, False if error occurred
+        """
         # Setup conditions
         # ==============================
-        if len(conditions)==0:
-            conditions = {'default':0}
-            
-        self.set_conditions(conditions)
-        self.current_conditions = conditions
+        self.start_run(conditions)
 
         # Run measurement sequence
         # ==============================
-        success = True
         self.last_error = ''
         try:
             self.meas_sequence(**kwargs)
         except Exception as err:
-            success = False
-            self.last_error = traceback.format_exc()
-            print(f'Measurement sequence for[{self.name}] has thrown an error')
-            print('*'*40)
-            traceback.print_exc()
-            print('*'*40)
+            return self.report_error('sequence')
         
-        # Failed on running sequence, exit cleanly
-        if not success:
-            return success
+        return True
+
+
+    def run_process(self,conditions=None):
+        """
+        Run only the processing part of run()
+
+        Parameters
+        ----------
+        conditions : dict, optional
+            Conditions the measurement sequence was run at, by default None
+            which uses current_conditions. Set this when processing is run 
+            after the measurement has moved on to other conditions.
+
+        Returns
+        -------
+        bool
+            True if processing executed successfully, False if error occurred
+        """
+        self.last_error = self.try_process(conditions)
+        return self.last_error==''
+
+
+    def try_process(self,conditions=None):
+        """
+        Run the processing part of run() and return any error instead of
+        recording it in last_error. Used to process on a background 
+        thread while the measurement sequence runs again, which resets 
+        last_error.
+
+        Parameters
+        ----------
+        conditions : dict, optional
+            Conditions the measurement sequence was run at, see 
+            run_process()
+
+        Returns
+        -------
+        str
+            Formatted error, '' if processing executed successfully
+        """
+        # Conditions are only changed for this thread, so the measurement
+        # sequence can run at new conditions in another thread
+        if conditions is not None:
+            self._thread_conditions.conditions = conditions
 
         # Run processing
         # ==============================
-        self.last_error = ''
         try:
             self.process()
         except Exception as err:
-            success = False
-            self.last_error = traceback.format_exc()
-            print(f'Measurement processing for[{self.name}] has thrown an error')
-            print('*'*40)
-            traceback.print_exc()
-            print('*'*40)
+            return self.format_error('processing')
+        finally:
+            self._thread_conditions.__dict__.pop('conditions',None)
+        
+        return ''
+
+
+    @test_time
+    async def run_async(self,conditions={'default':0},**kwargs):
+        """
+        Run measurement sequence at specified conditions from an asyncio
+        event loop. This is used by the test manager's run_async() method.
+        
+        meas_sequence() and process() can be coroutines, in which case they
+        are awaited, or normal methods, in which case they are called 
+        directly. Otherwise it is the same as run().
+
+        Parameters
+        ----------
+        conditions : dict, optional
+            Dict of current setup conditions, see run()
+
+        Returns
+        -------
+        bool
+            True if sequence executed successfully, False if error occurred
+        """
+        # Skip if not enabled
+        if not self.enable:
+            return True
+
+        # Setup conditions
+        # ==============================
+        self.start_run(conditions)
+
+        # Run measurement sequence
+        # ==============================
+        self.last_error = ''
+        try:
+            result = self.meas_sequence(**kwargs)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as err:
+            return self.report_error('sequence')
+
+        # Run processing
+        # ==============================
+        self.last_error = ''
+        try:
+            result = self.process()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as err:
+            return self.report_error('processing')
         
-        return success
+        return True
+
+
+    def start_run(self,conditions):
+        """
+        Set the conditions at the start of a run
+
+        Parameters
+        ----------
+        conditions : dict
+            Dict of current setup conditions, see run()
+        """
+        if len(conditions)==0:
+            conditions = {'default':0}
+            
+        self.set_conditions(conditions)
+        self.current_conditions = conditions
+
+
+    def report_error(self,stage):
+        """
+        Report an error from inside an except block and record it in 
+        self.last_error
+
+        Parameters
+        ----------
+        stage : str
+            Stage of the run that failed, e.g. 'sequence' or 'processing'
+
+        Returns
+        -------
+        bool
+            Always False, the run has failed
+        """
+        self.last_error = self.format_error(stage)
+        return False
+
+
+    def format_error(self,stage):
+        """
+        Print an error from inside an except block
+
+        Parameters
+        ----------
+        stage : str
+            Stage of the run that failed, e.g. 'sequence' or 'processing'
+
+        Returns
+        -------
+        str
+            Formatted traceback
+        """
+        error = traceback.format_exc()
+        print(f'Measurement {stage} for[{self.name}] has thrown an error')
+        print('*'*40)
+        traceback.print_exc()
+        print('*'*40)
+        return error
 
 
 
@@ -2227,6 +4457,26 @@ class AbstractMeasurement(abc.ABC,CommonUtility):
         return f'Measurement[{self.name}]'
 
 
+    @property
+    def current_conditions(self):
+        """
+        Conditions the measurement is being run at
+
+        While run_process() is running with conditions supplied, the thread
+        it is running in sees those conditions instead.
+
+        Returns
+        -------
+        dict
+            Current conditions
+        """
+        return getattr(self._thread_conditions,'conditions',self._current_conditions)
+
+    @current_conditions.setter
+    def current_conditions(self,conditions):
+        self._current_conditions = conditions
+
+
     @property
     def current_results(self):
         """
@@ -2242,7 +4492,14 @@ class AbstractMeasurement(abc.ABC,CommonUtility):
         if self.current_conditions=={}:
             return self.ds_results
 
-        return self.ds_results.sel(self.current_conditions)
+        with self._results_lock:
+            # Columnar results only need to build the current conditions
+            self.check_results_view()
+            if self._results_store is not None:
+                ds = self._results_store.to_dataset(conditions=self.current_conditions)
+                return read_only_dataset(ds).sel(self.current_conditions)
+
+            return self.ds_results.sel(self.current_conditions)
 
 
 
@@ -2446,6 +4703,25 @@ class AbstractMeasurement(abc.ABC,CommonUtility):
             return None
 
         return self._ds_results_global()
+
+
+    def load_results_global(self):
+        """
+        Access every result of the test manager run so far, including 
+        results that have been written to its results sink. This reads the
+        sink from disk on every call, see ds_results_global for the 
+        results in memory.
+
+        Returns
+        -------
+        xarray Dataset
+            Returns the test manager results so far
+        """
+
+        if self._load_results_global is None:
+            return None
+
+        return self._load_results_global()
     
     
             
@@ -2488,6 +4764,33 @@ class AbstractSetupConditions(abc.ABC,CommonUtility):
     """
     name = ''
 
+    # Transition cost model
+    # - cost of changing the setpoint, used by the test manager to choose
+    #   the order of the conditions table. Units are arbitrary, e.g. seconds
+    #   but must be the same for all conditions.
+    transition_cost_step = 0
+    """Fixed cost of any change of setpoint"""
+    transition_cost_per_unit = 0
+    """Cost per unit change when the setpoint increases"""
+    transition_cost_per_unit_down = None
+    """Cost per unit change when the setpoint decreases, None to use
+    transition_cost_per_unit"""
+
+    # Settle detection
+    # - used by wait_settled() when the test manager has overlap_settling set
+    settle_tolerance = None
+    """Maximum difference between actual and setpoint when settled, None to
+    treat the condition as settled as soon as start_setpoint() returns"""
+    settle_window_s = 0
+    """Time actual must stay within settle_tolerance to be settled"""
+    settle_poll_min_s = 0.1
+    """Shortest time between polls of actual"""
+    settle_poll_max_s = 10
+    """Longest time between polls of actual"""
+    settle_timeout_s = None
+    """Time to wait for settling before raising TimeoutError, None to wait
+    forever"""
+
     def __init__(self,resources,**kwargs):
         """
         Initialise measurement
@@ -2609,11 +4912,263 @@ class AbstractSetupConditions(abc.ABC,CommonUtility):
         raise NotImplemented('SetupConditions actual property not implemented')
 
 
+    def transition_cost(self,from_value,to_value):
+        """
+        Cost of changing the setpoint from one value to another
+        Used by the test manager to find the cheapest order to run the
+        conditions table in.
+
+        The default model uses the transition_cost_* class properties:
+            cost = step + per_unit * |to_value - from_value|
+        where per_unit is transition_cost_per_unit_down for decreasing
+        setpoints. Non-numeric values only have the step cost.
+        Override this method for anything more complicated.
+
+        Example
+        -------
+        Temperature takes 5 minutes to start changing and heats at
+        2 minutes/degC but cools at 3 minutes/degC
+
+        >>> class Temperature(AbstractSetupConditions):
+                transition_cost_step = 5
+                transition_cost_per_unit = 2
+                transition_cost_per_unit_down = 3
+
+        Parameters
+        ----------
+        from_value : any
+            Current setpoint, None if the setpoint has not been set yet
+        to_value : any
+            New setpoint
+
+        Returns
+        -------
+        float
+            Cost of transition
+        """
+        if from_value is None:
+            return self.transition_cost_step
+
+        if from_value==to_value:
+            return 0
+
+        try:
+            change = float(to_value) - float(from_value)
+        except (TypeError,ValueError):
+            return self.transition_cost_step
+
+        per_unit = self.transition_cost_per_unit
+        if change<0 and self.transition_cost_per_unit_down is not None:
+            per_unit = self.transition_cost_per_unit_down
+
+        return self.transition_cost_step + per_unit*abs(change)
+
+
+    #----------------------------------------------------------------
+    #%% Two phase setpoint
+    #----------------------------------------------------------------
+    # Used by the test manager when overlap_settling is set. The setpoint
+    # change is started, other work is done while the condition settles
+    # and then the test manager waits for it to settle.
+
+    def start_setpoint(self,value):
+        """
+        Start changing the setpoint without waiting for the condition to
+        settle. 
+        
+        By default this sets the setpoint property, so it only returns 
+        when that does. Override this to write the new setpoint to the 
+        hardware and return straight away, then wait_settled() polls 
+        actual until the condition has settled.
+
+        Parameters
+        ----------
+        value : any
+            New setpoint
+        """
+        self.setpoint = value
+
+
+    def wait_settled(self,value):
+        """
+        Wait for the condition to settle at a new setpoint.
+
+        actual is polled until it stays within settle_tolerance of value 
+        for settle_window_s. The time between polls adapts to how fast 
+        actual is approaching value, between settle_poll_min_s and 
+        settle_poll_max_s, and is always settle_poll_min_s once actual is 
+        within tolerance.
+
+        Returns straight away if settle_tolerance is None.
+
+        Parameters
+        ----------
+        value : any
+            Setpoint being settled to
+
+        Raises
+        ------
+        TimeoutError
+            If not settled after settle_timeout_s
+        """
+        if self.settle_tolerance is None:
+            return
+
+        t_start = time.monotonic()
+        t_within = None
+        last = None
+        poll_s = self.settle_poll_min_s
+        while True:
+            now = time.monotonic()
+            error = abs(self.actual - value)
+
+            if error<=self.settle_tolerance:
+                # Settled if within tolerance for long enough
+                if t_within is None:
+                    t_within = now
+                if now-t_within>=self.settle_window_s:
+                    return
+                poll_s = self.settle_poll_min_s
+            else:
+                t_within = None
+
+                # Estimate time to reach tolerance from rate of approach
+                if last is not None and last[1]>error and now>last[0]:
+                    rate = (last[1]-error)/(now-last[0])
+                    poll_s = (error-self.settle_tolerance)/rate/2
+                else:
+                    poll_s = poll_s*2
+                poll_s = min(max(poll_s,self.settle_poll_min_s),self.settle_poll_max_s)
+
+            if self.settle_timeout_s is not None and now-t_start>=self.settle_timeout_s:
+                raise TimeoutError(f'SetupCondition[{self.name}] did not settle at [{value}] after {self.settle_timeout_s} s, actual is [{self.actual}]')
+
+            if self.settle_timeout_s is not None:
+                poll_s = min(poll_s,max(t_start+self.settle_timeout_s-now,0))
+
+            last = (now,error)
+            time.sleep(poll_s)
+
     
     # TODO Entry of list of setpoints
 
     
 
+#================================================================
+#%% Asyncio classes
+#================================================================
+class AbstractAsyncMeasurement(AbstractMeasurement):
+    """
+    Measurement class for use with asyncio
+    The meas_sequence() and process() methods can be coroutines. When the
+    test manager runs they are awaited in its event loop, so waiting on
+    instrument I/O does not hold up other async measurements or setup 
+    conditions.
+
+    Example usage
+    -------------
+    
+    >>> class MyMeasurement(AbstractAsyncMeasurement):
+            async def meas_sequence(self):
+                power = await self.power_meter.read()
+                self.store_data_var('power_mW',[power])
+
+    Calling run() directly runs the measurement in its own event loop.
+    """
+    is_async = True
+
+    def run(self,conditions={'default':0},**kwargs):
+        """
+        Run measurement sequence at specified conditions in an event loop
+        See AbstractMeasurement.run()
+
+        Returns
+        -------
+        bool
+            True if sequence executed successfully, False if error occurred
+        """
+        return run_coroutine(self.run_async(conditions,**kwargs))
+
+
+    @abc.abstractmethod
+    async def meas_sequence(self):
+        """
+        Measurement sequence coroutine [Mandatory function]
+        """
+        pass
+
+
+class AbstractAsyncSetupConditions(AbstractSetupConditions):
+    """
+    Setup conditions class for use with asyncio
+    The setpoint is changed by the write_setpoint() coroutine, which the 
+    test manager awaits in its event loop. This can wait for the condition
+    to settle without holding up other async objects.
+
+    Example usage
+    -------------
+    
+    >>> class Temperature(AbstractAsyncSetupConditions):
+            name = 'temperature_degC'
+            async def write_setpoint(self,value):
+                await self.chamber.set_temperature(value)
+                while abs(await self.chamber.read_temperature()-value)>0.5:
+                    await asyncio.sleep(1)
+
+            @property
+            def actual(self):
+                return self.chamber.last_temperature
+
+    Setting the setpoint property directly runs write_setpoint() in its 
+    own event loop.
+    """
+    is_async = True
+
+    # Last value set
+    _setpoint = None
+
+    @property
+    def setpoint(self):
+        """
+        Get/Set the condition setpoint
+
+        Returns
+        -------
+        any
+            Last value set
+        """
+        return self._setpoint
+
+    @setpoint.setter
+    def setpoint(self,value):
+        run_coroutine(self.set_setpoint(value))
+
+
+    async def set_setpoint(self,value):
+        """
+        Set the condition setpoint from an event loop
+
+        Parameters
+        ----------
+        value : any
+            New setpoint
+        """
+        self._setpoint = value
+        await self.write_setpoint(value)
+
+
+    @abc.abstractmethod
+    async def write_setpoint(self,value):
+        """
+        Coroutine that sets the condition on the hardware [Mandatory function]
+
+        Parameters
+        ----------
+        value : any
+            New setpoint
+        """
+        pass
+
     
  
 #================================================================
@@ -2626,6 +5181,8 @@ class Timestamp(AbstractMeasurement):
     ds_results.
 
     """
+    uses_resources = []
+
     def initialise(self):
         self.run_on_startup(True)
 
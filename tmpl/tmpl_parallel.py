@@ -0,0 +1,435 @@
+'''
+Parallel runners for Test Measure Process Library (TMPL)
+================================================================
+This module defines classes that run test managers in parallel worker
+processes and merge their results.
+
+MultiDutRunner runs the same test manager on several units (DUTs), each
+with its own set of resources, and merges every unit's results into one
+Dataset with a 'dut' dimension.
+
+ShardedRunner splits the conditions table of one test manager into
+contiguous blocks of rows and runs each block in its own process, e.g. 
+for offline_mode tests that drive a model instead of hardware. The 
+partial results are combined into one Dataset.
+
+Instrument objects can't usually be sent between processes, so each worker
+builds its own resources with a factory function. The factory is given a
+picklable description of the resources for its unit, e.g. a dict of
+instrument addresses.
+
+Example of use
+--------------
+
+>>> def make_resources(settings):
+        return {'smu':SMU(settings['smu_address'])}
+
+>>> runner = MultiDutRunner(MyTest,
+                            [{'smu_address':'GPIB::1'},{'smu_address':'GPIB::2'}],
+                            resource_factory=make_resources,
+                            dut_labels=['SN001','SN002'])
+>>> ds = runner.run()
+
+>>> runner = ShardedRunner(MyTest,{'offline_mode':True},n_shards=8)
+>>> ds = runner.run()
+
+The factory function and test manager class must be defined at the top
+level of a module so that they can be sent to the worker processes.
+
+'''
+
+
+#================================================================
+#%% Imports
+#================================================================
+# Standard library
+import os
+import traceback
+import concurrent.futures
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Local libraries
+from .tmpl_results import combine_partial_datasets
+
+#================================================================
+#%% Constants
+#================================================================
+DIM_DUT = 'dut'
+
+#================================================================
+#%% Functions
+#================================================================
+def run_test_manager(manager_class,resource_set,resource_factory=None,
+                     manager_kwargs={},conditions=None,rows=None):
+    """
+    Build and run a test manager, used by the worker processes
+
+    Parameters
+    ----------
+    manager_class : class
+        Class based on AbstractTestManager
+    resource_set : any
+        Resources for the test manager, or a description of them if
+        resource_factory is supplied
+    resource_factory : function, optional
+        Function that takes resource_set and returns the resources dict,
+        by default None, which uses resource_set as the resources
+    manager_kwargs : dict, optional
+        Keyword arguments for manager_class, by default {}
+    conditions : list of dict, optional
+        Conditions to run, by default None, see AbstractTestManager.run()
+    rows : tuple of int, optional
+        (start, stop) range of rows of the conditions table to run,
+        by default None, see AbstractTestManager.run()
+
+    Returns
+    -------
+    tuple
+        (ds_results, last_error)
+    """
+    try:
+        if resource_factory is None:
+            resources = resource_set
+        else:
+            resources = resource_factory(resource_set)
+
+        test = manager_class(resources,**manager_kwargs)
+        test.run(conditions,rows=rows)
+    except Exception:
+        return None,traceback.format_exc()
+
+    return test.ds_results,test.last_error
+
+
+def concat_on_new_dim(datasets,dim,labels):
+    """
+    Concatenate datasets along a new dimension
+
+    Dimensions of length 1 whose coordinate value is different in each
+    Dataset, e.g. the timestamp of each run, are turned into coordinates
+    along the new dimension instead of being padded out with NaNs.
+
+    Parameters
+    ----------
+    datasets : list of xarray Dataset
+        Datasets to concatenate
+    dim : str
+        Name of new dimension
+    labels : list
+        Coordinate values of new dimension, one for each Dataset
+
+    Returns
+    -------
+    xarray Dataset
+        Concatenated Dataset
+    """
+
+    # Find length 1 dimensions that differ between datasets
+    squeeze_dims = []
+    for name,index in datasets[0].indexes.items():
+        if len(index)!=1:
+            continue
+
+        indexes = [ds.indexes.get(name,None) for ds in datasets]
+        if any([ind is None or len(ind)!=1 for ind in indexes]):
+            continue
+
+        if len(set([ind[0] for ind in indexes]))>1:
+            squeeze_dims.append(name)
+
+    datasets = [ds.squeeze(squeeze_dims) if squeeze_dims else ds for ds in datasets]
+
+    return xr.concat(datasets,dim=pd.Index(labels,name=dim),join='outer')
+
+
+def shard_boundaries(df_conditions,n_shards):
+    """
+    Split a table of conditions into contiguous blocks of rows of roughly
+    equal size.
+
+    Blocks start where the slowest changing condition changes value, so 
+    each shard only sets that condition as often as a single run would. 
+    Faster changing conditions are used as well if there are not enough
+    places to split on.
+
+    Parameters
+    ----------
+    df_conditions : pandas DataFrame
+        Conditions table, one row per set of conditions
+    n_shards : int
+        Number of blocks wanted
+
+    Returns
+    -------
+    list of tuple
+        (start, stop) rows of each block, there can be fewer than n_shards
+    """
+    nRows = len(df_conditions)
+    if nRows==0:
+        return []
+    n_shards = max(1,min(n_shards,nRows))
+
+    # Rows where each condition changes value
+    changes = (df_conditions!=df_conditions.shift()).to_numpy()
+    changes[0,:] = False
+    nChanges = changes.sum(axis=0)
+
+    # Add split points from the slowest changing conditions first
+    splits = np.zeros(nRows,dtype=bool)
+    for col in np.argsort(nChanges,kind='stable'):
+        splits |= changes[:,col]
+        if splits.sum()>=n_shards-1:
+            break
+    candidates = np.flatnonzero(splits)
+
+    # Pick the split points closest to equal sized blocks
+    starts = {0}
+    if len(candidates)>0:
+        targets = np.arange(1,n_shards)*nRows/n_shards
+        right = np.clip(np.searchsorted(candidates,targets),0,len(candidates)-1)
+        left = np.clip(right-1,0,len(candidates)-1)
+        nearest = np.where(np.abs(candidates[left]-targets)<=np.abs(candidates[right]-targets),
+                           candidates[left],candidates[right])
+        starts.update([int(start) for start in nearest])
+    starts = sorted(starts)
+
+    return list(zip(starts,starts[1:]+[nRows]))
+
+#================================================================
+#%% Classes
+#================================================================
+class MultiDutRunner():
+    """
+    Run one test manager class on several units (DUTs) in parallel worker
+    processes and merge the results into one Dataset with a 'dut' dimension.
+
+    Parameters
+    ----------
+    manager_class : class
+        Class based on AbstractTestManager
+    resource_sets : list
+        One set of resources for each unit. If resource_factory is
+        supplied these are descriptions of the resources that are passed to
+        the factory in the worker process, so they must be picklable.
+    resource_factory : function, optional
+        Function that takes one item of resource_sets and returns the
+        resources dict for the test manager, by default None
+    dut_labels : list, optional
+        Label for each unit, used as the 'dut' coordinate,
+        by default None, which numbers the units 0,1,2...
+    manager_kwargs : dict, optional
+        Keyword arguments for manager_class, e.g. config or offline_mode,
+        by default {}
+    max_workers : int, optional
+        Maximum number of worker processes, by default None which uses
+        one per CPU
+
+    Attributes
+    ----------
+    ds_results : xarray Dataset
+        Merged results after run()
+    errors : dict
+        last_error of each unit that had an error, key is the dut label
+    """
+    def __init__(self,manager_class,resource_sets,resource_factory=None,
+                 dut_labels=None,manager_kwargs={},max_workers=None) -> None:
+
+        self.manager_class = manager_class
+        self.resource_sets = list(resource_sets)
+        self.resource_factory = resource_factory
+
+        if dut_labels is None:
+            dut_labels = list(range(len(self.resource_sets)))
+
+        if len(dut_labels)!=len(self.resource_sets):
+            raise ValueError(f'Number of dut_labels [{len(dut_labels)}] does not match number of resource sets [{len(self.resource_sets)}]')
+
+        self.dut_labels = list(dut_labels)
+        self.manager_kwargs = manager_kwargs
+        self.max_workers = max_workers
+
+        self.ds_results = None
+        self.errors = {}
+
+
+    def __repr__(self):
+        return f'MultiDutRunner[{self.manager_class.__name__} x {len(self.dut_labels)}]'
+
+
+    def run(self,conditions=None):
+        """
+        Run the test manager on every unit and merge the results
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            Conditions to run, by default None, see AbstractTestManager.run()
+
+        Returns
+        -------
+        xarray Dataset
+            Merged results with a 'dut' dimension. Units that failed to
+            produce any results are left out, see the errors property.
+        """
+        self.errors = {}
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(run_test_manager,self.manager_class,resource_set,
+                                       self.resource_factory,self.manager_kwargs,conditions)
+                       for resource_set in self.resource_sets]
+
+            results = [future.result() for future in futures]
+
+        # Collect results in dut order
+        datasets = []
+        labels = []
+        for label,(ds,last_error) in zip(self.dut_labels,results):
+            if last_error:
+                self.errors[label] = last_error
+                print(f'MultiDutRunner: dut [{label}] finished with errors')
+
+            if ds is None:
+                continue
+
+            datasets.append(ds)
+            labels.append(label)
+
+        if len(datasets)==0:
+            self.ds_results = None
+            return None
+
+        self.ds_results = concat_on_new_dim(datasets,DIM_DUT,labels)
+        return self.ds_results
+
+
+class ShardedRunner():
+    """
+    Split the conditions table of a test manager into contiguous blocks of
+    rows (shards) and run each shard in its own worker process. 
+
+    This is intended for offline_mode tests where the resources are 
+    models, e.g. tmpl.examples.ResistorModel, and a run is limited by the 
+    CPU. Each worker gets its own copy of the resources, either by 
+    pickling them or by building them with resource_factory.
+
+    Startup measurements are only run in the first shard and teardown
+    measurements in the last one. Every condition is set at the start of 
+    each shard.
+
+    Parameters
+    ----------
+    manager_class : class
+        Class based on AbstractTestManager
+    resources : dict or any
+        Resources for the test manager, or a description of them if
+        resource_factory is supplied. Must be picklable.
+    resource_factory : function, optional
+        Function that takes resources and returns the resources dict for
+        the test manager, by default None
+    n_shards : int, optional
+        Number of shards, by default None which uses max_workers or the 
+        number of CPUs
+    manager_kwargs : dict, optional
+        Keyword arguments for manager_class, e.g. offline_mode,
+        by default {}
+    max_workers : int, optional
+        Maximum number of worker processes, by default None which uses
+        one per CPU
+
+    Attributes
+    ----------
+    ds_results : xarray Dataset
+        Combined results after run()
+    shards : list of tuple
+        (start, stop) rows of each shard in the last run()
+    errors : dict
+        last_error of each shard that had an error, key is (start, stop)
+    """
+    def __init__(self,manager_class,resources,resource_factory=None,
+                 n_shards=None,manager_kwargs={},max_workers=None) -> None:
+
+        self.manager_class = manager_class
+        self.resources = resources
+        self.resource_factory = resource_factory
+        self.n_shards = n_shards
+        self.manager_kwargs = manager_kwargs
+        self.max_workers = max_workers
+
+        self.ds_results = None
+        self.shards = []
+        self.errors = {}
+
+
+    def __repr__(self):
+        return f'ShardedRunner[{self.manager_class.__name__}]'
+
+
+    def make_shards(self,conditions=None):
+        """
+        Work out the rows of the conditions table for each shard
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            Conditions to run, by default None which uses the test 
+            manager's conditions_table
+
+        Returns
+        -------
+        list of tuple
+            (start, stop) rows of each shard
+        """
+        if conditions:
+            df_conditions = pd.DataFrame(conditions)
+        else:
+            # Build a test manager here just to get its conditions table
+            if self.resource_factory is None:
+                resources = self.resources
+            else:
+                resources = self.resource_factory(self.resources)
+            test = self.manager_class(resources,**self.manager_kwargs)
+            df_conditions = test.conditions_table.to_dataframe()
+
+        n_shards = self.n_shards or self.max_workers or os.cpu_count() or 1
+        return shard_boundaries(df_conditions,n_shards)
+
+
+    def run(self,conditions=None):
+        """
+        Run every shard and combine the results
+
+        Parameters
+        ----------
+        conditions : list of dict, optional
+            Conditions to run, by default None, see AbstractTestManager.run()
+
+        Returns
+        -------
+        xarray Dataset
+            Combined results, None if no shard produced any results
+        """
+        self.errors = {}
+        self.shards = self.make_shards(conditions)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(run_test_manager,self.manager_class,self.resources,
+                                       self.resource_factory,self.manager_kwargs,conditions,rows)
+                       for rows in self.shards]
+
+            results = [future.result() for future in futures]
+
+        datasets = []
+        for rows,(ds,last_error) in zip(self.shards,results):
+            if last_error:
+                self.errors[rows] = last_error
+                print(f'ShardedRunner: rows {rows} finished with errors')
+
+            if ds is not None:
+                datasets.append(ds)
+
+        self.ds_results = combine_partial_datasets(datasets)
+        return self.ds_results
@@ -0,0 +1,690 @@
+'''
+Results storage engines for Test Measure Process Library (TMPL)
+================================================================
+This module defines alternative in-memory stores for the results that
+Measurement classes record with store_data_var() and store_coords().
+
+By default results are written straight into an xarray Dataset. The
+ColumnarResults class instead records every store as rows of integer
+coordinate positions plus a block of data values. The xarray Dataset is
+only built when it is read, which keeps the cost of each store small.
+
+Example of use
+--------------
+
+Switch a measurement to columnar results
+
+>>> meas.columnar_results = True
+>>> meas.run(conditions)
+>>> meas.ds_results  # Dataset is built here
+
+'''
+
+
+#================================================================
+#%% Imports
+#================================================================
+# Third party libraries
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+#================================================================
+#%% Constants
+#================================================================
+# Tags
+TAG_CLASSNAME = 'CLASS_TYPE'
+
+#================================================================
+#%% Functions
+#================================================================
+def match_data_shape(name,data_values,req_shape,coordinates):
+    """
+    Reshape a data array to fit the shape required by a data variable
+    at the selected coordinates.
+
+    Handles the special cases that occur when storing data:
+    * A single value being stored at a single element
+    * 1D vectors with an extra dimension e.g. (N,1) instead of (N,)
+    * Arrays that are transposed relative to the data variable
+
+    Parameters
+    ----------
+    name : str
+        Name of data variable, used for error messages
+    data_values : array
+        Data to be stored, at least 1D
+    req_shape : tuple
+        Shape required by the data variable at the selected coordinates
+    coordinates : dict
+        Coordinates of data variable, used for error messages
+
+    Returns
+    -------
+    array or scalar
+        Data reshaped to req_shape. If req_shape is () then the single
+        value is returned.
+
+    Raises
+    ------
+    ValueError
+        If the data cannot be made to fit the required shape
+    """
+
+    # Special case where there is only one element
+    # for some reason the dataset data variable returns a shape of ()
+    # when there is only one value. This will fail the general case
+    # below because the data_values array has a shape of (1,)
+    if req_shape==():
+        if data_values.size!=1:
+            raise ValueError(f'The data array being entered for [{name}] should only have 1 element to satisfy coordinates {coordinates} not [{data_values.shape}]')
+
+        return data_values.flat[0]
+
+    # Special case of 1D vectors
+    # The req_shape will be (N,) whereas the data_values shape will be (N,1)
+    # or (1,N). In this case we need to squeeze out the extra dimension
+    same_num_elements = np.prod(data_values.shape)==np.prod(req_shape)
+    different_shapes = data_values.shape!=req_shape
+
+    if same_num_elements and different_shapes:
+        data_values = data_values.squeeze()
+
+    # Special case of input array dimensions being transposed compared to
+    # the equivalent Dataset dimensions
+    same_shape_when_transposed = data_values.T.shape == req_shape
+
+    if same_shape_when_transposed:
+        data_values = data_values.T
+
+    # General case
+    # - array has more than one value
+    if data_values.shape!=req_shape:
+        raise ValueError(f'The data array being entered for [{name}/{data_values.shape}] must have a shape [{req_shape}] to satisfy coordinates {coordinates}')
+
+    return data_values
+
+
+def sorted_unique_values(values):
+    """
+    Return the unique values of a list, sorted if possible.
+
+    This gives coordinate values in the same order that xr.merge() would
+    produce when merging conditions one at a time.
+
+    Parameters
+    ----------
+    values : list
+        List of values, repeats allowed
+
+    Returns
+    -------
+    numpy array
+        Unique values
+    """
+    index = pd.Index(values).unique()
+    try:
+        index = index.sort_values()
+    except TypeError:
+        pass
+
+    return np.array(list(index))
+
+
+def combined_dtype(dtypes):
+    """
+    dtype that can hold the values of several arrays without truncating
+    or rounding them, e.g. the widest string or float if any are float.
+
+    Parameters
+    ----------
+    dtypes : list of numpy dtype
+
+    Returns
+    -------
+    numpy dtype
+        Numeric, datetime and string dtypes of one kind are promoted with
+        np.result_type(), any other mix is object
+    """
+    kinds = set([np.dtype(dtype).kind for dtype in dtypes])
+    if kinds<=set('biufc') or len(kinds)==1 and kinds<=set('mMUS'):
+        try:
+            return np.result_type(*dtypes)
+        except TypeError:
+            pass
+
+    return np.dtype(object)
+
+
+def combine_partial_datasets(datasets):
+    """
+    Combine Datasets that each hold part of the results of a test, e.g. 
+    the results of each shard of a conditions table.
+
+    Each coordinate of the combined Dataset is the sorted union of the
+    coordinate values in all of the Datasets. Every data variable is 
+    allocated once at the full size and each Dataset's values are copied
+    into place, so there is none of the intermediate NaN padding of 
+    xr.merge() or xr.combine_by_coords(). Values that are missing (NaN)
+    in one Dataset don't overwrite values from the others.
+
+    The dtype of each data variable can hold the values of every Dataset,
+    see combined_dtype(). If there are gaps then integer and boolean 
+    variables become float and other types become object so the gaps can
+    be NaN.
+
+    Parameters
+    ----------
+    datasets : list of xarray Dataset
+        Partial results, attributes are taken from the first Dataset
+
+    Returns
+    -------
+    xarray Dataset
+        Combined results
+    """
+    datasets = [ds for ds in datasets if ds is not None]
+    if len(datasets)==0:
+        return None
+    if len(datasets)==1:
+        return datasets[0].copy()
+
+    # Union of coordinate values for each dimension
+    indexes = {}
+    for ds in datasets:
+        for dim,index in ds.indexes.items():
+            indexes.setdefault(dim,[]).append(index)
+    coord_values = {dim:sorted_unique_values(np.concatenate([ind.values for ind in index_list])) 
+                    for dim,index_list in indexes.items()}
+    indexes = {dim:pd.Index(values) for dim,values in coord_values.items()}
+
+    # dtype of each variable that holds the values of all Datasets
+    dtypes = {}
+    for ds in datasets:
+        for name,var in ds.variables.items():
+            dtypes.setdefault(name,[]).append(var.dtype)
+    dtypes = {name:combined_dtype(dtype_list) for name,dtype_list in dtypes.items()}
+
+    # Allocate and fill each variable
+    variables = {}
+    coord_names = set()
+    for ds in datasets:
+        for name,var in ds.variables.items():
+            if name in indexes:
+                continue
+            if name in ds.coords:
+                coord_names.add(name)
+
+            if name not in variables:
+                shape = tuple([len(indexes[dim]) if dim in indexes else var.sizes[dim] for dim in var.dims])
+                variables[name] = dict(
+                    dims=var.dims,
+                    attrs=var.attrs,
+                    dtype=dtypes[name],
+                    data=np.empty(shape,dtype=dtypes[name]),
+                    filled=np.zeros(shape,dtype=bool),
+                    )
+            entry = variables[name]
+
+            # Positions of this Dataset's coordinates in the combined ones
+            indexer = np.ix_(*[indexes[dim].get_indexer(ds.indexes[dim]) if dim in indexes 
+                               else np.arange(var.sizes[dim]) for dim in var.dims])
+
+            values = var.values
+            valid = ~pd.isnull(values)
+            if var.dims:
+                data = entry['data'][indexer]
+                filled = entry['filled'][indexer]
+                data[valid] = values[valid]
+                filled |= valid
+                entry['data'][indexer] = data
+                entry['filled'][indexer] = filled
+            elif valid and not entry['filled']:
+                entry['data'][()] = values
+                entry['filled'][()] = True
+
+    # Put NaNs in any gaps
+    for name,entry in variables.items():
+        data = entry['data']
+        if not entry['filled'].all():
+            if data.dtype.kind in 'iub':
+                data = data.astype(float)
+            elif data.dtype.kind not in 'fcmM':
+                data = data.astype(object)
+            data[~entry['filled']] = np.datetime64('NaT') if data.dtype.kind in 'mM' else np.nan
+        variables[name] = xr.Variable(entry['dims'],data,attrs=entry['attrs'])
+
+    coord_attrs = {}
+    for ds in datasets[::-1]:
+        coord_attrs.update({dim:ds[dim].attrs for dim in ds.indexes})
+    coords = {dim:(dim,values,coord_attrs[dim]) for dim,values in coord_values.items()}
+    coords.update({name:variables.pop(name) for name in coord_names})
+
+    return xr.Dataset(variables,coords=coords,attrs=datasets[0].attrs)
+
+
+#================================================================
+#%% Classes
+#================================================================
+class ColumnarResults():
+    """
+    Long format store for measurement results
+
+    Every call to store_data_var() is recorded as a block of rows. The
+    position of each coordinate is kept as an integer, conditions are
+    numbered in the order that they are first set. The data values are
+    kept as numpy arrays. An xarray Dataset is only built when
+    to_dataset() is called and is cached until the next store.
+
+    Later stores at the same coordinates overwrite earlier ones, the same
+    as storing into a Dataset.
+
+    Example usage
+    -------------
+
+    >>> store = ColumnarResults('MyMeasurement')
+    >>> store.set_conditions({'temperature_degC':25})
+    >>> store.store_coords('sweep_V',[0,1,2])
+    >>> store.store_data_var('current_A',[1,2,3],{'temperature_degC':25,'sweep_V':None})
+    >>> store.to_dataset()
+
+    """
+
+    def __init__(self,class_name=''):
+        """
+        Initialise results store
+
+        Parameters
+        ----------
+        class_name : str, optional
+            Name of class that owns the data. This is put into the
+            CLASS_TYPE attribute of every data variable, by default ''
+        """
+        self.class_name = class_name
+        self.clear()
+
+
+    def __repr__(self):
+        return f'ColumnarResults[{self.class_name}]({len(self.data_vars)} data variables)'
+
+
+    def clear(self):
+        """
+        Remove all results
+        """
+        # Coordinates from store_coords()
+        # - name : array of values
+        self.coords = {}
+
+        # Coordinates from set_conditions()
+        # - name : {value:id} in order the values were first set
+        self.conditions = {}
+
+        # Data variables
+        # - name : _ColumnarVariable
+        self.data_vars = {}
+
+        # Cached Dataset
+        self._ds = None
+
+
+    #----------------------------------------------------------------
+    #%% Storing
+    #----------------------------------------------------------------
+    def set_conditions(self,conditions):
+        """
+        Register condition values as coordinates
+
+        Parameters
+        ----------
+        conditions : dict
+            Dictionary of single condition values
+            e.g. conditions = {'temperature_degC':25,'humidity_pc':50}
+        """
+        for name,value in conditions.items():
+            values = self.conditions.setdefault(name,{})
+            if value not in values:
+                values[value] = len(values)
+                self._ds = None
+
+
+    def store_coords(self,name,values):
+        """
+        Add a new coordinate
+
+        Parameters
+        ----------
+        name : str
+            Name of new coordinate, no spaces, ascii
+        values : list or array
+            1D list or array of values for this coordinate
+
+        Raises
+        ------
+        ValueError
+            If the coordinate exists already with different values
+        """
+        values = np.asarray(values)
+
+        if name not in self.coords:
+            self.coords[name] = values
+            self._ds = None
+            return
+
+        # Already exist, then check the values are the same
+        if len(self.coords[name])!=len(values):
+            raise ValueError(f'New values for Dataset coordinate [{name}] has different length to existing values')
+
+        if not all(self.coords[name]==values):
+            raise ValueError(f'Dataset coordinate [{name}] has different values than what is being entered')
+
+
+    def store_data_var(self,name,data_values,coordinates):
+        """
+        Record data for a data variable
+
+        Parameters
+        ----------
+        name : str
+            Name of data variable
+        data_values : list or array
+            Data to be stored
+        coordinates : dict
+            Coordinates of the data variable. Conditions must have a single
+            value. Other coordinates can have a single value or None to
+            take all the values of that coordinate.
+            e.g. {'temperature_degC':25,'press':'low_x','sweep_V':None}
+
+        Raises
+        ------
+        ValueError
+            If coordinates are unknown or the data has the wrong shape
+        """
+        self.store_data_vars({name:data_values},coordinates)
+
+
+    def store_data_vars(self,data,coordinates):
+        """
+        Record data for several data variables that share coordinates
+
+        The coordinate positions are worked out once for the whole batch
+        and all the data is checked before any of it is recorded.
+
+        Parameters
+        ----------
+        data : dict
+            Dictionary of data
+            key: Name of data variable
+            value: list or array of data
+        coordinates : dict
+            Coordinates of the data variables, see store_data_var()
+
+        Raises
+        ------
+        ValueError
+            If coordinates are unknown or the data has the wrong shape
+        """
+        # Check all coordinates exist
+        missing = [c for c in coordinates if c not in self.coords and c not in self.conditions]
+        if missing!=[]:
+            raise ValueError(f'Trying to add to [{", ".join(data)}] data variable with unknown coordinates {missing}')
+
+        # Work out positions and check data
+        # - positions only need to be found once for each set of dimensions
+        # - new data variables have all the coordinates as dimensions
+        new_dims = tuple(coordinates.keys())
+        rows = {}
+        records = []
+        for name,data_values in data.items():
+            dims = self.data_vars[name].dims if name in self.data_vars else new_dims
+            if dims not in rows:
+                rows[dims] = self._coordinate_positions(name,dims,coordinates)
+
+            positions,req_shape,key = rows[dims]
+            data_values = match_data_shape(name,np.atleast_1d(data_values),req_shape,coordinates)
+            records.append((name,positions,np.asarray(data_values),key))
+
+        # Record the data
+        for name,positions,data_values,key in records:
+            if name not in self.data_vars:
+                self.data_vars[name] = _ColumnarVariable(new_dims)
+            self.data_vars[name].append(positions,data_values,key)
+
+        self._ds = None
+
+
+    def _coordinate_positions(self,name,dims,coordinates):
+        """
+        Work out the integer position of each coordinate of a data variable
+
+        Conditions are recorded by their id, coordinates that take all
+        their values are recorded as -1.
+
+        Returns
+        -------
+        positions : list of int
+            Position for each dimension
+        req_shape : tuple
+            Shape of data needed
+        key : tuple
+            Condition ids, used for looking up rows by condition
+        """
+        unknown_dims = [c for c in coordinates if c not in dims]
+        if unknown_dims!=[]:
+            raise ValueError(f'Data variable [{name}] does not have dimensions {unknown_dims}')
+
+        positions = []
+        req_shape = []
+        for dim in dims:
+            value = coordinates.get(dim,None)
+            if dim in self.conditions:
+                positions.append(self.conditions[dim][value])
+            elif value is None:
+                positions.append(-1)
+                req_shape.append(len(self.coords[dim]))
+            else:
+                positions.append(self._coord_position(dim,value))
+
+        return positions,tuple(req_shape),self._condition_key(dims,coordinates)
+
+
+    def _coord_position(self,dim,value):
+        """
+        Return the integer position of a value in a coordinate
+        """
+        matches = np.nonzero(self.coords[dim]==value)[0]
+        if len(matches)==0:
+            raise KeyError(f'Value [{value}] is not in coordinate [{dim}]')
+
+        return matches[0]
+
+
+    def _condition_key(self,dims,conditions):
+        """
+        Make a lookup key from the condition ids of a set of dimensions
+        """
+        return tuple([self.conditions[d][conditions[d]] for d in dims if d in self.conditions])
+
+
+    #----------------------------------------------------------------
+    #%% Dataset conversion
+    #----------------------------------------------------------------
+    @property
+    def coord_names(self):
+        """
+        List of all coordinate names
+        """
+        return list(self.conditions.keys()) + list(self.coords.keys())
+
+
+    def to_dataset(self,conditions=None):
+        """
+        Build xarray Dataset from the stored results
+
+        Parameters
+        ----------
+        conditions : dict, optional
+            If supplied then only the results at these conditions are
+            included. The condition coordinates will only contain the
+            requested values, by default None
+
+        Returns
+        -------
+        xarray Dataset or None
+            Dataset of results, None if nothing has been stored
+        """
+        if len(self.conditions)==0 and len(self.coords)==0:
+            return None
+
+        if conditions is None and self._ds is not None:
+            return self._ds
+
+        # Coordinates
+        # ==============================
+        coord_values = dict(self.coords)
+
+        # Condition values are sorted, as xr.merge() would, the id_to_pos
+        # arrays convert a condition id into its sorted position
+        id_to_pos = {}
+        for name,values in self.conditions.items():
+            if conditions is not None and name in conditions:
+                # Single selected value
+                coord_values[name] = np.array([conditions[name]])
+                id_to_pos[name] = np.full(len(values),-1)
+                if conditions[name] in values:
+                    id_to_pos[name][values[conditions[name]]] = 0
+                continue
+
+            sorted_values = sorted_unique_values(list(values.keys()))
+            coord_values[name] = sorted_values
+            id_to_pos[name] = pd.Index(sorted_values).get_indexer(list(values.keys()))
+
+        # Data variables
+        # ==============================
+        ds = xr.Dataset(coords=coord_values)
+        for name,var in self.data_vars.items():
+            shape = tuple([len(coord_values[d]) for d in var.dims])
+            mapping = [id_to_pos.get(d,None) for d in var.dims]
+
+            # Look up the rows for the selected conditions directly
+            rows = None
+            cond_dims = [d for d in var.dims if d in self.conditions]
+            if conditions is not None and all([d in conditions for d in cond_dims]):
+                key = tuple([self.conditions[d].get(conditions[d],-1) for d in cond_dims])
+                rows = var.index.get(key,[])
+
+            ds[name] = (list(var.dims),var.to_array(shape,mapping,rows))
+            ds[name].attrs[TAG_CLASSNAME] = self.class_name
+
+        if conditions is None:
+            self._ds = ds
+
+        return ds
+
+
+
+class _ColumnarVariable():
+    """
+    Rows of a single data variable in a ColumnarResults store.
+
+    Each store adds one row to the positions array. This holds the integer
+    position of every dimension with a single value, or -1 for dimensions
+    that take all their values. The data for the -1 dimensions is held as
+    a block in the blocks list.
+    """
+    __slots__ = ('dims','positions','blocks','size','index')
+
+    def __init__(self,dims):
+        self.dims = dims
+
+        # Columns of integer positions, grown by doubling
+        self.positions = np.empty((16,len(dims)),dtype=np.int64)
+        self.size = 0
+
+        # Data block for each row
+        self.blocks = []
+
+        # Row numbers for each combination of condition ids
+        self.index = {}
+
+
+    def append(self,positions,block,condition_key):
+        """
+        Record one store as a row
+        """
+        if self.size==len(self.positions):
+            self.positions = np.concatenate([self.positions,np.empty_like(self.positions)])
+
+        self.positions[self.size] = positions
+        self.blocks.append(block)
+        self.index.setdefault(condition_key,[]).append(self.size)
+        self.size += 1
+
+
+    def to_array(self,shape,id_to_pos,rows=None):
+        """
+        Build the full array of data, NaN where there is no data
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of full array
+        id_to_pos : list
+            For each dimension either None or an array mapping condition id
+            to position. Conditions that map to -1 are left out.
+        rows : list of int, optional
+            Rows to use, by default None for all rows
+
+        Returns
+        -------
+        numpy array
+        """
+        row_numbers = np.arange(self.size) if rows is None else np.asarray(rows,dtype=np.int64)
+        positions = self.positions[row_numbers]
+        full = positions<0
+
+        # Data type that can hold NaN as well as the data
+        dtype = np.result_type(np.float64,*set([self.blocks[i].dtype for i in row_numbers]))
+        if not np.issubdtype(dtype,np.number):
+            dtype = object
+        data = np.full(shape,np.nan,dtype=dtype)
+
+        # Convert condition ids to positions
+        keep = np.ones(len(row_numbers),dtype=bool)
+        for axis,mapping in enumerate(id_to_pos):
+            if mapping is None:
+                continue
+            positions[:,axis] = mapping[positions[:,axis]]
+            keep &= positions[:,axis]>=0
+
+        row_numbers,positions,full = row_numbers[keep],positions[keep],full[keep]
+        if len(row_numbers)==0:
+            return data
+
+        # Mixed patterns of single valued dimensions
+        # - write each row in order so later rows overwrite earlier ones
+        if not (full==full[0]).all():
+            for row,pos,row_full in zip(row_numbers,positions,full):
+                index = tuple([slice(None) if f else p for p,f in zip(pos,row_full)])
+                data[index] = self.blocks[row]
+            return data
+
+        # Single pattern
+        # - write all rows in one go, keeping only the last row at
+        #   each position
+        single_axes = [a for a in range(len(shape)) if not full[0][a]]
+        full_axes = [a for a in range(len(shape)) if full[0][a]]
+
+        if len(single_axes)==0:
+            data[...] = self.blocks[row_numbers[-1]]
+            return data
+
+        flat = np.ravel_multi_index(positions[:,single_axes].T,[shape[a] for a in single_axes])
+        _,last = np.unique(flat[::-1],return_index=True)
+        select = np.sort(len(flat)-1-last)
+
+        view = data.transpose(single_axes + full_axes)
+        block = np.stack([self.blocks[row] for row in row_numbers[select]])
+        view[tuple([positions[select,a] for a in single_axes])] = block
+
+        return data
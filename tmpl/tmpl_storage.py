@@ -3,6 +3,33 @@ Storage functions for Test Measure Process Library (TMPL)
 ================================================================
 This module defines a class that gets bolted onto xarray datasets
 to provide storage methods.
+
+It also defines ResultsSink, which writes results to disk in chunks
+while a test is running.
+
+Numpy directory format
+----------------------
+dataset_to_npy_dir() saves each data variable to its own .npy file in a
+directory, with the coordinates and attributes in a 'dataset.json' file.
+npy_dir_to_dataset(path,mmap=True) memory maps the .npy files, so the
+data variables are not read into memory until they are used and only 
+the parts that are used are read. Many large runs can be opened side by
+side this way. Every save writes new .npy files, because Windows does 
+not allow a memory mapped file to be replaced or removed.
+
+Parquet export
+--------------
+dataset_to_parquet() writes each measurement's results as a long format
+table, one row per populated set of coordinates, so sparse results are
+not expanded to every combination of conditions. This needs the optional
+pyarrow package.
+
+Compression
+-----------
+JSON files can be compressed with gzip, lzma or zstd (needs the optional
+zstandard package). The codec is found from the first bytes of the file
+when it is loaded. netCDF files are compressed with gzip chunk by chunk,
+so parts of a variable can be read without decompressing all of it.
 '''
  
  
@@ -11,21 +38,355 @@ to provide storage methods.
 #================================================================
 # Standard library
 import os, time
+import glob
+import uuid
 import json
+import base64
+import importlib.util
+import gzip
+import lzma
  
 # Third party libraries
 import numpy as np
 import pandas as pd
 import xarray as xr
+
+# Local libraries
+from .tmpl_results import combine_partial_datasets,TAG_CLASSNAME
  
 #================================================================
 #%% Constants
 #================================================================
+SINK_CHUNK_PREFIX = 'chunk_'
+
+# Compact JSON format tag
+COMPACT_JSON_FORMAT = 'tmpl_compact_json'
+
+# dtype kinds that are stored as binary in compact JSON
+# - bool, int, uint, float, complex, timedelta, datetime
+BINARY_KINDS = 'biufcmM'
+
+# Dataset attribute that holds the index of data variables by CLASS_TYPE
+VARIABLE_INDEX_ATTR = 'tmpl_variable_index'
+
+# Numpy directory format tag and metadata file
+NPY_DIR_FORMAT = 'tmpl_npy_dir'
+NPY_DIR_METADATA = 'dataset.json'
+NPY_DIR_VAR_PREFIX = 'var_'
+
+# Parquet export
+PARQUET_EXTENSION = '.parquet'
+PARQUET_ROW_GROUP_SIZE = 100000
+UNTAGGED_CLASS_TYPE = 'untagged'
+
+# Excel export
+EXCEL_MAX_ROWS = 1048576
+EXCEL_MAX_SHEET_NAME = 31
+EXCEL_ROWS_PER_CHUNK = 10000
+EXCEL_SUMMARY_SHEET = 'summary'
+
+# Compression codecs, the magic bytes at the start of their files and 
+# their usual file extension
+COMPRESSION_MAGIC = {'gzip':b'\x1f\x8b','lzma':b'\xfd7zXZ\x00','zstd':b'\x28\xb5\x2f\xfd'}
+COMPRESSION_EXTENSIONS = {'gzip':'.gz','lzma':'.xz','zstd':'.zst'}
+NETCDF_COMPLEVEL = 4
+
+# File extensions of binary netCDF/HDF5 files
+NETCDF_EXTENSIONS = ['.nc','.nc4','.h5','.hdf5']
  
 #================================================================
 #%% Functions
 #================================================================
-def dataset_to_json_str(ds):
+def encode_array(values):
+    """
+    Encode an array for compact JSON
+    Numeric, bool and datetime arrays are stored as base64 encoded bytes,
+    which are written and read in one go. Other arrays, e.g. strings, are
+    stored as a flat list.
+
+    Parameters
+    ----------
+    values : numpy array
+        Array to encode
+
+    Returns
+    -------
+    dict
+        dtype, shape and either base64 or values
+    """
+    values = np.asarray(values)
+    encoded = dict(dtype=values.dtype.str,shape=list(values.shape))
+
+    if values.dtype.kind in BINARY_KINDS:
+        encoded['base64'] = base64.b64encode(np.ascontiguousarray(values).tobytes()).decode('ascii')
+    else:
+        encoded['dtype'] = 'object' if values.dtype.kind=='O' else values.dtype.str
+        encoded['values'] = values.ravel().tolist()
+
+    return encoded
+
+
+def decode_array(encoded):
+    """
+    Decode an array stored with encode_array()
+
+    Parameters
+    ----------
+    encoded : dict
+        Encoded array
+
+    Returns
+    -------
+    numpy array
+    """
+    if 'base64' in encoded:
+        # bytearray makes the array writeable
+        values = np.frombuffer(bytearray(base64.b64decode(encoded['base64'])),dtype=np.dtype(encoded['dtype']))
+    else:
+        values = np.empty(len(encoded['values']),dtype=np.dtype(encoded['dtype']))
+        values[:] = encoded['values']
+
+    return values.reshape(encoded['shape'])
+
+
+def compression_codecs():
+    """
+    Compression codecs that are available, zstd needs the optional 
+    zstandard package
+
+    Returns
+    -------
+    list of str
+    """
+    codecs = ['gzip','lzma']
+    if importlib.util.find_spec('zstandard') is not None:
+        codecs.append('zstd')
+    return codecs
+
+
+def detect_compression(filename):
+    """
+    Find the compression codec of a file from its first bytes
+
+    Parameters
+    ----------
+    filename : str
+        Full path/filename
+
+    Returns
+    -------
+    str or None
+        Codec name, None if the file is not compressed
+    """
+    with open(filename,'rb') as f:
+        start = f.read(8)
+
+    for codec,magic in COMPRESSION_MAGIC.items():
+        if start.startswith(magic):
+            return codec
+
+    return None
+
+
+def open_compressed(filename,mode='r',compression=None):
+    """
+    Open a text file that may be compressed
+
+    Parameters
+    ----------
+    filename : str
+        Full path/filename
+    mode : str, optional
+        'r' or 'w', by default 'r'
+    compression : str, optional
+        Codec used to write the file, 'gzip', 'lzma' or 'zstd', by default
+        None which writes uncompressed. When reading the codec is found
+        from the file.
+
+    Returns
+    -------
+    file object
+
+    Raises
+    ------
+    ValueError
+        If the codec is not known
+    ImportError
+        If zstd is used and zstandard is not installed
+    """
+    if mode=='r':
+        compression = detect_compression(filename)
+
+    if compression is None:
+        return open(filename,mode)
+    if compression=='gzip':
+        return gzip.open(filename,mode+'t')
+    if compression=='lzma':
+        return lzma.open(filename,mode+'t')
+    if compression=='zstd':
+        if 'zstd' not in compression_codecs():
+            raise ImportError('zstd compression needs the zstandard package to be installed')
+        import zstandard
+        return zstandard.open(filename,mode+'t')
+
+    raise ValueError(f'Unknown compression [{compression}], options are {list(COMPRESSION_MAGIC)}')
+
+
+def variable_index(ds):
+    """
+    Index of the data variables in a dataset by the class that made them,
+    i.e. their CLASS_TYPE attribute. Made in one pass over the variables.
+
+    Parameters
+    ----------
+    ds : xarray Dataset
+        Dataset to index
+
+    Returns
+    -------
+    dict
+        {class name : [variable names]}, untagged variables are left out
+    """
+    index = {}
+    for name,var in ds.data_vars.items():
+        class_type = var.attrs.get(TAG_CLASSNAME,None)
+        if class_type is not None:
+            index.setdefault(class_type,[]).append(name)
+
+    return index
+
+
+def indexed_attrs(ds):
+    """
+    Dataset attributes with the variable index added, for saving to file
+    The index is stored as a JSON string so that every file format can 
+    hold it.
+
+    Parameters
+    ----------
+    ds : xarray Dataset
+        Dataset being saved
+
+    Returns
+    -------
+    dict
+        Copy of ds.attrs
+    """
+    attrs = dict(ds.attrs)
+    attrs[VARIABLE_INDEX_ATTR] = json.dumps(variable_index(ds))
+    return attrs
+
+
+def select_class_type(attrs,data_var_attrs,class_type):
+    """
+    Names of the data variables made by one class, read from the variable
+    index in a file's attributes. Files saved without an index are 
+    searched variable by variable.
+
+    Parameters
+    ----------
+    attrs : dict
+        Dataset attributes read from the file
+    data_var_attrs : dict
+        {variable name : attributes} of the data variables, only used if
+        there is no index
+    class_type : str
+        Class name, as in the CLASS_TYPE attribute
+
+    Returns
+    -------
+    list of str
+        Variable names
+    """
+    if VARIABLE_INDEX_ATTR in attrs:
+        return json.loads(attrs[VARIABLE_INDEX_ATTR]).get(class_type,[])
+
+    return [name for name,var_attrs in data_var_attrs.items() 
+            if var_attrs.get(TAG_CLASSNAME,None)==class_type]
+
+
+def split_by_class_type(ds):
+    """
+    Split a dataset into one dataset for each class that made its data 
+    variables. Equivalent to ds.filter_by_attrs(CLASS_TYPE=name) for every
+    class, but only goes through the variables once.
+
+    Parameters
+    ----------
+    ds : xarray Dataset
+        Dataset containing data variables tagged with CLASS_TYPE
+
+    Returns
+    -------
+    dict
+        {class name : xarray Dataset}
+    """
+    return {class_type:ds[names] for class_type,names in variable_index(ds).items()}
+
+
+def json_default(value):
+    """
+    Convert numpy values in attributes into types JSON can store
+    Used as the default argument of json.dump()
+    """
+    if isinstance(value,np.ndarray):
+        return value.tolist()
+    if hasattr(value,'item'):
+        return value.item()
+    return str(value)
+
+
+def dataset_to_compact_dict(ds):
+    """
+    Convert xarray dataset to a dict for compact JSON
+    Arrays are encoded with encode_array()
+
+    Parameters
+    ----------
+    ds : xarray Dataset
+        Dataset to convert
+
+    Returns
+    -------
+    dict
+    """
+    def encode_variables(variables):
+        return {name:dict(dims=list(var.dims),attrs=dict(var.attrs),data=encode_array(var.values)) 
+                for name,var in variables.items()}
+
+    return dict(
+        format=COMPACT_JSON_FORMAT,
+        attrs=indexed_attrs(ds),
+        coords=encode_variables(ds.coords),
+        data_vars=encode_variables(ds.data_vars),
+        )
+
+
+def compact_dict_to_dataset(json_dict):
+    """
+    Convert a dict made by dataset_to_compact_dict() back to a dataset
+
+    Parameters
+    ----------
+    json_dict : dict
+        Compact dict
+
+    Returns
+    -------
+    xarray Dataset
+    """
+    def decode_variables(variables):
+        return {name:(var['dims'],decode_array(var['data']),var['attrs']) for name,var in variables.items()}
+
+    attrs = dict(json_dict['attrs'])
+    attrs.pop(VARIABLE_INDEX_ATTR,None)
+
+    return xr.Dataset(data_vars=decode_variables(json_dict['data_vars']),
+                      coords=decode_variables(json_dict['coords']),
+                      attrs=attrs)
+
+
+def dataset_to_json_str(ds,compact=False):
     """
     Store xarray dataset to JSON string
 
@@ -35,6 +396,10 @@ def dataset_to_json_str(ds):
     ds : xarray Dataset
         Dataset to store
 
+    compact : bool, optional
+        Store numeric arrays as base64 encoded binary, by default False,
+        see dataset_to_json()
+
     Returns
     -------
 
@@ -46,15 +411,18 @@ def dataset_to_json_str(ds):
     >>> dataset_to_json_str(ds)
 
     """
+    if compact:
+        return json.dumps(dataset_to_compact_dict(ds),default=json_default)
 
     # Convert Dataset to dict
     json_dict = ds.to_dict()
+    json_dict['attrs'] = indexed_attrs(ds)
 
     # Return the json string of dict
     return json.dumps(json_dict)
 
 
-def dataset_to_json(filename, ds):
+def dataset_to_json(filename, ds, compact=False, compression=None):
     """
     Store xarray dataset to JSON file
 
@@ -66,20 +434,36 @@ def dataset_to_json(filename, ds):
     ds : xarray Dataset
         Dataset to store
 
+    compact : bool, optional
+        Store numeric arrays as base64 encoded binary with their dtype and
+        shape and leave out the indentation, by default False. This is
+        much smaller and faster to save and load than writing every value
+        as text. json_to_dataset() loads both formats.
+
+    compression : str, optional
+        Compress the file with 'gzip', 'lzma' or 'zstd', by default None.
+        json_to_dataset() finds the codec from the file.
+
     Example
     --------
 
     >>> dataset_to_json(filename,ds)
 
     """
+    if compact:
+        with open_compressed(filename,"w",compression) as write_file:
+            json.dump(dataset_to_compact_dict(ds),write_file,default=json_default)
+        return
+
     # Convert Dataset to dict, then store dict in JSON file
     json_dict = ds.to_dict()
+    json_dict['attrs'] = indexed_attrs(ds)
 
-    with open(filename, "w") as write_file:
+    with open_compressed(filename,"w",compression) as write_file:
         json.dump(json_dict, write_file,indent=4)
 
 # -----------------------------------------------------------------------------
-def json_to_dataset(filename,field=None):
+def json_to_dataset(filename,field=None,class_type=None):
     """
     Load xarray dataset that has been stored as a JSON file and convert
     back to a dataset
@@ -92,6 +476,10 @@ def json_to_dataset(filename,field=None):
     field : str
         optional string giving the field in the JSON file that is a Dataset
 
+    class_type : str
+        optional class name, only the data variables tagged with this 
+        CLASS_TYPE are converted
+
     Returns
     --------
     ds : xarray Dataset
@@ -104,24 +492,799 @@ def json_to_dataset(filename,field=None):
 
     json_dict = None
 
-    # Read file
+    # Read file, uncompressing if necessary
     # =============
-    with open(filename, "r") as read_file:
+    with open_compressed(filename,"r") as read_file:
         json_dict = json.load(read_file)
 
     try:
         if field:
-            ds = xr.Dataset.from_dict(json_dict[field])
+            json_dict = json_dict[field]
+
+        # Only convert the variables for one class
+        names = None
+        if class_type is not None:
+            data_vars = json_dict['data_vars']
+            names = select_class_type(json_dict.get('attrs',{}),
+                                      {name:var.get('attrs',{}) for name,var in data_vars.items()},
+                                      class_type)
+            json_dict = dict(json_dict,data_vars={name:data_vars[name] for name in names})
+
+        if json_dict.get('format',None)==COMPACT_JSON_FORMAT:
+            ds = compact_dict_to_dataset(json_dict)
         else:
             ds = xr.Dataset.from_dict(json_dict)
+            ds.attrs.pop(VARIABLE_INDEX_ATTR,None)
+
+        # Drop coordinates not used by the selected variables
+        if names is not None:
+            ds = ds[names]
     except:
         raise RuntimeError('Cannot load data from [%s]' % filename)
 
     return ds
+
+
+def netcdf_engine():
+    """
+    Choose the library used to read and write netCDF4/HDF5 files, either
+    netCDF4 or h5netcdf, whichever is installed.
+
+    Returns
+    -------
+    str
+        xarray engine name
+
+    Raises
+    ------
+    ImportError
+        If neither library is installed
+    """
+    for engine,module in [('netcdf4','netCDF4'),('h5netcdf','h5netcdf')]:
+        if importlib.util.find_spec(module) is not None:
+            return engine
+
+    raise ImportError('Saving to netCDF needs the netCDF4 or h5netcdf package to be installed')
+
+
+def dataset_to_netcdf(filename, ds, compression=None):
+    """
+    Store xarray dataset to a binary netCDF4/HDF5 file
+    Data is stored in its binary form so this is much smaller and faster
+    than JSON. All attributes, e.g. CLASS_TYPE tags, are kept.
+
+    Parameters
+    ------------
+    filename : str
+        Full path/filename
+
+    ds : xarray Dataset
+        Dataset to store
+
+    compression : str, optional
+        'gzip' to compress the numeric data variables, by default None.
+        Each chunk of a variable is compressed separately, so reading
+        part of a variable only decompresses the chunks it needs.
+
+    Example
+    --------
+
+    >>> dataset_to_netcdf(filename,ds)
+
+    """
+    engine = netcdf_engine()
+
+    encoding = {}
+    if compression=='gzip':
+        if engine=='netcdf4':
+            options = dict(zlib=True,complevel=NETCDF_COMPLEVEL)
+        else:
+            options = dict(compression='gzip',compression_opts=NETCDF_COMPLEVEL)
+        encoding = {name:options for name,var in ds.data_vars.items() if var.dtype.kind in BINARY_KINDS}
+    elif compression is not None:
+        raise ValueError(f'netCDF files can only be compressed with gzip, not [{compression}]')
+
+    ds.copy(deep=False).assign_attrs(indexed_attrs(ds)).to_netcdf(filename,engine=engine,encoding=encoding)
+
+
+def netcdf_to_dataset(filename,class_type=None):
+    """
+    Load xarray dataset that has been stored as a netCDF4/HDF5 file
+    The data is read into memory and the file is closed.
+
+    Parameters
+    ------------
+    filename : str
+        Full path/filename
+
+    class_type : str
+        optional class name, only the data variables tagged with this 
+        CLASS_TYPE are read from the file
+
+    Returns
+    --------
+    ds : xarray Dataset
+
+    """
+    assert os.path.exists(filename), 'Cannot find results file [%s]' % filename
+
+    with xr.open_dataset(filename,engine=netcdf_engine()) as ds:
+        if class_type is not None:
+            ds = ds[select_class_type(ds.attrs,
+                                      {name:var.attrs for name,var in ds.data_vars.items()},
+                                      class_type)]
+        ds = ds.load()
+
+    ds.attrs.pop(VARIABLE_INDEX_ATTR,None)
+    return ds
+
+
+def dataset_to_npy_dir(path, ds):
+    """
+    Store xarray dataset to a directory of numpy .npy files, one for each
+    data variable, that npy_dir_to_dataset() can memory map.
+
+    Coordinates, attributes and any data variables that can't be memory
+    mapped, e.g. strings, are stored in a 'dataset.json' file using the
+    compact JSON encoding.
+
+    Every save writes .npy files with new names and the 'dataset.json' 
+    file is replaced last, so a directory that is memory mapped by a 
+    loaded dataset can be saved over. The .npy files of earlier saves are
+    then removed, except on Windows where files that are still mapped 
+    can't be removed. These are left in the directory and removed by a 
+    later save.
+
+    Parameters
+    ------------
+    path : str
+        Directory, created if it does not exist
+
+    ds : xarray Dataset
+        Dataset to store
+
+    Example
+    --------
+
+    >>> dataset_to_npy_dir('C:/results/run_01',ds)
+
+    """
+    os.makedirs(path,exist_ok=True)
+    old_files = glob.glob(os.path.join(path,f'{NPY_DIR_VAR_PREFIX}*.npy'))
+    save_id = uuid.uuid4().hex[:8]
+
+    data_vars = {}
+    for i,(name,var) in enumerate(ds.data_vars.items()):
+        values = var.values
+        data_vars[name] = dict(dims=list(var.dims),attrs=dict(var.attrs))
+
+        if values.dtype.kind not in BINARY_KINDS:
+            data_vars[name]['data'] = encode_array(values)
+            continue
+
+        data_vars[name]['file'] = f'{NPY_DIR_VAR_PREFIX}{save_id}_{i:06d}.npy'
+        with open(os.path.join(path,data_vars[name]['file']),'wb') as f:
+            np.save(f,values)
+
+    json_dict = dataset_to_compact_dict(ds.drop_vars(list(ds.data_vars)))
+    json_dict.update(format=NPY_DIR_FORMAT,attrs=indexed_attrs(ds),data_vars=data_vars)
+
+    temp_filename = os.path.join(path,NPY_DIR_METADATA+'.tmp')
+    with open(temp_filename,'w') as f:
+        json.dump(json_dict,f,default=json_default)
+    os.replace(temp_filename,os.path.join(path,NPY_DIR_METADATA))
+
+    # Remove variables left from earlier saves
+    for filename in old_files:
+        try:
+            os.remove(filename)
+        except PermissionError:
+            # Still memory mapped on Windows
+            pass
+
+
+def npy_dir_to_dataset(path,class_type=None,mmap=False):
+    """
+    Load xarray dataset that has been stored with dataset_to_npy_dir()
+
+    Parameters
+    ------------
+    path : str
+        Directory
+
+    class_type : str
+        optional class name, only the data variables tagged with this
+        CLASS_TYPE are loaded
+
+    mmap : bool
+        If True then data variables are memory mapped numpy arrays that
+        the dataset wraps without copying, by default False which reads 
+        them into memory. The mapping is copy-on-write, changing values
+        in the dataset does not change the files.
+
+    Returns
+    --------
+    ds : xarray Dataset
+
+    """
+    filename = os.path.join(path,NPY_DIR_METADATA)
+    assert os.path.exists(filename), 'Cannot find results file [%s]' % filename
+
+    with open(filename,'r') as read_file:
+        json_dict = json.load(read_file)
+
+    data_vars = json_dict['data_vars']
+    if class_type is None:
+        names = list(data_vars)
+    else:
+        names = select_class_type(json_dict['attrs'],
+                                  {name:var['attrs'] for name,var in data_vars.items()},
+                                  class_type)
+
+    def load_variable(var):
+        if 'file' in var:
+            values = np.load(os.path.join(path,var['file']),mmap_mode='c' if mmap else None)
+        else:
+            values = decode_array(var['data'])
+        return (var['dims'],values,var['attrs'])
+
+    ds = compact_dict_to_dataset(dict(json_dict,data_vars={}))
+    ds = ds.assign({name:load_variable(data_vars[name]) for name in names})
+
+    # Drop coordinates not used by the selected variables
+    if class_type is not None:
+        ds = ds[names]
+
+    return ds
+
+
+def import_pyarrow():
+    """
+    Import the optional pyarrow package, used for Parquet export
+
+    Returns
+    -------
+    tuple
+        (pyarrow, pyarrow.parquet) modules
+
+    Raises
+    ------
+    ImportError
+        If pyarrow is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Saving to Parquet needs the pyarrow package to be installed')
+
+    return pyarrow,pyarrow.parquet
+
+
+def arrow_type(pa,values):
+    """
+    Arrow type used for a column of values in a Parquet export
+    Strings and other objects are dictionary encoded categories.
+
+    Parameters
+    ----------
+    pa : module
+        pyarrow
+    values : numpy array
+        Column values
+
+    Returns
+    -------
+    pyarrow DataType
+    """
+    if values.dtype.kind in BINARY_KINDS:
+        return pa.from_numpy_dtype(values.dtype)
+
+    return pa.dictionary(pa.int32(),pa.string())
+
+
+def arrow_array(pa,values,arrow_type):
+    """
+    Convert numpy values to an arrow array, NaN and NaT become null
+
+    Parameters
+    ----------
+    pa : module
+        pyarrow
+    values : numpy array
+        Values
+    arrow_type : pyarrow DataType
+        Type from arrow_type()
+
+    Returns
+    -------
+    pyarrow Array
+    """
+    if pa.types.is_dictionary(arrow_type):
+        values = [None if pd.isnull(value) else str(value) for value in values.tolist()]
+        return pa.array(values,type=pa.string()).dictionary_encode().cast(arrow_type)
+
+    return pa.array(values,type=arrow_type,from_pandas=True)
+
+
+def dataset_to_parquet(path, ds, class_type=None, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    """
+    Export xarray dataset to Parquet files in long format, one file for 
+    each measurement or conditions class, i.e. CLASS_TYPE of the data 
+    variables. Variables without a CLASS_TYPE go in 'untagged.parquet'.
+
+    Each row is one set of coordinates where at least one data variable
+    has a value, so results that are mostly NaN, e.g. from measurements
+    that only run at some conditions, are not expanded into every 
+    combination of coordinates as ds.to_dataframe() does. There is a 
+    column for each coordinate (the conditions) and each data variable.
+    Columns for dimensions that a variable does not have are null.
+    Strings are stored as dictionary encoded categories.
+
+    Rows are written in batches of about row_group_size, so the full table
+    is never held in memory.
+
+    Parameters
+    ------------
+    path : str
+        Directory for the Parquet files, created if it does not exist
+
+    ds : xarray Dataset
+        Dataset to export
+
+    class_type : str
+        optional class name, only export this class's data variables
+
+    row_group_size : int
+        optional number of cells of the dataset to convert in each batch
+
+    Returns
+    --------
+    list of str
+        Parquet filenames
+
+    Example
+    --------
+
+    >>> dataset_to_parquet('C:/results/run_01_parquet',ds)
+
+    """
+    pa,pq = import_pyarrow()
+
+    # Variables for each class
+    groups = variable_index(ds)
+    tagged = set(name for names in groups.values() for name in names)
+    untagged = [name for name in ds.data_vars if name not in tagged]
+    if untagged:
+        groups[UNTAGGED_CLASS_TYPE] = untagged
+    if class_type is not None:
+        groups = {class_type:groups.get(class_type,[])}
+
+    os.makedirs(path,exist_ok=True)
+    filenames = []
+    for group_name,names in groups.items():
+        if len(names)==0:
+            continue
+
+        ds_group = ds[names]
+        dims = list(ds_group.dims)
+        coords = {dim:ds_group[dim].values for dim in dims}
+
+        # Every batch is written with the same schema
+        fields = [pa.field(dim,arrow_type(pa,coords[dim])) for dim in dims]
+        fields += [pa.field(name,arrow_type(pa,ds_group[name].values)) for name in names]
+        schema = pa.schema(fields)
+
+        # Coordinate dictionaries, shared by every batch
+        dictionaries = {dim:arrow_array(pa,coords[dim],schema.field(dim).type).dictionary
+                        for dim in dims if pa.types.is_dictionary(schema.field(dim).type)}
+
+        # Variables with the same dimensions are converted together
+        var_dims = {}
+        for name in names:
+            var_dims.setdefault(ds_group[name].dims,[]).append(name)
+
+        filename = os.path.join(path,group_name+PARQUET_EXTENSION)
+        with pq.ParquetWriter(filename,schema) as writer:
+            for group_dims,group_names in var_dims.items():
+                # Scalar variables are one row
+                values = [np.atleast_1d(ds_group[name].values) for name in group_names]
+                shape = values[0].shape
+
+                # Split the first dimension into batches
+                step = max(1,row_group_size//max(1,int(np.prod(shape[1:]))))
+
+                for start in range(0,shape[0],step):
+                    batch = [val[start:start+step] for val in values]
+
+                    # Populated cells
+                    populated = np.zeros(batch[0].shape,dtype=bool)
+                    for val in batch:
+                        populated |= ~pd.isnull(val)
+                    cells = np.nonzero(populated)
+                    nRows = len(cells[0])
+                    if nRows==0:
+                        continue
+
+                    # Position along each dimension of each row
+                    positions = {dim:cell for dim,cell in zip(group_dims,cells)}
+                    if group_dims:
+                        positions[group_dims[0]] = positions[group_dims[0]]+start
+
+                    columns = []
+                    for field in schema:
+                        if field.name in positions:
+                            if field.name in dictionaries:
+                                indices = pa.array(positions[field.name].astype(np.int32))
+                                columns.append(pa.DictionaryArray.from_arrays(indices,dictionaries[field.name]))
+                            else:
+                                columns.append(arrow_array(pa,coords[field.name][positions[field.name]],field.type))
+                        elif field.name in group_names:
+                            val = batch[group_names.index(field.name)]
+                            columns.append(arrow_array(pa,val[cells],field.type))
+                        else:
+                            columns.append(pa.nulls(nRows,type=field.type))
+
+                    writer.write_table(pa.Table.from_arrays(columns,schema=schema))
+
+        filenames.append(filename)
+
+    return filenames
+
+
+def excel_values(values):
+    """
+    Convert numpy values to a list that xlsxwriter can write
+    NaN and NaT become None, which leaves the cell blank.
+
+    Parameters
+    ----------
+    values : numpy array
+        1D array
+
+    Returns
+    -------
+    list
+    """
+    if values.dtype.kind=='M':
+        values = pd.to_datetime(values).to_pydatetime()
+
+    return [None if pd.isnull(value) else value for value in values.tolist()]
+
+
+def excel_sheet_names(name,nSheets,used_names):
+    """
+    Names of the sheets for one data variable, made unique and valid for
+    Excel. Extra sheets are numbered, e.g. 'current', 'current_2'.
+
+    Parameters
+    ----------
+    name : str
+        Data variable name
+    nSheets : int
+        Number of sheets needed
+    used_names : set
+        Sheet names already used, lower case. Updated with the new names.
+
+    Returns
+    -------
+    list of str
+    """
+    base = ''.join(['_' if c in '[]:*?/\\' else c for c in str(name)])
+    names = []
+    for i in range(nSheets):
+        suffix = '' if i==0 else f'_{i+1}'
+        sheet_name = base[:EXCEL_MAX_SHEET_NAME-len(suffix)]+suffix
+
+        # Make unique, Excel sheet names are not case sensitive
+        n = 1
+        while sheet_name.lower() in used_names:
+            n += 1
+            extra = f'{suffix}~{n}'
+            sheet_name = base[:EXCEL_MAX_SHEET_NAME-len(extra)]+extra
+
+        used_names.add(sheet_name.lower())
+        names.append(sheet_name)
+
+    return names
+
+
+def dataset_to_excel(filename, ds, rows_per_chunk=EXCEL_ROWS_PER_CHUNK, max_rows=EXCEL_MAX_ROWS):
+    """
+    Save xarray dataset to an Excel file, each data variable on its own 
+    sheet with a column for each dimension and one for the values.
+
+    Rows are converted and written a chunk at a time with xlsxwriter in
+    constant memory mode, so memory use does not grow with the size of
+    the dataset. Variables with more rows than fit on a sheet are split 
+    across several sheets. The first sheet is a summary of which rows of
+    each variable are on each sheet.
+
+    Parameters
+    ------------
+    filename : str
+        Full path/filename
+
+    ds : xarray Dataset
+        Dataset to store
+
+    rows_per_chunk : int
+        optional number of rows converted at a time
+
+    max_rows : int
+        optional maximum number of rows on a sheet including the header,
+        by default Excel's limit
+
+    Returns
+    --------
+    list of dict
+        Rows of the summary sheet
+
+    Example
+    --------
+
+    >>> dataset_to_excel(filename,ds)
+
+    """
+    import xlsxwriter
+
+    nRowsSheet = max_rows-1
+    summary = []
+    used_names = {EXCEL_SUMMARY_SHEET}
+
+    workbook = xlsxwriter.Workbook(filename,{'constant_memory':True,
+                                             'default_date_format':'yyyy-mm-dd hh:mm:ss'})
+    try:
+        summary_sheet = workbook.add_worksheet(EXCEL_SUMMARY_SHEET)
+
+        for name,da in ds.data_vars.items():
+            dims = list(da.dims)
+            coords = [np.array(excel_values(da[dim].values),dtype=object) for dim in dims]
+            values = da.values.reshape(-1)
+            nRows = len(values)
+            sheet_names = excel_sheet_names(name,max(1,-(-nRows//nRowsSheet)),used_names)
+
+            for i,sheet_name in enumerate(sheet_names):
+                start = i*nRowsSheet
+                stop = min(nRows,start+nRowsSheet)
+                summary.append(dict(variable=str(name),sheet=sheet_name,first_row=start,
+                                    last_row=stop-1,dims=','.join(dims),
+                                    units=str(da.attrs.get('units','')),
+                                    class_type=str(da.attrs.get(TAG_CLASSNAME,''))))
+
+                worksheet = workbook.add_worksheet(sheet_name)
+                worksheet.write_row(0,0,dims+[str(name)])
+
+                for chunk_start in range(start,stop,rows_per_chunk):
+                    chunk_stop = min(stop,chunk_start+rows_per_chunk)
+                    positions = np.unravel_index(np.arange(chunk_start,chunk_stop),da.shape) if dims else []
+                    columns = [coord[pos] for coord,pos in zip(coords,positions)]
+                    columns.append(excel_values(values[chunk_start:chunk_stop]))
+
+                    for row,cells in enumerate(zip(*columns),chunk_start-start+1):
+                        worksheet.write_row(row,0,cells)
+
+        # Summary written last, it is a separate sheet so constant memory 
+        # mode allows it
+        if summary:
+            header = list(summary[0])
+            summary_sheet.write_row(0,0,header)
+            for row,entry in enumerate(summary,1):
+                summary_sheet.write_row(row,0,[entry[key] for key in header])
+    finally:
+        workbook.close()
+
+    return summary
+
+
+def file_to_dataset(filename,class_type=None,mmap=False):
+    """
+    Load xarray dataset from a file, the format is chosen from the
+    file extension:
+        * '.json' : JSON
+        * '.nc', '.nc4', '.h5', '.hdf5' : netCDF4/HDF5
+        * directory : numpy directory, see dataset_to_npy_dir()
+
+    Compressed files can have a compression extension as well, e.g. 
+    '.json.gz', or none.
+
+    Parameters
+    ------------
+    filename : str
+        Full path/filename
+
+    class_type : str
+        optional class name, only load the data variables tagged with this
+        CLASS_TYPE. Saved files have an index of variables by CLASS_TYPE
+        so the other variables are not converted.
+
+    mmap : bool
+        optional, memory map the data variables of a numpy directory
+        instead of reading them, by default False
+
+    Returns
+    --------
+    ds : xarray Dataset
+
+    Raises
+    ------
+    ValueError
+        If the file extension is not supported
+    """
+    if os.path.isdir(filename):
+        return npy_dir_to_dataset(filename,class_type=class_type,mmap=mmap)
+
+    name,ext = os.path.splitext(filename)
+    if ext.lower() in COMPRESSION_EXTENSIONS.values():
+        ext = os.path.splitext(name)[1]
+    ext = ext.lower()
+
+    if ext=='.json':
+        return json_to_dataset(filename,class_type=class_type)
+    if ext in NETCDF_EXTENSIONS:
+        return netcdf_to_dataset(filename,class_type=class_type)
+
+    raise ValueError(f'Can only load .json, netCDF ({", ".join(NETCDF_EXTENSIONS)}) or numpy directory files')
+
+
+def load_results_sink(path):
+    """
+    Load the results written to a ResultsSink directory back into one
+    Dataset. This is the same as the test manager's ds_results at the 
+    end of the run.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the results sink
+
+    Returns
+    -------
+    xarray Dataset or None
+        Combined results, None if no results have been written
+    """
+    return ResultsSink(path).load()
  
 #================================================================
 #%% Classes
 #================================================================
+class ResultsSink():
+    """
+    Write results to disk in chunks while a test manager is running.
+
+    After every rows_per_chunk rows of the conditions table the test 
+    manager writes the results it has collected to a new chunk file in 
+    the sink's directory and clears them from memory. Memory use stays 
+    bounded however long the run is, and results are on disk if the 
+    process dies.
+
+    Each chunk is written to a temporary file that is renamed when it is
+    complete, so there are never partial chunk files.
+
+    Example use
+    -----------
+    >>> test = MyTest(resources,results_sink=ResultsSink('C:/results/run_01'))
+    >>> test.run()
+
+    Load the results later
+
+    >>> ds = load_results_sink('C:/results/run_01')
+
+    Parameters
+    ----------
+    path : str
+        Directory for chunk files, created if it does not exist
+    rows_per_chunk : int, optional
+        Number of rows of the conditions table in each chunk, by default 1
+    load_results : bool, optional
+        If True then the test manager loads all the chunks back into its
+        ds_results at the end of the run, by default True. Set to False 
+        for runs that are too big to hold in memory.
+    """
+    def __init__(self,path,rows_per_chunk=1,load_results=True) -> None:
+        self.path = path
+        self.rows_per_chunk = rows_per_chunk
+        self.load_results = load_results
+
+        # Number of chunks written, counted from the directory when first
+        # needed, see n_chunks
+        self._n_chunks = None
+
+
+    def __repr__(self):
+        return f'ResultsSink[{self.path}]'
+
+
+    @property
+    def chunk_files(self):
+        """
+        Chunk files in the order they were written
+
+        Returns
+        -------
+        list of str
+        """
+        return sorted(glob.glob(os.path.join(self.path,f'{SINK_CHUNK_PREFIX}*.json')))
+
+
+    @property
+    def n_chunks(self):
+        """
+        Number of chunks in the sink. The directory is only searched the
+        first time, after that chunks are counted as they are written.
+
+        Returns
+        -------
+        int
+        """
+        if self._n_chunks is None:
+            self._n_chunks = len(self.chunk_files)
+        return self._n_chunks
+
+
+    def clear(self):
+        """
+        Create the directory if necessary and remove any existing chunks
+        """
+        self.truncate(0)
+
+
+    def truncate(self,n_chunks):
+        """
+        Remove the chunks after the first n_chunks, e.g. chunks written
+        after a checkpoint
+
+        Parameters
+        ----------
+        n_chunks : int
+            Number of chunks to keep
+        """
+        os.makedirs(self.path,exist_ok=True)
+        chunk_files = self.chunk_files
+        for filename in chunk_files[n_chunks:]:
+            os.remove(filename)
+        self._n_chunks = min(n_chunks,len(chunk_files))
+
+
+    def write(self,ds):
+        """
+        Write a Dataset to the next chunk file
+
+        Parameters
+        ----------
+        ds : xarray Dataset
+            Partial results
+
+        Returns
+        -------
+        str
+            Chunk filename
+        """
+        os.makedirs(self.path,exist_ok=True)
+        filename = os.path.join(self.path,f'{SINK_CHUNK_PREFIX}{self.n_chunks:06d}.json')
+
+        temp_filename = filename + '.tmp'
+        dataset_to_json(temp_filename,ds,compact=True)
+        os.replace(temp_filename,filename)
+        self._n_chunks += 1
+
+        return filename
+
+
+    def load(self):
+        """
+        Load all the chunks and combine them into one Dataset
+
+        Returns
+        -------
+        xarray Dataset or None
+            Combined results, None if no chunks have been written
+        """
+        datasets = [json_to_dataset(filename) for filename in self.chunk_files]
+        return combine_partial_datasets(datasets)
+
+
+
 @xr.register_dataset_accessor('save')
 class StorageAccessor:
     """
@@ -132,6 +1295,18 @@ class StorageAccessor:
     -----------
     Save to JSON format
     >>> ds.save.to_json(filename)
+
+    Save to binary netCDF4/HDF5 format
+    >>> ds.save.to_netcdf(filename)
+
+    Save to gzip compressed JSON
+    >>> ds.save.to_json(filename,compression='gzip')
+
+    Save to directory of numpy files
+    >>> ds.save.to_npy_dir(path)
+
+    Export to Parquet files, one per measurement
+    >>> ds.save.to_parquet(path)
     
     """
 
@@ -140,7 +1315,7 @@ class StorageAccessor:
         self._obj = xarray_obj
 
         
-    def to_json(self,filename):
+    def to_json(self,filename,compact=False,compression=None):
         """
         Store dataset to JSON file.
 
@@ -148,6 +1323,10 @@ class StorageAccessor:
         ----------
         filename : str
             Path to file.
+        compact : bool, optional
+            Store numeric arrays as base64 encoded binary, by default False
+        compression : str, optional
+            Compress with 'gzip', 'lzma' or 'zstd', by default None
 
         Returns
         -------
@@ -155,17 +1334,18 @@ class StorageAccessor:
 
         """
 
-        dataset_to_json(filename,self._obj)
+        dataset_to_json(filename,self._obj,compact=compact,compression=compression)
 
 
 
-    def to_json_str(self):
+    def to_json_str(self,compact=False):
         """
         Store dataset to JSON string.
 
         Parameters
         ----------
-        None
+        compact : bool, optional
+            Store numeric arrays as base64 encoded binary, by default False
 
         Returns
         -------
@@ -174,29 +1354,91 @@ class StorageAccessor:
 
         """
 
-        return dataset_to_json_str(self._obj)
+        return dataset_to_json_str(self._obj,compact=compact)
+
+
+    def to_netcdf(self,filename,compression=None):
+        """
+        Store dataset to binary netCDF4/HDF5 file.
+
+        Parameters
+        ----------
+        filename : str
+            Path to file.
+        compression : str, optional
+            'gzip' to compress chunk by chunk, by default None
+
+        Returns
+        -------
+        None.
+
+        """
+
+        dataset_to_netcdf(filename,self._obj,compression=compression)
+
+
+    def to_npy_dir(self,path):
+        """
+        Store dataset to a directory of numpy .npy files that can be
+        memory mapped when loaded.
+
+        Parameters
+        ----------
+        path : str
+            Path to directory.
+
+        Returns
+        -------
+        None.
+
+        """
+
+        dataset_to_npy_dir(path,self._obj)
+
+
+    def to_parquet(self,path,class_type=None):
+        """
+        Export dataset to long format Parquet files, one for each
+        measurement, with only the populated cells. Needs pyarrow.
+
+        Parameters
+        ----------
+        path : str
+            Path to directory.
+        class_type : str, optional
+            Only export the variables of this measurement class, 
+            by default None
+
+        Returns
+        -------
+        list of str
+            Parquet filenames
+
+        """
+
+        return dataset_to_parquet(path,self._obj,class_type=class_type)
 
 
     def to_excel(self,filename):
         """
         Save dataset to excel file
-        Saves each data variable to separate sheet
+        Saves each data variable to separate sheet, large variables are
+        split over several sheets, see dataset_to_excel()
 
         Parameters
         ----------
         filename : str
             full path/filename to file location
+
+        Returns
+        -------
+        list of dict
+            Rows of the summary sheet
         """
         if not os.path.exists(os.path.dirname(filename)):
             raise ValueError(f'Path does not exist [{filename}]')
 
-        # Create a Pandas Excel writer using XlsxWriter as the engine.
-        with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
-            for name,da in self._obj.data_vars.items():
-                df = da.to_dataframe()
-
-                # Write each data variable to a different worksheet.
-                df.to_excel(writer, sheet_name=name)
+        return dataset_to_excel(filename,self._obj)
         
 
         
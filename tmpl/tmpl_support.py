@@ -18,7 +18,9 @@ Useful classes library
 
 from collections import OrderedDict
 import os
+import itertools
 import numpy as np
+import pandas as pd
 
 #============================================================================
 #%% Functions
@@ -150,6 +152,207 @@ class ObjDict(OrderedDict):
         del self[name]   
 
 
+class RunningOrderStep:
+    """
+    One step in a test manager's running order.
+
+    Uses __slots__ to keep the memory footprint small when the running
+    order has a large number of steps. Fields can be accessed as 
+    attributes or like a dict.
+    
+    Examples
+    ---------
+    
+    >>> step = RunningOrderStep('CONDITION','temperature_degC',25,row=0)
+    >>> step.label
+    'temperature_degC'
+    >>> step['arguments']
+    25
+
+    Parameters
+    ----------
+    operation : str
+        Type of operation 'MEASUREMENT' or 'CONDITION'
+    label : str
+        Label of measurement or condition
+    arguments : single value or dict
+        Setpoint for conditions, dict of conditions for measurements
+    row : int or None, optional
+        Row of the conditions table this step belongs to, None for steps
+        that are not linked to a row e.g. startup and teardown.
+    """
+    __slots__ = ('operation','label','arguments','row')
+
+    def __init__(self,operation,label,arguments,row=None):
+        self.operation = operation
+        self.label = label
+        self.arguments = arguments
+        self.row = row
+
+    def __getitem__(self,name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self,name)
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def __eq__(self,other):
+        if not isinstance(other,RunningOrderStep):
+            return NotImplemented
+        return all([self[k]==other[k] for k in self.__slots__])
+
+    def __repr__(self):
+        return f'RunningOrderStep({self.operation}, {self.label}, {self.arguments}, row={self.row})'
+
+
+class ConditionsTable:
+    """
+    Table of every combination of a set of setup condition values.
+
+    The table is not stored, rows are worked out when they are needed. This
+    means that large numbers of conditions can be handled without making 
+    a dict for every combination.
+
+    By default the first condition varies the slowest and the last condition
+    the fastest, the same as itertools.product(). The nesting order can be
+    changed and the table can be traversed in a serpentine order, where 
+    each inner condition sweeps back and forth instead of going back to its
+    first value each time an outer condition changes.
+    
+    Examples
+    ---------
+    
+    >>> table = ConditionsTable({'temperature_degC':[25,35],'humidity_pc':[40,50,60]})
+    >>> len(table)
+    6
+    >>> table[1]
+    {'temperature_degC': 25, 'humidity_pc': 50}
+    >>> table.column('temperature_degC')
+    array([25, 25, 25, 35, 35, 35])
+
+    Serpentine order
+
+    >>> table = ConditionsTable({'temperature_degC':[25,35],'humidity_pc':[40,50,60]},serpentine=True)
+    >>> table.column('humidity_pc')
+    array([40, 50, 60, 60, 50, 40])
+
+    Iterate over rows
+    
+    >>> for row in table:
+    ...     print(row)
+
+    Parameters
+    ----------
+    conditions : dict
+        key: name of condition
+        value: list of values for that condition
+    nesting : list of str, optional
+        Names of conditions from the slowest varying to the fastest,
+        by default None, which uses the order of conditions
+    serpentine : bool, optional
+        Traverse the table in serpentine order, by default False
+    """
+
+    def __init__(self,conditions,nesting=None,serpentine=False):
+        # Take a copy of the values so the table does not change
+        self.names = list(conditions.keys())
+        self.values = [list(v) for v in conditions.values()]
+        self.sizes = [len(v) for v in self.values]
+
+        # Order of conditions from slowest to fastest
+        self.nesting = list(self.names) if nesting is None else list(nesting)
+        if sorted(self.nesting)!=sorted(self.names):
+            raise ValueError(f'Conditions table nesting {self.nesting} does not match conditions {self.names}')
+
+        self.serpentine = serpentine
+
+        # Number of rows between changes in value of each condition
+        nested_sizes = [self.sizes[self.names.index(name)] for name in self.nesting]
+        self.strides = []
+        for name in self.names:
+            level = self.nesting.index(name)
+            self.strides.append(int(np.prod(nested_sizes[level+1:])))
+
+    def __len__(self):
+        return int(np.prod(self.sizes))
+
+    def __iter__(self):
+        if self.nesting==self.names and not self.serpentine:
+            for row in itertools.product(*self.values):
+                yield dict(zip(self.names,row))
+            return
+
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self,index):
+        if isinstance(index,slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        nRows = len(self)
+        if index<0:
+            index += nRows
+        if index<0 or index>=nRows:
+            raise IndexError(f'Conditions table index [{index}] out of range, table has [{nRows}] rows')
+
+        row = {}
+        for name,values,stride,size in zip(self.names,self.values,self.strides,self.sizes):
+            block = index//stride
+            position = block%size
+            # Odd numbered sweeps go backwards
+            if self.serpentine and (block//size)%2==1:
+                position = size-1-position
+            row[name] = values[position]
+
+        return row
+
+    def __repr__(self):
+        return f'ConditionsTable({len(self)} rows, {self.nesting}, serpentine={self.serpentine})'
+
+    def column(self,name):
+        """
+        Return all the values of one condition, one for every row
+
+        Parameters
+        ----------
+        name : str
+            Name of condition
+
+        Returns
+        -------
+        array
+            Values of condition for every row of the table
+        """
+        i = self.names.index(name)
+
+        # Let pandas pick the dtype, same as a DataFrame of the rows
+        values = pd.Series(self.values[i],dtype=None if self.sizes[i] else object).to_numpy()
+
+        nRows = len(self)
+        if nRows==0:
+            return values[:0]
+
+        block = np.arange(nRows)//self.strides[i]
+        positions = block%self.sizes[i]
+        if self.serpentine:
+            backwards = (block//self.sizes[i])%2==1
+            positions[backwards] = self.sizes[i]-1-positions[backwards]
+
+        return values[positions]
+
+    def to_dataframe(self):
+        """
+        Return the table as a DataFrame, one column per condition
+
+        Returns
+        -------
+        DataFrame
+        """
+        return pd.DataFrame({name:self.column(name) for name in self.names},
+                            index=pd.RangeIndex(len(self)))
+
+
 class debugPrintout:
     """
     Logging printout class
@@ -138,8 +138,8 @@ class VoltageSweeper(tmpl.AbstractMeasurement):
         
         # Store the data
         self.store_coords('swp_voltage',self.config.voltage_sweep)
-        self.store_data_var('current_A',current,coords=['swp_voltage'])
-        self.store_data_var('voltage_diff_V',voltage,coords=['swp_voltage'])
+        self.store_data_vars({'current_A':current,'voltage_diff_V':voltage},
+                             coords=['swp_voltage'])
 
         # Debug point
         self.log('finished sweep')
@@ -0,0 +1,145 @@
+'''
+Benchmark of compressed results files
+================================================================
+Compare the file size and save/load times of the compression codecs for
+JSON and netCDF files, using results from the example resistor test
+with a long voltage sweep.
+
+Run from the command line
+
+>>> python unit_test/benchmark_compression.py
+
+'''
+
+
+#================================================================
+#%% Imports
+#================================================================
+# Standard library
+import os, time, sys
+import tempfile
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+
+basepath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(basepath)
+
+# Local libraries
+from example_resistor_test import (ExampleTestSequence,ResistorModel,
+                                    VoltageSupply,set_temperature,
+                                    set_humidity)
+from tmpl import (file_to_dataset,dataset_to_json,dataset_to_netcdf,
+                  compression_codecs,COMPRESSION_EXTENSIONS)
+
+#================================================================
+#%% Constants
+#================================================================
+N_SWEEP_POINTS = 20000
+N_REPEATS = 3
+
+#================================================================
+#%% Functions
+#================================================================
+def make_results(n_points=N_SWEEP_POINTS):
+    """
+    Run the example resistor test with a long voltage sweep
+
+    Parameters
+    ----------
+    n_points : int, optional
+        Number of points in the voltage sweep, by default N_SWEEP_POINTS
+
+    Returns
+    -------
+    xarray Dataset
+        Test manager results
+    """
+    resources = {
+        'set_temperature':set_temperature,
+        'set_humidity': set_humidity,
+        'voltage_supply':VoltageSupply(),
+        'resistor':ResistorModel(100,tolerance_pc=1.0),
+        }
+
+    test = ExampleTestSequence(resources)
+    test.meas.VoltageSweep.config.voltage_sweep = np.linspace(0,1,n_points)
+    test.run()
+
+    return test.ds_results
+
+
+def time_call(func,n_repeats=N_REPEATS):
+    """
+    Best time of several calls of a function
+
+    Returns
+    -------
+    tuple
+        (time in seconds, return value of last call)
+    """
+    times = []
+    for _ in range(n_repeats):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter()-t0)
+
+    return min(times),result
+
+
+def benchmark(ds,path):
+    """
+    Save and load a Dataset with every format and codec
+
+    Parameters
+    ----------
+    ds : xarray Dataset
+        Results to save
+    path : str
+        Directory for the files
+
+    Returns
+    -------
+    pandas DataFrame
+        Size, compression ratio and times of each format and codec
+    """
+    cases = []
+    for codec in [None]+compression_codecs():
+        ext = '.json'+COMPRESSION_EXTENSIONS.get(codec,'')
+        cases.append(('json',codec,os.path.join(path,'plain'+ext),
+                      lambda f,c=codec: dataset_to_json(f,ds,compression=c)))
+        cases.append(('compact json',codec,os.path.join(path,'compact'+ext),
+                      lambda f,c=codec: dataset_to_json(f,ds,compact=True,compression=c)))
+
+    for codec in [None,'gzip']:
+        cases.append(('netcdf',codec,os.path.join(path,f'{codec}.nc'),
+                      lambda f,c=codec: dataset_to_netcdf(f,ds,compression=c)))
+
+    rows = []
+    for format,codec,filename,save in cases:
+        save_s,_ = time_call(lambda: save(filename))
+        load_s,ds_loaded = time_call(lambda: file_to_dataset(filename))
+
+        if not ds_loaded.equals(ds):
+            print(f'{format} {codec}: loaded results are not equal')
+
+        rows.append(dict(format=format,codec=codec or 'none',size_kB=os.path.getsize(filename)/1e3,
+                         save_s=save_s,load_s=load_s))
+
+    df = pd.DataFrame(rows)
+    df['ratio'] = df['size_kB'].iloc[0]/df['size_kB']
+    return df
+
+#================================================================
+#%% Runner
+#================================================================
+if __name__ == '__main__':
+    ds = make_results()
+    print(f'\nBenchmark with {ds["current_A"].size} sweep points\n')
+
+    with tempfile.TemporaryDirectory() as path:
+        df = benchmark(ds,path)
+
+    with pd.option_context('display.float_format','{:.3f}'.format):
+        print(df.to_string(index=False))
@@ -12,6 +12,12 @@ AbstractMeasurement
 #================================================================
 # Standard library
 import os, time, sys
+import itertools
+import shutil
+import re
+import zipfile
+import json
+import importlib.util
 import unittest
  
 # Third party libraries
@@ -29,6 +35,10 @@ print(basepath)
 from example_resistor_test import (ExampleTestSequence,ResistorModel,
                                     VoltageSupply,set_temperature,
                                     set_humidity)
+from tmpl import (ResultsSink,load_results_sink,compact_dict_to_dataset,file_to_dataset,
+                  split_by_class_type,variable_index,VARIABLE_INDEX_ATTR,
+                  dataset_to_parquet,dataset_to_excel,compression_codecs,
+                  detect_compression,COMPRESSION_EXTENSIONS)
 
 #================================================================
 #%% Constants
@@ -100,6 +110,74 @@ class TestExampleSequence(unittest.TestCase):
         # just see if it works for now
 
 
+    def test_conditions_table_rows(self):
+        """
+        Check the conditions table gives the same rows as a product of the
+        condition values
+        """
+
+        cond_table = self.testseq.conditions_table
+        names = [c.name for c in self.testseq.conditions.values()]
+        rows = [dict(zip(names,values)) for values in 
+                itertools.product(*[c.values for c in self.testseq.conditions.values()])]
+
+        self.assertEqual(len(cond_table),len(rows),msg='Conditions table is wrong length')
+        self.assertEqual(list(cond_table),rows,msg='Conditions table iteration is wrong')
+        self.assertEqual([cond_table[i] for i in range(len(rows))],rows,
+            msg='Conditions table indexing is wrong')
+        self.assertEqual(cond_table[-1],rows[-1],msg='Conditions table negative index is wrong')
+
+        for name in names:
+            self.assertEqual(list(cond_table.column(name)),[r[name] for r in rows],
+                msg=f'Conditions table column [{name}] is wrong')
+
+        self.assertTrue(cond_table.to_dataframe().equals(pd.DataFrame(rows)),
+            msg='Conditions table DataFrame is wrong')
+
+
+    def test_condition_ordering(self):
+        """
+        Check serpentine and optimised condition ordering cost less and give
+        the same results as the default ordering
+        """
+
+        self.testseq.run()
+
+        costs = {}
+        for ordering in ['nested','serpentine','optimise']:
+            seq = ExampleTestSequence(self.resources,condition_ordering=ordering)
+
+            # Temperature is slow to change, humidity is quicker
+            seq.conditions.temperature_degC.transition_cost_step = 20
+            seq.conditions.temperature_degC.transition_cost_per_unit = 1
+            seq.conditions.humidity_pc.transition_cost_step = 5
+            seq.conditions.humidity_pc.transition_cost_per_unit_down = 0.5
+
+            costs[ordering] = seq.conditions_transition_cost()
+
+            seq.run()
+            self.assertTrue(seq.last_error=='',msg=f'Test run with [{ordering}] ordering failed')
+
+            for meas_name in ['VoltageSweep','Stabilise']:
+                self.assertTrue(self.testseq.meas[meas_name].ds_results.equals(seq.meas[meas_name].ds_results),
+                    msg=f'Results for meas[{meas_name}] with [{ordering}] ordering are not equal')
+
+        self.assertLess(costs['serpentine'],costs['nested'],msg='Serpentine order is not cheaper')
+        self.assertLessEqual(costs['optimise'],costs['serpentine'],msg='Optimised order is not cheapest')
+
+
+    def test_supplied_conditions(self):
+        """
+        Check only the supplied conditions are in the running order
+        """
+        conditions = [{'temperature_degC':35,'humidity_pc':60}]
+        self.testseq.make_running_order(conditions)
+
+        set_conditions = [(line.label,line.arguments) for line in self.testseq._running_order if line.operation=='CONDITION']
+        self.assertEqual(set_conditions,[('temperature_degC',35),('humidity_pc',60)],
+            msg='Running order does not use the supplied conditions')
+
+
     def test_running_default_conditions(self):
 
         self.testseq.run()
@@ -161,6 +239,50 @@ class TestExampleSequence(unittest.TestCase):
             os.remove(data_filename_excel)
 
 
+    def test_save_excel_split_sheets(self):
+        """
+        Save to Excel with variables split across sheets at the row limit
+        and a summary sheet
+        """
+
+        data_filename_excel = os.path.join(DATAFILE_PATH,'test_data_split.xlsx')
+
+        self.testseq.run()
+        ds = self.testseq.ds_results
+        nRows = ds['current_A'].size
+
+        summary = dataset_to_excel(data_filename_excel,ds,rows_per_chunk=7,max_rows=21)
+
+        # Rows of each variable are all on their sheets once
+        for name,da in ds.data_vars.items():
+            entries = [entry for entry in summary if entry['variable']==name]
+            self.assertEqual(len(entries),-(-da.size//20),
+                msg=f'Wrong number of sheets for [{name}]')
+            self.assertEqual([entry['first_row'] for entry in entries],list(range(0,da.size,20)))
+            self.assertEqual(entries[-1]['last_row'],da.size-1)
+
+        self.assertEqual(summary[0]['sheet'],'current_A')
+        self.assertEqual(summary[1]['sheet'],'current_A_2')
+
+        # Summary sheet first, then one sheet per summary entry, each with
+        # a header row
+        with zipfile.ZipFile(data_filename_excel) as zf:
+            workbook = zf.read('xl/workbook.xml').decode()
+            sheet_names = re.findall(r'<sheet name="([^"]+)"',workbook)
+            self.assertEqual(sheet_names,['summary']+[entry['sheet'] for entry in summary])
+
+            for i,entry in enumerate(summary):
+                sheet = zf.read(f'xl/worksheets/sheet{i+2}.xml').decode()
+                self.assertEqual(len(re.findall(r'<row ',sheet)),entry['last_row']-entry['first_row']+2,
+                    msg=f'Wrong number of rows on sheet [{entry["sheet"]}]')
+
+        self.assertGreater(nRows,20)
+
+        # Clean up
+        if os.path.exists(data_filename_excel):
+            os.remove(data_filename_excel)
+
+
     def test_save_and_load_results(self):
         """
         Save data after a test run and load it back
@@ -199,6 +321,290 @@ class TestExampleSequence(unittest.TestCase):
         if os.path.exists(data_filename_json):
             os.remove(data_filename_json)
 
+
+    def test_save_and_load_compact_json(self):
+        """
+        Save data in compact JSON format and load it back
+        """
+
+        data_filename_json = os.path.join(DATAFILE_PATH,'test_data.json')
+        data_filename_compact = os.path.join(DATAFILE_PATH,'test_data_compact.json')
+
+        self.testseq.run()
+        self.testseq.save(data_filename_json)
+        self.testseq.save(data_filename_compact,compact=True)
+
+        self.assertLess(os.path.getsize(data_filename_compact),os.path.getsize(data_filename_json)/2,
+            msg='Compact JSON file is not smaller')
+
+        new_seq = ExampleTestSequence({},offline_mode=True)
+        new_seq.load(data_filename_compact)
+
+        self.assertTrue(self.testseq.ds_results.identical(new_seq.ds_results),
+            msg='Reloaded compact JSON results are not identical')
+        self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(new_seq.meas.VoltageSweep.ds_results),
+            msg='Reloaded compact JSON results for measurement are not equal')
+
+        # JSON string
+        ds = compact_dict_to_dataset(json.loads(self.testseq.ds_results.save.to_json_str(compact=True)))
+        self.assertTrue(self.testseq.ds_results.identical(ds),
+            msg='Compact JSON string results are not identical')
+
+        # Clean up
+        for filename in [data_filename_json,data_filename_compact]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+    def test_save_and_load_netcdf(self):
+        """
+        Save data in binary netCDF format and load it back
+        """
+
+        data_filename_nc = os.path.join(DATAFILE_PATH,'test_data.nc')
+
+        self.testseq.run()
+        self.testseq.save(data_filename_nc,format='netcdf')
+
+        self.assertTrue(os.path.exists(data_filename_nc),
+            msg='Failed to save netCDF file')
+
+        # Load into a new test manager
+        new_seq = ExampleTestSequence({},offline_mode=True)
+        new_seq.load(data_filename_nc)
+
+        self.assertTrue(self.testseq.ds_results.equals(new_seq.ds_results),
+            msg='Reloaded netCDF results for test manager are not equal')
+
+        for name,var in self.testseq.ds_results.data_vars.items():
+            self.assertEqual(var.attrs,new_seq.ds_results[name].attrs,
+                msg=f'Attributes of [{name}] not kept')
+
+        self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(new_seq.meas.VoltageSweep.ds_results),
+            msg='Reloaded netCDF results for measurement are not equal')
+
+        # Load into a measurement
+        new_seq.meas.VoltageSweep.load(data_filename_nc)
+        self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(new_seq.meas.VoltageSweep.ds_results),
+            msg='netCDF results loaded by measurement are not equal')
+
+        # Clean up
+        if os.path.exists(data_filename_nc):
+            os.remove(data_filename_nc)
+
+
+
+    def test_save_and_load_compressed(self):
+        """
+        Save data to compressed files and load it back, the codec is found
+        from the file
+        """
+
+        data_filename_json = os.path.join(DATAFILE_PATH,'test_data.json')
+        data_filename_nc = os.path.join(DATAFILE_PATH,'test_data.nc')
+        filenames = [data_filename_json,data_filename_nc]
+
+        self.testseq.run()
+        self.testseq.save(data_filename_json)
+        json_size = os.path.getsize(data_filename_json)
+
+        for codec in compression_codecs():
+            for compact in [False,True]:
+                filename = data_filename_json+COMPRESSION_EXTENSIONS[codec]
+                filenames.append(filename)
+                self.testseq.save(filename,compact=compact,compression=codec)
+
+                self.assertEqual(detect_compression(filename),codec)
+                self.assertLess(os.path.getsize(filename),json_size,
+                    msg=f'[{codec}] file is not smaller')
+
+                new_seq = ExampleTestSequence({},offline_mode=True)
+                new_seq.load(filename)
+                self.assertTrue(self.testseq.ds_results.identical(new_seq.ds_results),
+                    msg=f'Reloaded [{codec}] results are not identical, compact={compact}')
+                self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(new_seq.meas.VoltageSweep.ds_results),
+                    msg=f'Reloaded [{codec}] results for measurement are not equal')
+
+        # Codec found without a compression extension
+        self.testseq.save(data_filename_json,compression='gzip')
+        self.assertTrue(self.testseq.ds_results.identical(file_to_dataset(data_filename_json)))
+
+        # netCDF compressed chunk by chunk
+        self.testseq.save(data_filename_nc,format='netcdf',compression='gzip')
+        new_seq = ExampleTestSequence({},offline_mode=True)
+        new_seq.load(data_filename_nc)
+        self.assertTrue(self.testseq.ds_results.equals(new_seq.ds_results),
+            msg='Reloaded compressed netCDF results are not equal')
+
+        with self.assertRaises(ValueError):
+            self.testseq.save(data_filename_nc,format='netcdf',compression='lzma')
+        with self.assertRaises(ValueError):
+            self.testseq.save(data_filename_json,compression='rar')
+        with self.assertRaises(ValueError):
+            self.testseq.save(os.path.join(DATAFILE_PATH,'test_data_npy'),format='npy',compression='gzip')
+
+        # Clean up
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+    def test_save_and_load_npy_dir(self):
+        """
+        Save data to a directory of numpy files and load it back memory
+        mapped
+        """
+
+        data_path = os.path.join(DATAFILE_PATH,'test_data_npy')
+
+        self.testseq.run()
+        self.testseq.save(data_path,format='npy')
+
+        self.assertTrue(os.path.isdir(data_path),
+            msg='Failed to save numpy directory')
+
+        for mmap in [False,True]:
+            new_seq = ExampleTestSequence({},offline_mode=True)
+            new_seq.load(data_path,mmap=mmap)
+
+            self.assertTrue(self.testseq.ds_results.identical(new_seq.ds_results),
+                msg=f'Reloaded numpy directory results are not identical, mmap={mmap}')
+            self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(new_seq.meas.VoltageSweep.ds_results),
+                msg=f'Reloaded numpy directory results for measurement are not equal, mmap={mmap}')
+
+        # Data variables wrap the memory mapped files without copying
+        for name,var in new_seq.ds_results.data_vars.items():
+            self.assertIsInstance(var.values.base,np.memmap,
+                msg=f'[{name}] is not memory mapped')
+        self.assertIs(new_seq.meas.VoltageSweep.ds_results['current_A'].values.base,
+                      new_seq.ds_results['current_A'].values.base,
+                      msg='Measurement data is a copy')
+
+        # Changes are not written back to the files
+        new_seq.ds_results['current_A'].values[...] = 0
+        ds = file_to_dataset(data_path)
+        self.assertTrue(self.testseq.ds_results['current_A'].equals(ds['current_A']),
+            msg='Memory mapped changes were written to file')
+
+        # Load into a measurement, then save over the directory while it is mapped
+        new_seq.meas.VoltageSweep.load(data_path,mmap=True)
+        self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(new_seq.meas.VoltageSweep.ds_results),
+            msg='Numpy directory results loaded by measurement are not equal')
+        mapped_files = {var.values.base.filename for var in new_seq.meas.VoltageSweep.ds_results.data_vars.values()}
+        new_seq.meas.VoltageSweep.save(data_path,format='npy')
+        self.assertTrue(self.testseq.meas.VoltageSweep.ds_results.equals(file_to_dataset(data_path)),
+            msg='Numpy directory saved over itself is not equal')
+
+        # Mapped files are not written to again, which fails on Windows
+        with open(os.path.join(data_path,'dataset.json')) as f:
+            saved_files = {os.path.join(data_path,var['file']) for var in json.load(f)['data_vars'].values() if 'file' in var}
+        self.assertFalse(mapped_files & {os.path.abspath(filename) for filename in saved_files},
+            msg='Memory mapped files were saved over')
+
+        # Clean up
+        shutil.rmtree(data_path,ignore_errors=True)
+
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'),'pyarrow is not installed')
+    def test_export_parquet(self):
+        """
+        Export results to long format Parquet files with only the 
+        populated cells
+        """
+        import pyarrow.parquet as pq
+
+        data_path = os.path.join(DATAFILE_PATH,'test_data_parquet')
+
+        self.testseq.run()
+        ds = self.testseq.meas.VoltageSweep.ds_results.copy(deep=True)
+
+        # Make the results sparse
+        ds['current_A'][dict(temperature_degC=slice(1,None))] = np.nan
+        ds['resistance_ohms'][dict(humidity_pc=0)] = np.nan
+
+        filenames = ds.save.to_parquet(data_path)
+        class_name = self.testseq.meas.VoltageSweep.__class__.__name__
+        self.assertEqual(filenames,[os.path.join(data_path,class_name+'.parquet')])
+
+        df = pd.read_parquet(filenames[0])
+        for name in ds.data_vars:
+            df_expected = ds[name].to_dataframe().dropna()
+            df_var = df.dropna(subset=[name]).set_index(list(ds[name].dims))[[name]]
+            self.assertEqual(len(df_var),int(ds[name].notnull().sum()),
+                msg=f'Wrong number of rows for [{name}]')
+            pd.testing.assert_frame_equal(df_var,df_expected)
+
+        # Same rows when written in small batches
+        filenames = dataset_to_parquet(data_path,ds,row_group_size=7)
+        self.assertGreater(pq.ParquetFile(filenames[0]).num_row_groups,1)
+        pd.testing.assert_frame_equal(pd.read_parquet(filenames[0]),df)
+
+        # String coordinates are dictionary encoded
+        filenames = ds.expand_dims(serial_number=['example_sn']).save.to_parquet(data_path)
+        schema = pq.read_schema(filenames[0])
+        self.assertEqual(str(schema.field('serial_number').type),
+                         'dictionary<values=string, indices=int32, ordered=0>')
+
+        # Export from test manager
+        self.testseq.save(data_path,format='parquet')
+        self.assertTrue(os.path.exists(os.path.join(data_path,class_name+'.parquet')))
+
+        # Clean up
+        shutil.rmtree(data_path,ignore_errors=True)
+
+
+    def test_load_by_class_type(self):
+        """
+        Saved files have an index of variables by CLASS_TYPE, and a
+        measurement only loads its own variables
+        """
+
+        filenames = [os.path.join(DATAFILE_PATH,name) for name in 
+                     ['test_index.json','test_index_compact.json','test_index.nc']]
+
+        self.testseq.run()
+        self.testseq.save(filenames[0])
+        self.testseq.save(filenames[1],compact=True)
+        self.testseq.save(filenames[2],format='netcdf')
+
+        class_name = self.testseq.meas.VoltageSweep.__class__.__name__
+        ds_expected = self.testseq.ds_results.filter_by_attrs(CLASS_TYPE=class_name)
+
+        # Index is stored in the file
+        with open(filenames[0],'r') as f:
+            index = json.loads(json.load(f)['attrs'][VARIABLE_INDEX_ATTR])
+        self.assertEqual(index[class_name],list(ds_expected.data_vars),
+            msg='Variable index in file is wrong')
+
+        for filename in filenames:
+            ds = file_to_dataset(filename,class_type=class_name)
+            self.assertEqual(list(ds.data_vars),list(ds_expected.data_vars),
+                msg=f'Wrong variables loaded from [{filename}]')
+            self.assertTrue(ds.equals(ds_expected),
+                msg=f'Variables loaded from [{filename}] are not equal')
+            self.assertNotIn(VARIABLE_INDEX_ATTR,ds.attrs,
+                msg='Variable index left in loaded attributes')
+
+        # Files without an index still load
+        with open(filenames[0],'w') as f:
+            json.dump(self.testseq.ds_results.to_dict(),f)
+        new_seq = ExampleTestSequence({},offline_mode=True)
+        new_seq.meas.VoltageSweep.load(filenames[0])
+        self.assertTrue(new_seq.meas.VoltageSweep.ds_results.equals(ds_expected),
+            msg='Variables loaded from file without index are not equal')
+
+        # Test manager load splits the variables between its objects
+        new_seq.load(filenames[1])
+        self.assertTrue(new_seq.meas.VoltageSweep.ds_results.equals(ds_expected),
+            msg='Variables given to measurement are not equal')
+        self.assertEqual(split_by_class_type(self.testseq.ds_results).keys(),
+                         variable_index(self.testseq.ds_results).keys())
+
+        # Clean up
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
         
     def test_custom_config(self):
         """
@@ -212,7 +618,302 @@ class TestExampleSequence(unittest.TestCase):
             self.assertTrue(k in seq.config,msg=f'Test parameter [{k}] not in config dict')
             self.assertEqual(seq.config[k],v,msg=f'Test parameter [{k}] does not have correct value [{v}]')
 
-        
+
+    def test_preallocated_results(self):
+        """
+        Run with preallocated results and compare to a normal run
+        """
+
+        self.testseq.run()
+
+        seq = ExampleTestSequence(self.resources,preallocate_results=True)
+        seq.run()
+
+        self.assertTrue(seq.last_error=='',msg='Preallocated test run failed')
+
+        for meas_name in self.testseq.meas:
+            ds_normal = self.testseq.meas[meas_name].ds_results
+            ds_prealloc = seq.meas[meas_name].ds_results
+
+            if meas_name=='Timestamp':
+                continue
+
+            self.assertTrue(ds_normal.equals(ds_prealloc),
+                msg=f'Preallocated results for meas[{meas_name}] are not equal')
+
+
+    def test_results_cache(self):
+        """
+        Check that merging only changed measurements gives the same
+        results as merging everything
+        """
+
+        self.testseq.run()
+
+        # Store new data in one measurement only
+        meas = self.testseq.meas.VoltageSweep
+        meas.run(conditions={'temperature_degC':55,'humidity_pc':55})
+        meas.store_data_var('extra_data',[1.0])
+
+        ds_cached = self.testseq.meas.VoltageSweep.ds_results_global
+
+        # Force a full merge
+        self.testseq._results_cache = None
+        self.testseq.get_results()
+
+        self.assertTrue(ds_cached.equals(self.testseq.ds_results),
+            msg='Cached results are not equal to fully merged results')
+
+        self.assertTrue('extra_data' in ds_cached,
+            msg='Cached results do not have new data')
+
+        # Variable added directly to the measurement's Dataset
+        meas.ds_results['direct_data'] = meas.ds_results['current_A']*2
+        self.testseq.get_results()
+        self.assertTrue('direct_data' in self.testseq.ds_results,
+            msg='Cached results do not have directly added data')
+
+        # Variable replaced directly
+        meas.ds_results['direct_data'] = meas.ds_results['current_A']*3
+        self.testseq.get_results()
+        self.assertTrue(self.testseq.ds_results['direct_data'].equals(meas.ds_results['direct_data']),
+            msg='Cached results do not have directly replaced data')
+
+
+    def test_first_last_time_indexes(self):
+        """
+        Check FIRST_TIME/LAST_TIME indexes against a groupby of the
+        conditions table
+        """
+
+        meas = self.testseq.meas.VoltageSweep
+        meas.run_after('temperature_degC',meas.COND_LAST_TIME)
+        meas.run_after('humidity_pc',meas.COND_FIRST_TIME)
+
+        self.testseq.make_running_order()
+        df = self.testseq.df_conditions
+
+        for cond_label in df.columns:
+            first = [group.index[0] for _,group in df.groupby(cond_label)]
+            last = [group.index[-1] for _,group in df.groupby(cond_label)]
+
+            self.assertEqual(self.testseq.condition_first_indexes(cond_label),first,
+                msg=f'First indexes of [{cond_label}] are wrong')
+            self.assertEqual(self.testseq.condition_last_indexes(cond_label),last,
+                msg=f'Last indexes of [{cond_label}] are wrong')
+
+        # VoltageSweep runs after the last temperature or first humidity
+        last_temperature = self.testseq.condition_last_indexes('temperature_degC')
+        first_humidity = self.testseq.condition_first_indexes('humidity_pc')
+        expected = [i for i in df.index if i in last_temperature or i in first_humidity]
+        nMeas = len([line for line in self.testseq._running_order if line.label=='VoltageSweep'])
+        self.assertEqual(nMeas,len(expected),
+            msg='VoltageSweep is in the running order the wrong number of times')
+
+
+    def test_stream_running_order(self):
+        """
+        Run with the running order generated as the run goes and compare
+        to a normal run
+        """
+
+        self.testseq.make_running_order()
+        steps = list(self.testseq.iter_running_order())
+
+        self.assertEqual(steps,self.testseq._running_order,
+            msg='Generated running order is not the same as the planned one')
+
+        self.testseq.run()
+
+        seq = ExampleTestSequence(self.resources,stream_running_order=True)
+        seq.run()
+
+        self.assertTrue(seq.last_error=='',msg='Streamed test run failed')
+
+        for meas_name in self.testseq.meas:
+            if meas_name=='Timestamp':
+                continue
+
+            self.assertTrue(self.testseq.meas[meas_name].ds_results.equals(seq.meas[meas_name].ds_results),
+                msg=f'Streamed results for meas[{meas_name}] are not equal')
+
+
+
+    def test_running_order_cache(self):
+        """
+        Check df_running_order is only regenerated when the conditions or
+        measurements change
+        """
+
+        df1 = self.testseq.df_running_order
+        running_order = self.testseq._running_order
+
+        # Nothing changed
+        df2 = self.testseq.df_running_order
+        self.assertTrue(df1.equals(df2),msg='Cached running order is different')
+        self.assertTrue(running_order is self.testseq._running_order,
+            msg='Running order was regenerated when nothing changed')
+
+        # Change condition values
+        self.testseq.conditions.humidity_pc.values = [10,20,30]
+        df3 = self.testseq.df_running_order
+        self.assertEqual(set(df3.humidity_pc.dropna()),{10,20,30},
+            msg='Running order not updated after condition values changed')
+
+        # Disable a measurement
+        self.testseq.meas.VoltageSweep.enable = False
+        df4 = self.testseq.df_running_order
+        self.assertFalse('VoltageSweep' in df4.Label.values,
+            msg='Running order not updated after measurement disabled')
+
+        # Change run conditions in place
+        self.testseq.meas.VoltageSweep.enable = True
+        self.testseq.meas.VoltageSweep.run_after('temperature_degC',25)
+        df5 = self.testseq.df_running_order
+        self.assertEqual(len(df5[df5.Label=='VoltageSweep']),len(self.testseq.conditions.humidity_pc.values),
+            msg='Running order not updated after run conditions changed')
+
+
+    def test_results_sink(self):
+        """
+        Write results to disk in chunks while running and check they load
+        back the same as a normal run
+        """
+        sink_path = os.path.join(DATAFILE_PATH,'test_sink')
+
+        self.testseq.run()
+        ds = self.testseq.ds_results.drop_vars('timestamp')
+
+        try:
+            sink = ResultsSink(sink_path,rows_per_chunk=2)
+            test_sink = ExampleTestSequence(self.resources,results_sink=sink)
+            test_sink.run()
+            self.assertTrue(test_sink.last_error=='',msg='Test run with results sink failed')
+
+            nRows = len(test_sink.conditions_table)
+            self.assertEqual(len(sink.chunk_files),(nRows+1)//2,msg='Wrong number of chunk files')
+            self.assertEqual(sink.n_chunks,len(sink.chunk_files),msg='Wrong chunk count')
+
+            self.assertTrue(ds.equals(test_sink.ds_results.drop_vars('timestamp')),
+                msg='Results loaded at end of run are not equal to normal results')
+            self.assertTrue(ds.equals(load_results_sink(sink_path).drop_vars('timestamp')),
+                msg='Results loaded from sink are not equal to normal results')
+            self.assertTrue(ds.current_A.equals(test_sink.meas.VoltageSweep.ds_results.current_A),
+                msg='Measurement results not restored from sink')
+
+            # Chunks are counted, not searched for
+            sink.truncate(1)
+            self.assertEqual(sink.n_chunks,1)
+            self.assertTrue(sink.write(ds).endswith('chunk_000001.json'))
+        finally:
+            # Clean up
+            shutil.rmtree(sink_path,ignore_errors=True)
+
+
+    def test_checkpoint_resume(self):
+        """
+        Crash part way through a run and resume from the checkpoint
+        """
+        checkpoint_path = os.path.join(DATAFILE_PATH,'test_checkpoint')
+
+        self.testseq.run()
+        ds = self.testseq.ds_results.drop_vars('timestamp')
+
+        try:
+            # Crash at the 5th row
+            test = ExampleTestSequence(self.resources,checkpoint_path=checkpoint_path)
+            meas = test.meas.VoltageSweep
+            meas_sequence = meas.meas_sequence
+            def crash(**kwargs):
+                if meas.current_conditions=={'temperature_degC':35,'humidity_pc':60}:
+                    raise RuntimeError('Crash')
+                meas_sequence(**kwargs)
+            meas.meas_sequence = crash
+            test.run()
+            self.assertTrue('Crash' in meas.last_error and test.last_error!='',msg='Test did not crash')
+
+            state = test.read_checkpoint()
+            self.assertFalse(state['finished'],msg='Crashed run is marked as finished')
+            self.assertEqual(state['setpoints'],{'temperature_degC':35,'humidity_pc':60},
+                msg='Wrong setpoints in checkpoint')
+
+            # Resume in a new test manager
+            self.resources['resistor'].temperature_degC = 0
+            self.resources['resistor'].humidity_pc = 0
+            test_resume = ExampleTestSequence(self.resources,checkpoint_path=checkpoint_path)
+            rows_run = []
+            meas = test_resume.meas.VoltageSweep
+            meas_sequence = meas.meas_sequence
+            def log_row(**kwargs):
+                rows_run.append(tuple(meas.current_conditions.values()))
+                meas_sequence(**kwargs)
+            meas.meas_sequence = log_row
+
+            # Instruments are turned on again in the new test manager
+            startup_run = []
+            turn_on = test_resume.meas.TurnOn
+            turn_on_sequence = turn_on.meas_sequence
+            def log_startup(**kwargs):
+                startup_run.append(turn_on.name)
+                turn_on_sequence(**kwargs)
+            turn_on.meas_sequence = log_startup
+
+            test_resume.resume()
+            self.assertTrue(test_resume.last_error=='',msg='Resumed run failed')
+            self.assertEqual(startup_run,[turn_on.name],msg='Startup measurements not run on resume')
+            self.assertEqual(rows_run,list(itertools.product([35,45],[55,60,70]))[1:],
+                msg='Resumed run did not start from checkpoint')
+            self.assertTrue(test_resume.read_checkpoint()['finished'],msg='Resumed run not marked as finished')
+
+            self.assertTrue(ds.equals(test_resume.ds_results.drop_vars('timestamp')),
+                msg='Resumed results are not equal to normal results')
+        finally:
+            # Clean up
+            shutil.rmtree(checkpoint_path,ignore_errors=True)
+
+
+    def test_checkpoint_global_results(self):
+        """
+        Checkpoints follow the results sink chunks and a teardown 
+        measurement sees the current chunk in ds_results_global and every
+        result with load_results_global()
+        """
+        checkpoint_path = os.path.join(DATAFILE_PATH,'test_checkpoint_global')
+
+        self.testseq.run()
+        ds = self.testseq.ds_results.drop_vars('timestamp')
+
+        try:
+            sink = ResultsSink(os.path.join(checkpoint_path,'results'),rows_per_chunk=2)
+            test = ExampleTestSequence(self.resources,checkpoint_path=checkpoint_path,results_sink=sink)
+            
+            ds_global = []
+            ds_loaded = []
+            def read_global():
+                ds_global.append(test.meas.TurnOff.ds_results_global)
+                ds_loaded.append(test.meas.TurnOff.load_results_global())
+            test.meas.TurnOff.meas_sequence = read_global
+
+            test.run()
+            self.assertTrue(test.last_error=='',msg='Test run with checkpoints failed')
+            self.assertTrue(test.read_checkpoint()['finished'],msg='Run not marked as finished')
+
+            nRows = len(test.conditions_table)
+            self.assertEqual(len(sink.chunk_files),(nRows+1)//2,
+                msg='Checkpoints did not follow rows_per_chunk')
+
+            self.assertEqual(len(ds_global),1,msg='Teardown measurement not run')
+            self.assertTrue(0<int(ds_global[0].current_A.count())<int(ds.current_A.count()),
+                msg='ds_results_global does not have just the current chunk')
+            self.assertTrue(ds.current_A.equals(ds_loaded[0].current_A),
+                msg='load_results_global() is missing results written to the sink')
+            self.assertTrue(ds.equals(test.ds_results.drop_vars('timestamp')),
+                msg='Results with checkpoints are not equal to normal results')
+        finally:
+            # Clean up
+            shutil.rmtree(checkpoint_path,ignore_errors=True)
+
+
 
 
 
@@ -233,11 +934,29 @@ if __name__ == '__main__':
         # suite.addTest(TestExampleSequence('test_dummy'))
         # suite.addTest(TestExampleSequence('test_got_conditions_and_meas'))
         # suite.addTest(TestExampleSequence('test_conditions_table'))
+        # suite.addTest(TestExampleSequence('test_conditions_table_rows'))
+        # suite.addTest(TestExampleSequence('test_supplied_conditions'))
+        # suite.addTest(TestExampleSequence('test_condition_ordering'))
         suite.addTest(TestExampleSequence('test_running_default_conditions'))
         # suite.addTest(TestExampleSequence('test_stacking_multiple_runs'))
         # suite.addTest(TestExampleSequence('test_save_results'))
+        # suite.addTest(TestExampleSequence('test_save_excel_split_sheets'))
         # suite.addTest(TestExampleSequence('test_save_and_load_results'))
+        # suite.addTest(TestExampleSequence('test_save_and_load_compact_json'))
+        # suite.addTest(TestExampleSequence('test_save_and_load_netcdf'))
+        # suite.addTest(TestExampleSequence('test_save_and_load_compressed'))
+        # suite.addTest(TestExampleSequence('test_save_and_load_npy_dir'))
+        # suite.addTest(TestExampleSequence('test_export_parquet'))
+        # suite.addTest(TestExampleSequence('test_load_by_class_type'))
         # suite.addTest(TestExampleSequence('test_custom_config'))
+        # suite.addTest(TestExampleSequence('test_preallocated_results'))
+        # suite.addTest(TestExampleSequence('test_results_cache'))
+        # suite.addTest(TestExampleSequence('test_first_last_time_indexes'))
+        # suite.addTest(TestExampleSequence('test_stream_running_order'))
+        # suite.addTest(TestExampleSequence('test_running_order_cache'))
+        # suite.addTest(TestExampleSequence('test_results_sink'))
+        # suite.addTest(TestExampleSequence('test_checkpoint_resume'))
+        # suite.addTest(TestExampleSequence('test_checkpoint_global_results'))
         
         
         runner = unittest.TextTestRunner()
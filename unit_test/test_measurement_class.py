@@ -76,6 +76,16 @@ class Meas1(AbstractMeasurement):
 
 
  
+class DirectEditMeas(Meas1):
+    name = 'DirectEditMeas'
+
+    def meas_sequence(self,tag=0):
+        super().meas_sequence(tag)
+
+        # Add a variable by assigning to ds_results directly
+        self.ds_results['data_sum'] = self.ds_results['data_var1_1'] + self.ds_results['data_var1_2']
+
+
 #================================================================
 #%% Tests
 #================================================================
@@ -206,6 +216,143 @@ class TestMeasurement(unittest.TestCase):
         print('Done')
 
 
+    def test_store_data_vars(self):
+        """
+        Store several data variables in one call and compare against
+        storing them one at a time
+        """
+        cond1 = dict(temperature_degC=25,humidity_pc=45)
+
+        meas = Meas1({})
+        ok = meas.run(conditions=cond1)
+        self.assertTrue(ok,msg=f'Measurement [{meas.name}] failed to run')
+
+        meas_batch = Meas1({})
+        meas_batch.set_conditions(cond1)
+        meas_batch.current_conditions = cond1
+        ds = meas.ds_results
+        meas_batch.store_coords('sweep_var1',ds.sweep_var1.values)
+        meas_batch.store_coords('sweep_var2',ds.sweep_var2.values)
+        meas_batch.store_data_vars({n:ds[n].sel(cond1).values for n in ['data_var1_1','data_var1_2']},
+                                   coords=['sweep_var1'])
+        meas_batch.store_data_vars({n:ds[n].sel(cond1).values for n in ['data_var2_1','data_var2_2']},
+                                   coords=['sweep_var2'])
+        meas_batch.store_data_vars({'Light_level':12})
+
+        self.assertTrue(meas.ds_results.equals(meas_batch.ds_results),
+            msg='Batch stored data is not equal to individually stored data')
+
+        # Data with the wrong shape should stop the whole batch being stored
+        with self.assertRaises(ValueError):
+            meas_batch.store_data_vars({'new_var':[1,2,3],'bad_var':[1,2]},coords=['sweep_var1'])
+
+        self.assertFalse('bad_var' in meas_batch.ds_results,
+            msg='Data variable with the wrong shape was stored')
+
+
+    def test_columnar_results(self):
+        """
+        Run the same conditions with and without columnar results and
+        compare the datasets
+        """
+
+        # Define conditions
+        cond1 = dict(temperature_degC=25,humidity_pc=45)
+        cond2 = dict(temperature_degC=45,humidity_pc=32)
+
+        results = []
+        for columnar in [False,True]:
+            meas = Meas1({})
+            meas.columnar_results = columnar
+
+            # Repeat condition 1 to check data is overwritten
+            for tag,cond in enumerate([cond1,cond2,cond1]):
+                ok = meas.run(conditions=cond,tag=tag)
+                self.assertTrue(ok,msg=f'Measurement [{meas.name}] failed to run')
+
+            results.append(meas.ds_results)
+
+        self.assertTrue(results[0].equals(results[1]),
+            msg='Columnar results are not equal to Dataset results')
+
+        # Check data is still for the last conditions
+        self.assertTrue(meas.current_results.equals(results[0].sel(cond1)),
+            msg='Columnar current results are not equal to Dataset results')
+
+
+    def test_columnar_results_direct_changes(self):
+        """
+        Changes made directly to ds_results with columnar results are
+        kept, not lost
+        """
+        cond1 = dict(temperature_degC=25,humidity_pc=45)
+        cond2 = dict(temperature_degC=45,humidity_pc=32)
+
+        # Writing values in place switches to Dataset results
+        for write in [lambda ds: ds['data_var1_1'].loc[dict(sweep_var1=1)].__setitem__(Ellipsis,0),
+                      lambda ds: ds['data_var1_1'].values.__setitem__(0,0)]:
+            meas = Meas1({})
+            meas.columnar_results = True
+            meas.run(conditions=cond1)
+            write(meas.ds_results)
+            meas.run(conditions=cond2)
+
+            self.assertIsNone(meas._results_store,msg='Columnar results not switched to Dataset results')
+            self.assertEqual(float(meas.ds_results['data_var1_1'].sel(cond1).isel(sweep_var1=0)),0,
+                msg='Value written in place was lost')
+            self.assertTrue(meas.ds_results['data_var1_1'].sel(cond2).notnull().all(),
+                msg='Results stored after the change are missing')
+
+        # Adding variables switches to Dataset results
+        results = []
+        for columnar in [False,True]:
+            meas = DirectEditMeas({})
+            meas.columnar_results = columnar
+            for tag,cond in enumerate([cond1,cond2]):
+                ok = meas.run(conditions=cond,tag=tag)
+                self.assertTrue(ok,msg=f'Measurement [{meas.name}] failed to run')
+
+            results.append(meas.ds_results)
+
+        self.assertIn('data_sum',results[1],msg='Variable added to ds_results was lost')
+        self.assertTrue(results[0].equals(results[1]),
+            msg='Columnar results with direct changes are not equal to Dataset results')
+
+
+    def test_store_float_conditions(self):
+        """
+        Store data at float condition values, including transposed and
+        single element data, and read it back by label
+        """
+
+        meas = Meas1({})
+        conditions = [dict(temperature_degC=t,humidity_pc=h) for t in [0.1,0.2,20.5] for h in [45,32.5]]
+        for cond in conditions:
+            ok = meas.run(conditions=cond)
+            self.assertTrue(ok,msg=f'Measurement [{meas.name}] failed to run')
+
+        meas.store_coords('sweep_var3',[1,2])
+
+        for cond in conditions:
+            meas.current_conditions = cond
+            data = np.array([[1,2,3],[4,5,6]])*cond['temperature_degC']
+            # transposed relative to (..., sweep_var1, sweep_var3)
+            meas.store_data_var('data_2d',data,coords=['sweep_var1','sweep_var3'])
+            meas.store_data_var('data_single',[cond['humidity_pc']],coords={'sweep_var1':2})
+
+        ds = meas.ds_results
+        for cond in conditions:
+            data = np.array([[1,2,3],[4,5,6]])*cond['temperature_degC']
+            self.assertTrue(np.array_equal(ds.data_2d.sel(cond).transpose('sweep_var3','sweep_var1').values,data),
+                msg=f'Transposed data stored at wrong position for {cond}')
+            self.assertEqual(float(ds.data_single.sel(cond).sel(sweep_var1=2)),cond['humidity_pc'],
+                msg=f'Single value stored at wrong position for {cond}')
+
+        # Only one position in each condition should be filled
+        self.assertEqual(int(ds.data_single.notnull().sum()),len(conditions),
+            msg='Single values stored at too many positions')
+
+
 
 
 
@@ -227,6 +374,10 @@ if __name__ == '__main__':
         suite.addTest(TestMeasurement('test_no_conditions'))
         suite.addTest(TestMeasurement('test_single_conditions'))
         suite.addTest(TestMeasurement('test_multiple_conditions'))
+        suite.addTest(TestMeasurement('test_store_data_vars'))
+        suite.addTest(TestMeasurement('test_columnar_results'))
+        suite.addTest(TestMeasurement('test_columnar_results_direct_changes'))
+        suite.addTest(TestMeasurement('test_store_float_conditions'))
         
         
         runner = unittest.TextTestRunner()
@@ -0,0 +1,774 @@
+'''
+Testing the Test Manager class
+================================================================
+Unit tests to verify the run options of classes derived from
+AbstractTestManager
+
+'''
+
+
+#================================================================
+#%% Imports
+#================================================================
+# Standard library
+import os, time, sys
+import tempfile
+import threading
+import asyncio
+import unittest
+
+# Third party libraries
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+basepath = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(basepath)
+print(basepath)
+
+# Local libraries
+from tmpl import (AbstractTestManager,AbstractMeasurement,AbstractSetupConditions,
+                  AbstractAsyncMeasurement,AbstractAsyncSetupConditions,
+                  MultiDutRunner,ShardedRunner,combine_partial_datasets)
+
+#================================================================
+#%% Constants
+#================================================================
+MEAS_TIME_S = 0.2
+
+#================================================================
+#%% Functions
+#================================================================
+def make_resources(settings):
+    """
+    Resource factory for MultiDutRunner
+    Each unit's instruments return values scaled by its gain
+    """
+    log = []
+    power_meter = Instrument('power_meter',log)
+    ammeter = Instrument('ammeter',log)
+    power_meter.gain = ammeter.gain = settings['gain']
+    return {'power_meter':power_meter,'ammeter':ammeter}
+
+
+def overlapped(log,first,second):
+    """
+    Check if two uses of instruments overlapped, from the order of the
+    start and stop events in an instrument log. This does not depend on
+    how long the test took, which varies with the load on the computer.
+
+    Parameters
+    ----------
+    log : list of tuple
+        (name, event, value) events in the order they happened
+    first, second : tuple
+        (name, value) of each use
+
+    Returns
+    -------
+    bool
+        True if each use started before the other one stopped
+    """
+    index = {event:i for i,event in enumerate(log)}
+    return (index[(first[0],'start',first[1])]<index[(second[0],'stop',second[1])]
+            and index[(second[0],'start',second[1])]<index[(first[0],'stop',first[1])])
+
+#================================================================
+#%% Classes
+#================================================================
+class Instrument():
+    """
+    Dummy instrument that records when it is used
+    """
+    def __init__(self,name,log) -> None:
+        self.name = name
+        self.log = log
+        self.busy = False
+        self.gain = 1
+
+    def measure(self,value):
+        assert not self.busy, f'Instrument [{self.name}] is already in use'
+        self.busy = True
+        self.log.append((self.name,'start',value))
+        time.sleep(MEAS_TIME_S)
+        self.log.append((self.name,'stop',value))
+        self.busy = False
+        return value*self.gain
+
+
+class Temperature(AbstractSetupConditions):
+    name = 'temperature_degC'
+
+    def initialise(self):
+        self.values = [25,35]
+        self._setpoint = None
+
+    @property
+    def actual(self):
+        return self._setpoint
+
+    @property
+    def setpoint(self):
+        return self._setpoint
+
+    @setpoint.setter
+    def setpoint(self,value):
+        self._setpoint = value
+
+
+class OpticalPower(AbstractMeasurement):
+    uses_resources = ['power_meter']
+
+    def meas_sequence(self):
+        power = self.power_meter.measure(self.current_conditions['temperature_degC']/10)
+        self.store_data_var('power_mW',[power])
+
+
+class Current(AbstractMeasurement):
+    uses_resources = ['ammeter']
+
+    def meas_sequence(self):
+        current = self.ammeter.measure(self.current_conditions['temperature_degC']/100)
+        self.store_data_var('current_A',[current])
+
+
+class Voltage(AbstractMeasurement):
+    uses_resources = ['ammeter']
+
+    def meas_sequence(self):
+        voltage = self.ammeter.measure(self.current_conditions['temperature_degC']/1000)
+        self.store_data_var('voltage_V',[voltage])
+
+
+class Model():
+    """
+    Dummy model used as an offline resource
+    """
+    def __init__(self) -> None:
+        self.temperature_degC = 25
+        self.voltage_V = 0
+
+    def current_A(self):
+        return self.voltage_V/(100 + self.temperature_degC)
+
+
+class ModelTemperature(AbstractSetupConditions):
+    name = 'temperature_degC'
+
+    def initialise(self):
+        self.values = [25,35,45,55]
+
+    @property
+    def actual(self):
+        return self.model.temperature_degC
+
+    @property
+    def setpoint(self):
+        return self.model.temperature_degC
+
+    @setpoint.setter
+    def setpoint(self,value):
+        self.model.temperature_degC = value
+
+
+class ModelCurrent(AbstractMeasurement):
+
+    def initialise(self):
+        self.config.voltages_V = [1,2,3]
+
+    def meas_sequence(self):
+        currents = []
+        for voltage in self.config.voltages_V:
+            self.model.voltage_V = voltage
+            currents.append(self.model.current_A())
+        self.store_coords('voltage_V',self.config.voltages_V)
+        self.store_data_var('current_A',currents,coords=['voltage_V'])
+
+
+class RampingTemperature(AbstractSetupConditions):
+    """
+    Temperature that ramps to a new setpoint at RAMP_RATE_DEGC_S
+    """
+    name = 'temperature_degC'
+    RAMP_RATE_DEGC_S = 50
+    settle_tolerance = 0.5
+    settle_poll_min_s = 0.01
+    settle_poll_max_s = 0.05
+    settle_timeout_s = 5
+
+    def initialise(self):
+        self.values = [25,35]
+        self._setpoint = None
+        self._ramp = (time.monotonic(),25)
+
+    @property
+    def actual(self):
+        t_start,start_value = self._ramp
+        if self._setpoint is None:
+            return start_value
+        ramp = self.RAMP_RATE_DEGC_S*(time.monotonic()-t_start)
+        if self._setpoint>start_value:
+            return min(start_value+ramp,self._setpoint)
+        return max(start_value-ramp,self._setpoint)
+
+    @property
+    def setpoint(self):
+        return self._setpoint
+
+    @setpoint.setter
+    def setpoint(self,value):
+        self.start_setpoint(value)
+        self.wait_settled(value)
+
+    def start_setpoint(self,value):
+        self._ramp = (time.monotonic(),25 if self._setpoint is None else self.actual)
+        self._setpoint = value
+        self.log_events.append(('start_setpoint',value))
+
+    def wait_settled(self,value):
+        super().wait_settled(value)
+        self.log_events.append(('settled',value))
+
+
+class ProcessedCurrent(AbstractMeasurement):
+    """
+    Measurement with slow processing
+    """
+    def meas_sequence(self):
+        self.log_events.append(('sequence',self.current_conditions['temperature_degC']))
+        self.store_data_var('current_A',[self.current_conditions['temperature_degC']/100])
+
+    def process(self):
+        time.sleep(MEAS_TIME_S)
+        self.log_events.append(('process',self.current_conditions['temperature_degC']))
+        self.store_data_var('resistance_ohms',[1/self.current_results.current_A.values])
+
+
+class SlowProcessedCurrent(ProcessedCurrent):
+    """
+    Measurement with slow acquisition and processing
+    """
+    name = 'ProcessedCurrent'
+
+    def meas_sequence(self):
+        super().meas_sequence()
+        time.sleep(MEAS_TIME_S)
+        self.log_events.append(('sequence_done',self.current_conditions['temperature_degC']))
+
+    def process(self):
+        self.log_events.append(('process_start',self.current_conditions['temperature_degC']))
+        super().process()
+
+
+class FailingProcess(AbstractMeasurement):
+
+    def meas_sequence(self):
+        pass
+
+    def process(self):
+        if self.current_conditions['temperature_degC']==35:
+            raise ValueError('Processing failed')
+
+
+class SaveData(AbstractMeasurement):
+    """
+    After stage measurement that doesn't depend on the conditions
+    """
+    runs_while_settling = True
+
+    def initialise(self):
+        self.run_after('temperature_degC',self.COND_LAST_TIME)
+
+    def meas_sequence(self):
+        time.sleep(MEAS_TIME_S)
+        self.log_events.append(('save',self.current_conditions['temperature_degC']))
+
+
+class AsyncInstrument(Instrument):
+    """
+    Dummy instrument with async I/O
+    """
+    async def measure_async(self,value):
+        assert not self.busy, f'Instrument [{self.name}] is already in use'
+        self.busy = True
+        self.log.append((self.name,'start',value))
+        await asyncio.sleep(MEAS_TIME_S)
+        self.log.append((self.name,'stop',value))
+        self.busy = False
+        return value
+
+
+class AsyncTemperature(AbstractAsyncSetupConditions):
+    name = 'temperature_degC'
+
+    def initialise(self):
+        self.values = [25,35]
+
+    @property
+    def actual(self):
+        return self.setpoint
+
+    async def write_setpoint(self,value):
+        # Settling time
+        await asyncio.sleep(MEAS_TIME_S/10)
+
+
+class AsyncOpticalPower(AbstractAsyncMeasurement):
+    name = 'OpticalPower'
+    uses_resources = ['power_meter']
+
+    async def meas_sequence(self):
+        power = await self.power_meter.measure_async(self.current_conditions['temperature_degC']/10)
+        self.store_data_var('power_mW',[power])
+
+
+class AsyncCurrent(AbstractAsyncMeasurement):
+    name = 'Current'
+    uses_resources = ['ammeter']
+
+    async def meas_sequence(self):
+        current = await self.ammeter.measure_async(self.current_conditions['temperature_degC']/100)
+        self.store_data_var('current_A',[current])
+
+
+class ConcurrentTest(AbstractTestManager):
+
+    def define_setup_conditions(self):
+        self.add_setup_condition(Temperature)
+
+    def define_measurements(self):
+        self.add_measurement(OpticalPower)
+        self.add_measurement(Current)
+        self.add_measurement(Voltage)
+
+
+class ModelTest(AbstractTestManager):
+
+    def define_setup_conditions(self):
+        self.add_setup_condition(ModelTemperature)
+
+    def define_measurements(self):
+        self.add_measurement(ModelCurrent)
+
+
+class SettlingTest(AbstractTestManager):
+
+    def define_setup_conditions(self):
+        self.add_setup_condition(RampingTemperature)
+
+    def define_measurements(self):
+        self.add_measurement(ProcessedCurrent)
+        self.add_measurement(SaveData)
+
+
+class PipelineTest(AbstractTestManager):
+
+    def define_setup_conditions(self):
+        self.add_setup_condition(Temperature)
+
+    def define_measurements(self):
+        self.add_measurement(SlowProcessedCurrent)
+
+
+class AsyncTest(AbstractTestManager):
+
+    def define_setup_conditions(self):
+        self.add_setup_condition(AsyncTemperature)
+
+    def define_measurements(self):
+        self.add_measurement(AsyncOpticalPower)
+        self.add_measurement(AsyncCurrent)
+        self.add_measurement(Voltage)
+
+
+#================================================================
+#%% Tests
+#================================================================
+class TestTestManager(unittest.TestCase):
+
+    def setUp(self):
+        self.instrument_log = []
+        self.resources = {
+            'power_meter':Instrument('power_meter',self.instrument_log),
+            'ammeter':Instrument('ammeter',self.instrument_log),
+            }
+
+
+    def tearDown(self):
+        pass
+
+    def test_dummy(self):
+        self.assertTrue(True)
+
+
+    def test_concurrent_measurements(self):
+        """
+        Run measurements that use different instruments concurrently and
+        compare results to a normal run
+        """
+        test = ConcurrentTest(self.resources)
+        test.run()
+        self.assertTrue(test.last_error=='',msg='Test run failed')
+
+        del self.instrument_log[:]
+
+        test_conc = ConcurrentTest(self.resources,concurrent_measurements=True)
+        test_conc.run()
+
+        self.assertTrue(test_conc.last_error=='',msg='Concurrent test run failed')
+
+        self.assertTrue(test.ds_results.drop_vars('timestamp').equals(test_conc.ds_results.drop_vars('timestamp')),
+            msg='Concurrent results are not equal to normal results')
+
+        # OpticalPower and Current overlap, Voltage waits for the ammeter
+        for T in test_conc.conditions.temperature_degC.values:
+            self.assertTrue(overlapped(self.instrument_log,('power_meter',T/10),('ammeter',T/100)),
+                msg=f'Concurrent measurements did not overlap at {T} degC')
+
+        # Current is always measured before Voltage
+        ammeter_values = [value for name,event,value in self.instrument_log if name=='ammeter' and event=='start']
+        expected = [v for T in test_conc.conditions.temperature_degC.values for v in [T/100,T/1000]]
+        self.assertEqual(ammeter_values,expected,msg='Ammeter measurements are in the wrong order')
+
+
+    def test_exclusive_measurements(self):
+        """
+        Measurements that do not declare their resources run on their own
+        """
+        test = ConcurrentTest(self.resources,concurrent_measurements=True)
+        test.meas.OpticalPower.uses_resources = None
+
+        test.make_running_order()
+        steps = [line for line in test._running_order if line.operation=='MEASUREMENT' and line.row==0]
+
+        order = []
+        test.meas.OpticalPower.run = lambda conditions: order.append('OpticalPower') or True
+        test.meas.Current.run = lambda conditions: order.append('Current') or True
+        test.meas.Voltage.run = lambda conditions: order.append('Voltage') or True
+
+        test.run_meas_steps(steps)
+
+        self.assertEqual(order,['OpticalPower','Current','Voltage'],
+            msg='Measurements did not run in running order')
+
+
+    def test_async_measurements(self):
+        """
+        Run async setup conditions and measurements mixed with normal
+        measurements and compare to a normal run
+        """
+        test = ConcurrentTest(self.resources)
+        test.run()
+        self.assertTrue(test.last_error=='',msg='Test run failed')
+
+        resources = {
+            'power_meter':AsyncInstrument('power_meter',self.instrument_log),
+            'ammeter':AsyncInstrument('ammeter',self.instrument_log),
+            }
+
+        # Sequential
+        test_async = AsyncTest(resources)
+        test_async.run()
+        self.assertTrue(test_async.last_error=='',msg='Async test run failed')
+        self.assertTrue(test.ds_results.drop_vars('timestamp').equals(test_async.ds_results.drop_vars('timestamp')),
+            msg='Async results are not equal to normal results')
+
+        # Concurrent
+        del self.instrument_log[:]
+        test_async = AsyncTest(resources,concurrent_measurements=True)
+        asyncio.run(test_async.run_async())
+
+        self.assertTrue(test_async.last_error=='',msg='Concurrent async test run failed')
+        self.assertTrue(test.ds_results.drop_vars('timestamp').equals(test_async.ds_results.drop_vars('timestamp')),
+            msg='Concurrent async results are not equal to normal results')
+
+        for T in test_async.conditions.temperature_degC.values:
+            self.assertTrue(overlapped(self.instrument_log,('power_meter',T/10),('ammeter',T/100)),
+                msg=f'Async measurements did not overlap at {T} degC')
+
+        # Async measurement on its own
+        meas = test_async.meas.Current
+        ok = meas.run(conditions={'temperature_degC':45})
+        self.assertTrue(ok,msg='Async measurement failed to run on its own')
+        self.assertEqual(float(meas.ds_results.current_A.sel(temperature_degC=45)),0.45,
+            msg='Async measurement stored wrong value')
+
+        # Async subclasses are identified by their templates
+        self.assertTrue(meas.is_measurement_class,msg='Async measurement not identified')
+        self.assertFalse(meas.is_setup_conditions_class,msg='Async measurement identified as setup conditions')
+        cond = test_async.conditions.temperature_degC
+        self.assertTrue(cond.is_setup_conditions_class,msg='Async setup conditions not identified')
+        self.assertFalse(cond.is_measurement_class,msg='Async setup conditions identified as measurement')
+
+
+    def test_results_cache_in_place(self):
+        """
+        Values written in place in a measurement are merged after 
+        update_results(), when the measurements have different coordinates
+        """
+        test = ConcurrentTest(self.resources)
+        test.run()
+
+        # Only OpticalPower has results at 45 degC, so merging reindexes
+        test.meas.OpticalPower.run(conditions={'temperature_degC':45})
+        test.get_results()
+        meas = test.meas.Current
+        values = test.ds_results.current_A.values.copy()
+
+        # In place changes are not shared with the merged results
+        meas.ds_results['current_A'].values[0] = -1
+        test.get_results()
+        self.assertTrue(np.array_equal(test.ds_results.current_A.values,values,equal_nan=True),
+            msg='Merged results share data with the measurement')
+
+        meas.update_results()
+        test.get_results()
+        values[0] = -1
+        self.assertTrue(np.array_equal(test.ds_results.current_A.values,values,equal_nan=True),
+            msg='Value written in place not merged after update_results()')
+        self.assertTrue(test.ds_results.power_mW.sel(temperature_degC=45).notnull(),
+            msg='Results of other measurement lost')
+
+
+    def test_async_checkpoint_resume(self):
+        """
+        Crash part way through an async run and resume from the checkpoint
+        """
+        resources = {
+            'power_meter':AsyncInstrument('power_meter',self.instrument_log),
+            'ammeter':AsyncInstrument('ammeter',self.instrument_log),
+            }
+
+        test = AsyncTest(resources)
+        test.run()
+        ds = test.ds_results.drop_vars('timestamp')
+
+        with tempfile.TemporaryDirectory() as checkpoint_path:
+            # Crash at the last temperature
+            test_crash = AsyncTest(resources,checkpoint_path=checkpoint_path)
+            meas = test_crash.meas.Current
+            meas_sequence = meas.meas_sequence
+            async def crash():
+                if meas.current_conditions['temperature_degC']==35:
+                    raise RuntimeError('Crash')
+                await meas_sequence()
+            meas.meas_sequence = crash
+            test_crash.run()
+            self.assertTrue(test_crash.last_error!='',msg='Async test did not crash')
+
+            state = test_crash.read_checkpoint()
+            self.assertFalse(state['finished'],msg='Crashed run is marked as finished')
+            self.assertEqual(state['chunks'],1,msg='Checkpoint not saved after first row was written to sink')
+
+            # Resume in a new test manager
+            test_resume = AsyncTest(resources,checkpoint_path=checkpoint_path)
+            temperatures = []
+            meas = test_resume.meas.Current
+            meas_sequence_resume = meas.meas_sequence
+            async def log_temperature():
+                temperatures.append(meas.current_conditions['temperature_degC'])
+                await meas_sequence_resume()
+            meas.meas_sequence = log_temperature
+
+            test_resume.resume()
+            self.assertTrue(test_resume.last_error=='',msg='Resumed async run failed')
+            self.assertEqual(temperatures,[35],msg='Resumed async run did not start from checkpoint')
+            self.assertTrue(test_resume.read_checkpoint()['finished'],msg='Resumed run not marked as finished')
+            self.assertTrue(ds.equals(test_resume.ds_results.drop_vars('timestamp')),
+                msg='Resumed async results are not equal to normal results')
+
+
+    def test_multi_dut_runner(self):
+        """
+        Run several units in worker processes and check results are
+        merged along the dut dimension
+        """
+        gains = [1,2,3]
+        runner = MultiDutRunner(ConcurrentTest,[{'gain':g} for g in gains],
+                                resource_factory=make_resources,
+                                dut_labels=['SN1','SN2','SN3'])
+        ds = runner.run()
+
+        self.assertEqual(runner.errors,{},msg='Units failed to run')
+        self.assertEqual(list(ds.dut.values),['SN1','SN2','SN3'],msg='dut coordinate is wrong')
+
+        # Timestamps can be different for each unit, they should not pad
+        # out the data with NaNs
+        self.assertEqual(ds.sizes.get('timestamp',1),1,msg='timestamp dimension is padded')
+        self.assertFalse(bool(ds.current_A.isnull().any()),msg='Results are padded with NaNs')
+
+        for dut,gain in zip(ds.dut.values,gains):
+            self.assertTrue(np.allclose(ds.current_A.sel(dut=dut).values,
+                                        gain*ds.temperature_degC.values/100),
+                msg=f'Results for dut [{dut}] are wrong')
+
+
+    def test_sharded_runner(self):
+        """
+        Split the conditions table into shards run in worker processes and
+        check the combined results match a normal run
+        """
+        resources = {'model':Model()}
+        test = ModelTest(resources,offline_mode=True)
+        test.run()
+        self.assertTrue(test.last_error=='',msg='Test run failed')
+
+        # Running part of the table only runs startup/teardown at the ends
+        test_part = ModelTest(resources,offline_mode=True)
+        test_part.make_running_order(rows=(1,3))
+        rows = set([line.row for line in test_part._running_order])
+        self.assertEqual(rows,{1,2},msg='Wrong rows in partial running order')
+
+        runner = ShardedRunner(ModelTest,resources,n_shards=3,
+                               manager_kwargs={'offline_mode':True},max_workers=2)
+        ds = runner.run()
+
+        self.assertEqual(runner.errors,{},msg='Shards failed to run')
+        self.assertEqual(runner.shards,[(0,1),(1,3),(3,4)],msg='Wrong shards')
+        self.assertTrue(test.ds_results.drop_vars('timestamp').equals(ds.drop_vars('timestamp')),
+            msg='Sharded results are not equal to normal results')
+        self.assertEqual(ds.sizes.get('timestamp',1),1,msg='timestamp dimension is padded')
+
+
+    def test_combine_partial_dtypes(self):
+        """
+        Combining partial results keeps values that need a wider dtype 
+        than the first Dataset has
+        """
+        ds1 = xr.Dataset({'status':('row',np.array(['ok'])),'value':('row',np.array([1]))},
+                         coords={'row':[0]})
+        ds2 = xr.Dataset({'status':('row',np.array(['failed'])),'value':('row',np.array([2.5]))},
+                         coords={'row':[1]})
+
+        ds = combine_partial_datasets([ds1,ds2])
+        self.assertEqual(list(ds['status'].values),['ok','failed'],msg='String truncated')
+        self.assertEqual(list(ds['value'].values),[1,2.5],msg='Float cast to int')
+        self.assertEqual(ds['value'].dtype.kind,'f')
+
+        # Mixed kinds become object
+        ds3 = xr.Dataset({'status':('row',np.array([3]))},coords={'row':[2]})
+        ds = combine_partial_datasets([ds1,ds3])
+        self.assertEqual(list(ds['status'].values),['ok',3])
+
+
+    def test_overlap_settling(self):
+        """
+        Process the previous conditions and run After stage measurements
+        while the next setpoint settles
+        """
+        resources = {'log_events':[]}
+        test = SettlingTest(resources)
+        test.run()
+        self.assertTrue(test.last_error=='',msg='Test run failed')
+
+        del resources['log_events'][:]
+        test_overlap = SettlingTest(resources,overlap_settling=True)
+        test_overlap.run()
+        self.assertTrue(test_overlap.last_error=='',msg='Overlapped test run failed')
+
+        self.assertTrue(test.ds_results.drop_vars('timestamp').equals(test_overlap.ds_results.drop_vars('timestamp')),
+            msg='Overlapped results are not equal to normal results')
+
+        # Processing and saving of 25 degC happen after 35 degC is started
+        # and before it has settled
+        events = resources['log_events']
+        expected = [('start_setpoint',25),('settled',25),('sequence',25),
+                    ('start_setpoint',35),('save',25),('process',25),('settled',35),
+                    ('sequence',35),('save',35),('process',35)]
+        self.assertEqual(events,expected,msg='Events are in the wrong order')
+
+        # Settling times out
+        cond = test_overlap.conditions.temperature_degC
+        cond.RAMP_RATE_DEGC_S = 0.1
+        cond.settle_timeout_s = 0.1
+        cond.start_setpoint(45)
+        with self.assertRaises(TimeoutError):
+            cond.wait_settled(45)
+
+        # Not supported by async runs
+        test_async = AsyncTest({},overlap_settling=True)
+        with self.assertRaises(ValueError):
+            asyncio.run(test_async.run_async())
+
+
+    def test_pipeline_processing(self):
+        """
+        Run process() on a background thread while the next conditions
+        are measured
+        """
+        resources = {'log_events':[]}
+        test = PipelineTest(resources)
+        test.run()
+        self.assertTrue(test.last_error=='',msg='Test run failed')
+
+        del resources['log_events'][:]
+        test_pipe = PipelineTest(resources,pipeline_processing=True)
+        test_pipe.run()
+        self.assertTrue(test_pipe.last_error=='',msg='Pipelined test run failed')
+
+        # process() sees the conditions its sequence ran at
+        self.assertTrue(test.ds_results.drop_vars('timestamp').equals(test_pipe.ds_results.drop_vars('timestamp')),
+            msg='Pipelined results are not equal to normal results')
+
+        # 35 degC is measured while 25 degC is processed
+        events = resources['log_events']
+        self.assertLess(events.index(('process_start',25)),events.index(('sequence_done',35)),
+            msg='Sequence did not overlap processing')
+        self.assertLess(events.index(('sequence',35)),events.index(('process',25)),
+            msg='Sequence did not overlap processing')
+        self.assertEqual([e for e in events if e[0]=='process'],[('process',25),('process',35)],
+            msg='Processing is in the wrong order')
+
+        # Processing errors are reported
+        test_pipe.add_measurement(FailingProcess)
+        test_pipe.run()
+        self.assertIn('Processing failed',test_pipe.meas.FailingProcess.last_error,
+            msg='Processing error not in measurement last_error')
+        self.assertIn('FailingProcess',test_pipe.last_error,msg='Processing error not reported by test manager')
+        self.assertIsNone(test_pipe._process_executor,msg='Pipeline thread not stopped')
+
+        # The error is passed back from the pipeline thread, so it isn't 
+        # lost when the sequence runs again and resets last_error
+        meas = test_pipe.meas.FailingProcess
+        meas.last_error = ''
+        label,conditions,ok,last_error = test_pipe._run_meas_process(meas.name,{'temperature_degC':35})
+        self.assertFalse(ok,msg='Processing failure not returned')
+        self.assertIn('Processing failed',last_error,msg='Processing error not returned')
+        self.assertEqual(meas.last_error,'',msg='Processing on pipeline thread changed last_error')
+
+        # Not supported by async runs
+        test_async = AsyncTest({},pipeline_processing=True)
+        with self.assertRaises(ValueError):
+            asyncio.run(test_async.run_async())
+
+
+
+#================================================================
+#%% Runner
+#================================================================
+
+if __name__ == '__main__':
+    # all_tests = True
+    all_tests = False
+
+    if all_tests:
+        unittest.main()
+        print('Run')
+    else:
+        suite = unittest.TestSuite()
+
+        # suite.addTest(TestTestManager('test_dummy'))
+        suite.addTest(TestTestManager('test_concurrent_measurements'))
+        # suite.addTest(TestTestManager('test_exclusive_measurements'))
+        # suite.addTest(TestTestManager('test_async_measurements'))
+        # suite.addTest(TestTestManager('test_results_cache_in_place'))
+        # suite.addTest(TestTestManager('test_async_checkpoint_resume'))
+        # suite.addTest(TestTestManager('test_multi_dut_runner'))
+        # suite.addTest(TestTestManager('test_sharded_runner'))
+        # suite.addTest(TestTestManager('test_combine_partial_dtypes'))
+        # suite.addTest(TestTestManager('test_overlap_settling'))
+        # suite.addTest(TestTestManager('test_pipeline_processing'))
+
+
+        runner = unittest.TextTestRunner()
+        runner.run(suite)